@@ -1,34 +1,54 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore, auth, storage
+import threading
 from dotenv import load_dotenv
-import pyrebase
 
 # Load environment variables
 load_dotenv()
 
 class FirebaseConfig:
+    """
+    Firebase Admin SDK and Pyrebase clients, created on first use.
+
+    Importing this module is cheap: firebase_admin and pyrebase are only
+    imported, and the apps initialised, when a caller first needs Firestore,
+    Storage or Auth, so web workers that never touch Firebase don't pay for it.
+    """
+
     def __init__(self):
         self.app = None
         self.db = None
         self.bucket = None
         self.pyrebase_app = None
-        self.initialize_firebase()
+        self._initialized = False
+        self._lock = threading.Lock()
+    
+    def ensure_initialized(self):
+        """Initialize Firebase once, on first use"""
+        if self._initialized:
+            return
+        with self._lock:
+            if not self._initialized:
+                self.initialize_firebase()
+                self._initialized = True
     
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK and Pyrebase"""
         try:
+            import firebase_admin
+            from firebase_admin import credentials, firestore, storage
+            import pyrebase
+            
             # Firebase Admin SDK configuration
             if not firebase_admin._apps:
                 firebase_config = {
-                    "type": "service_account",
+                    "type": os.getenv('FIREBASE_TYPE', 'service_account'),
                     "project_id": os.getenv('FIREBASE_PROJECT_ID'),
                     "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
                     "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
                     "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
                     "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-                    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                    "token_uri": "https://oauth2.googleapis.com/token",
+                    "auth_uri": os.getenv('FIREBASE_AUTH_URI', "https://accounts.google.com/o/oauth2/auth"),
+                    "token_uri": os.getenv('FIREBASE_TOKEN_URI', "https://oauth2.googleapis.com/token"),
                     "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
                     "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
                 }
@@ -66,14 +86,17 @@ class FirebaseConfig:
     
     def get_db(self):
         """Get Firestore database instance"""
+        self.ensure_initialized()
         return self.db
     
     def get_storage(self):
         """Get Firebase Storage bucket"""
+        self.ensure_initialized()
         return self.bucket
     
     def get_pyrebase_auth(self):
         """Get Pyrebase auth instance for client operations"""
+        self.ensure_initialized()
         if self.pyrebase_app:
             return self.pyrebase_app.auth()
         return None
@@ -81,6 +104,8 @@ class FirebaseConfig:
     def create_user(self, email, password, display_name=None):
         """Create a new user in Firebase Auth"""
         try:
+            self.ensure_initialized()
+            from firebase_admin import auth
             user = auth.create_user(
                 email=email,
                 password=password,
@@ -94,6 +119,8 @@ class FirebaseConfig:
     def get_user(self, uid):
         """Get user by UID"""
         try:
+            self.ensure_initialized()
+            from firebase_admin import auth
             user = auth.get_user(uid)
             return user
         except Exception as e:
@@ -103,11 +130,13 @@ class FirebaseConfig:
     def verify_id_token(self, id_token):
         """Verify Firebase ID token"""
         try:
+            self.ensure_initialized()
+            from firebase_admin import auth
             decoded_token = auth.verify_id_token(id_token)
             return decoded_token
         except Exception as e:
             print(f"Error verifying token: {e}")
             return None
 
-# Initialize Firebase configuration
+# Shared Firebase configuration (initialised lazily)
 firebase_config = FirebaseConfig()
@@ -30,7 +30,7 @@ class DepartmentAdmin(admin.ModelAdmin):
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
-    list_display = ['name', 'department', 'price', 'duration_minutes', 'is_available']
+    list_display = ['name', 'department', 'price', 'duration_minutes', 'slot_capacity', 'is_available']
     list_filter = ['department', 'is_available']
     search_fields = ['name', 'description']
 
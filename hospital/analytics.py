@@ -0,0 +1,54 @@
+"""
+Parquet analytics tables of this app; the writer lives in
+``maes_common.analytics`` and is bound here to the tables declared below.
+"""
+from maes_common.analytics import AnalyticsTables
+
+from .models import Appointment, Payment, TestResult
+
+# table -> (model, path from the model to its appointment, [(column, field path)])
+TABLES = {
+    'appointments': (Appointment, '', [
+        ('id', 'id'),
+        ('appointment_id', 'appointment_id'),
+        ('patient_id', 'patient_id'),
+        ('service_id', 'service_id'),
+        ('service', 'service__name'),
+        ('department', 'service__department__name'),
+        ('appointment_date', 'appointment_date'),
+        ('status', 'status'),
+        ('payment_status', 'payment_status'),
+        ('priority', 'priority'),
+        ('total_amount', 'total_amount'),
+        ('discount_amount', 'discount_amount'),
+        ('final_amount', 'final_amount'),
+        ('created_at', 'created_at'),
+    ]),
+    'payments': (Payment, 'appointment__', [
+        ('id', 'id'),
+        ('receipt_number', 'receipt_number'),
+        ('appointment_id', 'appointment__appointment_id'),
+        ('amount', 'amount'),
+        ('payment_method', 'payment_method'),
+        ('payment_status', 'payment_status'),
+        ('payment_date', 'payment_date'),
+        ('is_verified', 'is_verified'),
+        ('verified_at', 'verified_at'),
+        ('created_at', 'created_at'),
+    ]),
+    'test_results': (TestResult, 'appointment__', [
+        ('id', 'id'),
+        ('appointment_id', 'appointment__appointment_id'),
+        ('service', 'appointment__service__name'),
+        ('status', 'status'),
+        ('is_normal', 'is_normal'),
+        ('released_at', 'released_at'),
+        ('created_at', 'created_at'),
+    ]),
+}
+
+tables = AnalyticsTables(TABLES)
+
+queryset = tables.queryset
+write_parquet = tables.write_parquet
+parquet_file = tables.parquet_file
@@ -0,0 +1,13 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    # Chart data series for client-side rendering
+    path('charts/<str:name>/', views.chart_data_api, name='chart_data'),
+    
+    # Precomputed patient statistics
+    path('demographics/age-groups/', views.age_groups_api, name='age_groups_api'),
+    
+    # Filtered appointments, keyset-paginated
+    path('appointments/', views.appointment_listing_api, name='appointment_listing'),
+]
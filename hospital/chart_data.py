@@ -0,0 +1,112 @@
+"""
+Data series behind the dashboard charts.
+
+Each builder returns the compact series a chart is drawn from, e.g.
+``{'periods': [...], 'labels': [...], 'counts': [...]}``. The same dicts feed the
+server-side renderer (``charts.chart_url``) and the JSON endpoint that lets
+dashboards draw the charts in the browser.
+
+Builders accept ``since``: when given, time-series charts only return the
+buckets that contain rows updated at or after that moment, and categorical
+charts return nothing unless something changed. Rows that are deleted or moved
+to another bucket are not reported as changes, so clients should reload the
+full series from time to time (the ETag makes that cheap when nothing moved).
+"""
+from django.db import models
+from django.db.models import Count, Sum, Max
+from django.db.models.functions import TruncMonth
+
+from maes_common.timeseries import time_series
+
+from .models import Appointment, Payment, Service, AgeGroupStats
+from .demographics import age_group_counts, ensure_age_groups
+
+GRANULARITY = 'month'
+
+def _changed_periods(queryset, date_field, since):
+    return set(queryset.filter(updated_at__gte=since).annotate(
+        period=TruncMonth(date_field, output_field=models.DateField())
+    ).values_list('period', flat=True).distinct())
+
+def _monthly(queryset, date_field, periods, label_format, since=None, changed=None, **aggregates):
+    series = time_series(queryset, date_field, GRANULARITY, periods=periods, **aggregates)
+    if since is not None:
+        changed_periods = _changed_periods(changed if changed is not None else queryset, date_field, since)
+        series = [item for item in series if item['period'] in changed_periods]
+    return series, {
+        'periods': [item['period'].isoformat() for item in series],
+        'labels': [item['period'].strftime(label_format) for item in series],
+    }
+
+def _unchanged(queryset, since):
+    return since is not None and not queryset.filter(updated_at__gte=since).exists()
+
+def patient_history(user, since=None):
+    """Appointments per month for one patient over the last 6 months"""
+    appointments = Appointment.objects.filter(patient=user)
+    series, data = _monthly(appointments, 'appointment_date', 6, '%Y-%m', since)
+    data['counts'] = [item['count'] for item in series]
+    return data
+
+def monthly_appointments(user=None, since=None):
+    """Clinic-wide appointments per month over the last 12 months"""
+    series, data = _monthly(Appointment.objects.all(), 'appointment_date', 12, '%b %Y', since)
+    data['counts'] = [item['count'] for item in series]
+    return data
+
+def revenue(user=None, since=None):
+    """Completed payments per month over the last 6 months"""
+    series, data = _monthly(
+        Payment.objects.filter(payment_status='completed'), 'payment_date', 6, '%b %Y', since,
+        changed=Payment.objects.all(), revenue=Sum('amount')
+    )
+    data['values'] = [float(item['revenue']) for item in series]
+    return data
+
+def service_popularity(user=None, since=None):
+    """Top 10 most booked services"""
+    if _unchanged(Appointment.objects.all(), since) and _unchanged(Service.objects.all(), since):
+        return {'labels': [], 'counts': []}
+    services = Service.objects.annotate(
+        booking_count=Count('appointments')
+    ).order_by('-booking_count')[:10]
+    return {
+        'labels': [service.name[:20] + '...' if len(service.name) > 20 else service.name for service in services],
+        'counts': [service.booking_count for service in services],
+    }
+
+def patient_demographics(user=None, since=None):
+    """Patients per age group, read from the precomputed histogram"""
+    ensure_age_groups()
+    if _unchanged(AgeGroupStats.objects.all(), since):
+        return {'labels': [], 'counts': []}
+    groups = age_group_counts(ensure=False)
+    return {
+        'labels': [group['age_group'] for group in groups],
+        'counts': [group['patients'] for group in groups],
+    }
+
+SERIES = {
+    'patient_history': patient_history,
+    'monthly_appointments': monthly_appointments,
+    'revenue': revenue,
+    'service_popularity': service_popularity,
+    'patient_demographics': patient_demographics,
+}
+
+# Rows whose ``updated_at`` bounds each chart's Last-Modified header
+SOURCES = {
+    'patient_history': lambda user: Appointment.objects.filter(patient=user),
+    'monthly_appointments': lambda user: Appointment.objects.all(),
+    'revenue': lambda user: Payment.objects.all(),
+    'service_popularity': lambda user: Appointment.objects.all(),
+    'patient_demographics': lambda user: AgeGroupStats.objects.all(),
+}
+
+def chart_series(name, user, since=None):
+    """Return the data series for chart ``name`` as seen by ``user``"""
+    return SERIES[name](user, since=since)
+
+def last_modified(name, user):
+    """Latest ``updated_at`` among the rows chart ``name`` is built from"""
+    return SOURCES[name](user).aggregate(latest=Max('updated_at'))['latest']
@@ -0,0 +1,195 @@
+"""
+Chart rendering service.
+
+Views describe a chart as plain data (labels and values) and get back a URL of
+the form ``/charts/<name>/<digest>.<fmt>``. The digest is a hash of the data, so
+an image is rendered once per distinct data series and then served from disk
+with a strong ETag. Rendering runs in a process pool, never in the request that
+builds the page.
+
+Every page that shows a chart marks its data series as in use, and a chart
+nobody has been shown for ``settings.CHART_CACHE_MAX_AGE`` seconds, such as
+one whose data has since changed, is deleted from ``CHART_CACHE_DIR``. The
+pool prunes a chart's directory whenever a new data series appears in it, at
+most once every ``PRUNE_EVERY`` seconds.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.urls import reverse
+
+from maes_common.instrumentation import timed
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Names accepted by ChartRenderer.render. Listed here rather than read from the
+# renderer so that importing this module does not load matplotlib.
+RENDERERS = {'patient_history', 'monthly_appointments', 'revenue', 'service_popularity', 'patient_demographics'}
+
+# Charts that expose clinic-wide figures and are only served to administrators
+ADMIN_CHARTS = {'monthly_appointments', 'revenue', 'service_popularity', 'patient_demographics'}
+
+# Seconds a client is told to wait before asking again for a chart still being rendered
+RETRY_AFTER = 5
+# Seconds between prunes of a chart's directory by this process
+PRUNE_EVERY = 3600
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}
+_pruned = {}
+
+class ChartPending(Exception):
+    """The chart did not finish rendering within ``settings.CHART_RENDER_TIMEOUT``; it is still being rendered"""
+
+def chart_digest(name, data):
+    """Content hash identifying a chart's data series"""
+    payload = json.dumps([name, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def _cache_dir(name):
+    return os.path.join(settings.CHART_CACHE_DIR, name)
+
+def chart_path(name, digest, fmt):
+    return os.path.join(_cache_dir(name), f'{digest}.{fmt}')
+
+def _spec_path(name, digest):
+    return os.path.join(_cache_dir(name), f'{digest}.json')
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(content)
+    os.replace(temp_path, path)
+
+def render_to_file(name, data, fmt, path):
+    """Render a chart to ``path``; runs inside a pool worker"""
+    from .renderers import render_chart
+    _write_atomic(path, render_chart(name, data, fmt))
+    return path
+
+def prune_directory(directory, cutoff):
+    """
+    Delete the charts in ``directory`` whose data series was last used before
+    ``cutoff`` (a timestamp), with their images; runs inside a pool worker.
+    Returns how many were deleted.
+    """
+    pruned = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        stem, ext = os.path.splitext(entry.name)
+        try:
+            if ext not in ('.json', '.tmp') or entry.stat().st_mtime >= cutoff:
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        if ext == '.json':
+            for fmt in FORMATS:
+                try:
+                    os.remove(os.path.join(directory, f'{stem}.{fmt}'))
+                except FileNotFoundError:
+                    pass
+            pruned += 1
+    return pruned
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.CHART_RENDER_WORKERS)
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+def _submit(name, digest, data, fmt):
+    key = (name, digest, fmt)
+    with _executor_lock:
+        future = _pending.get(key)
+    if future is not None:
+        return future
+    try:
+        future = _get_executor().submit(render_to_file, name, data, fmt, chart_path(name, digest, fmt))
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor().submit(render_to_file, name, data, fmt, chart_path(name, digest, fmt))
+    with _executor_lock:
+        _pending[key] = future
+    future.add_done_callback(lambda done: _pending.pop(key, None))
+    return future
+
+def _schedule_prune(name):
+    """Have the pool prune the directory of ``name`` unless this process did so recently"""
+    now = time.monotonic()
+    with _executor_lock:
+        if now - _pruned.get(name, -PRUNE_EVERY) < PRUNE_EVERY:
+            return
+        _pruned[name] = now
+    cutoff = time.time() - settings.CHART_CACHE_MAX_AGE
+    try:
+        _get_executor().submit(prune_directory, _cache_dir(name), cutoff)
+    except BrokenProcessPool:
+        _reset_executor()
+
+def chart_url(name, data, fmt='png'):
+    """
+    Return the URL of the chart image for ``data``.
+
+    The image is queued for rendering in the background if it is not cached
+    yet; the request that builds the page never waits for matplotlib.
+    """
+    digest = chart_digest(name, data)
+    spec_path = _spec_path(name, digest)
+    try:
+        # Marks the chart as in use, so it is not pruned
+        os.utime(spec_path)
+    except FileNotFoundError:
+        _write_atomic(spec_path, json.dumps(data, default=str).encode('utf-8'))
+        _schedule_prune(name)
+    if not os.path.exists(chart_path(name, digest, fmt)):
+        _submit(name, digest, data, fmt)
+    return reverse('chart_image', kwargs={'name': name, 'digest': digest, 'fmt': fmt})
+
+def ensure_chart(name, digest, fmt):
+    """
+    Return the path of a rendered chart, rendering it from its stored data
+    series if needed. Returns None when the digest is unknown, and raises
+    ``ChartPending`` when rendering takes longer than
+    ``settings.CHART_RENDER_TIMEOUT``.
+    """
+    path = chart_path(name, digest, fmt)
+    if os.path.exists(path):
+        return path
+    spec_path = _spec_path(name, digest)
+    if not os.path.exists(spec_path):
+        return None
+    with open(spec_path, 'rb') as handle:
+        data = json.loads(handle.read())
+    with timed('chart'):
+        try:
+            _submit(name, digest, data, fmt).result(timeout=settings.CHART_RENDER_TIMEOUT)
+        except TimeoutError:
+            # The pool carries on with it; a later request finds the image
+            raise ChartPending(name, digest) from None
+        except BrokenProcessPool:
+            _reset_executor()
+            render_to_file(name, data, fmt, path)
+    return path
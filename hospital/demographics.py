@@ -0,0 +1,147 @@
+"""
+Precomputed patient age-group histogram.
+
+Ages depend on the current date, so the histogram is stored with the date it
+is valid for (``AgeGroupStats.as_of``). Profile changes are applied as deltas
+computed against that date, and ``shift_age_groups`` moves the histogram
+forward by counting the patients whose birthday crossed a group boundary in
+between. Every query is a plain date comparison, so this works on any database.
+
+Only ``rebuild_age_groups`` creates the histogram's rows, all groups at once,
+from every profile. Deltas only update rows that exist, so an empty table
+means the histogram was never built. The first read, or the nightly shift,
+then builds it, which counts the patients who registered before it existed.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import UserProfile, AgeGroupStats
+
+# (label, minimum age), youngest first
+AGE_GROUPS = [
+    ('Under 18', 0),
+    ('18-29', 18),
+    ('30-44', 30),
+    ('45-59', 45),
+    ('60+', 60),
+]
+
+def add_years(day, years):
+    """Same calendar day ``years`` later (or earlier); 29 February becomes the 28th"""
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        return day.replace(year=day.year + years, day=28)
+
+def age_group(date_of_birth, on):
+    """Label of the group a patient born on ``date_of_birth`` is in on ``on``"""
+    label = AGE_GROUPS[0][0]
+    for name, minimum in AGE_GROUPS[1:]:
+        if date_of_birth <= add_years(on, -minimum):
+            label = name
+    return label
+
+def patient_state(role, date_of_birth, on):
+    """Histogram contribution of one profile as {age_group: 1}"""
+    if role != 'patient' or date_of_birth is None:
+        return {}
+    return {age_group(date_of_birth, on): 1}
+
+def histogram_as_of():
+    """Date the stored histogram is valid for (today if it is empty)"""
+    return AgeGroupStats.objects.values_list('as_of', flat=True).first() or timezone.localdate()
+
+def apply_delta(old_state, new_state):
+    """Apply ``new_state - old_state`` to the histogram, if it has been built"""
+    deltas = defaultdict(int)
+    for label, value in (old_state or {}).items():
+        deltas[label] -= value
+    for label, value in (new_state or {}).items():
+        deltas[label] += value
+
+    with transaction.atomic():
+        for label, delta in deltas.items():
+            if not delta:
+                continue
+            AgeGroupStats.objects.filter(age_group=label).update(
+                patients=F('patients') + delta, updated_at=timezone.now()
+            )
+
+def _group_filter(index, on):
+    condition = Q(date_of_birth__lte=add_years(on, -AGE_GROUPS[index][1]))
+    if index + 1 < len(AGE_GROUPS):
+        condition &= Q(date_of_birth__gt=add_years(on, -AGE_GROUPS[index + 1][1]))
+    return condition
+
+def rebuild_age_groups(today=None):
+    """Recount every age group from the profiles in one aggregate query"""
+    today = today or timezone.localdate()
+    counts = UserProfile.objects.filter(role='patient', date_of_birth__isnull=False).aggregate(**{
+        f'group_{index}': Count('id', filter=_group_filter(index, today))
+        for index in range(len(AGE_GROUPS))
+    })
+    with transaction.atomic():
+        AgeGroupStats.objects.all().delete()
+        AgeGroupStats.objects.bulk_create([
+            AgeGroupStats(age_group=label, position=index, patients=counts[f'group_{index}'], as_of=today)
+            for index, (label, minimum) in enumerate(AGE_GROUPS)
+        ])
+    return {label: counts[f'group_{index}'] for index, (label, minimum) in enumerate(AGE_GROUPS)}
+
+def shift_age_groups(today=None):
+    """
+    Move the histogram forward to ``today``.
+
+    A patient enters a group on the day they reach its minimum age, so the
+    patients crossing into a group since ``as_of`` are exactly those born in
+    ``(as_of - minimum, today - minimum]``. One aggregate counts all of them,
+    however many days have passed. Returns the number of patients moved.
+    """
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        as_of = AgeGroupStats.objects.select_for_update().values_list('as_of', flat=True).first()
+        if as_of is None:
+            rebuild_age_groups(today)
+            return 0
+        if as_of >= today:
+            return 0
+
+        crossed = UserProfile.objects.filter(role='patient').aggregate(**{
+            f'group_{index}': Count('id', filter=Q(
+                date_of_birth__gt=add_years(as_of, -minimum),
+                date_of_birth__lte=add_years(today, -minimum),
+            ))
+            for index, (label, minimum) in enumerate(AGE_GROUPS) if index
+        })
+        deltas = defaultdict(int)
+        for index in range(1, len(AGE_GROUPS)):
+            count = crossed[f'group_{index}']
+            deltas[AGE_GROUPS[index][0]] += count
+            deltas[AGE_GROUPS[index - 1][0]] -= count
+
+        apply_delta({}, deltas)
+        AgeGroupStats.objects.update(as_of=today, updated_at=timezone.now())
+    return sum(crossed.values())
+
+def ensure_age_groups():
+    """Build the histogram from the profiles if it has never been built"""
+    if AgeGroupStats.objects.exists():
+        return
+    try:
+        rebuild_age_groups()
+    except IntegrityError:
+        # Built by a concurrent request meanwhile
+        pass
+
+def age_group_counts(ensure=True):
+    """
+    Patients per age group, youngest first, read from the histogram; callers
+    that already ran ``ensure_age_groups`` pass ``ensure=False``
+    """
+    if ensure:
+        ensure_age_groups()
+    found = dict(AgeGroupStats.objects.values_list('age_group', 'patients'))
+    return [{'age_group': label, 'patients': found.get(label, 0)} for label, minimum in AGE_GROUPS]
@@ -0,0 +1,23 @@
+"""
+Background export jobs of this app; the queue and its workers live in
+``maes_common.export_jobs`` and are bound here to this app's exports.
+"""
+# Also read from here by the views
+from maes_common.export_jobs import ExportQueue, describe  # noqa: F401
+
+from . import analytics, exports, listing
+from .models import ExportJob
+
+# export -> (``exports.Export``, queryset of the rows matching some filters)
+EXPORTS = {
+    'appointments': (exports.APPOINTMENTS, listing.appointments),
+}
+
+queue = ExportQueue(ExportJob, EXPORTS, analytics.tables)
+
+supports = queue.supports
+submit = queue.submit
+claim = queue.claim
+run = queue.run
+requeue_stale = queue.requeue_stale
+cleanup = queue.cleanup
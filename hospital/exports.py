@@ -0,0 +1,25 @@
+"""
+Exports of this app's appointments; the export engine lives in
+``maes_common.exports`` and the exports declared here are built on it.
+"""
+from maes_common.exports import Column, Export, full_name, minute
+# Also read from here by the views
+from maes_common.exports import FORMATS, response  # noqa: F401
+
+from .models import Appointment
+
+APPOINTMENTS = Export('appointments', 'Appointments', Appointment, [
+    Column('appointment_id', 'Appointment ID'),
+    Column('patient_name', 'Patient Name', 'patient__first_name', 'patient__last_name', format=full_name),
+    Column('email', 'Email', 'patient__email'),
+    Column('phone', 'Phone', 'patient__userprofile__phone_number'),
+    Column('service', 'Service', 'service__name'),
+    Column('department', 'Department', 'service__department__name'),
+    Column('date', 'Date', 'appointment_date', format=minute),
+    Column('status', 'Status', choices=True),
+    Column('payment_status', 'Payment Status', choices=True),
+    Column('amount', 'Amount', 'total_amount'),
+    Column('discount', 'Discount', 'discount_amount'),
+    Column('final_amount', 'Final Amount'),
+    Column('created_at', 'Created At', format=minute),
+])
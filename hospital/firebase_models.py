@@ -2,9 +2,15 @@ from firebase_config import firebase_config
 from datetime import datetime
 import uuid
 
-class FirebaseUserModel:
+class FirebaseModel:
+    """Base for Firestore-backed models; the client is fetched on first use"""
+    
+    @property
+    def db(self):
+        return firebase_config.get_db()
+
+class FirebaseUserModel(FirebaseModel):
     def __init__(self):
-        self.db = firebase_config.get_db()
         self.collection = 'users'
     
     def create_user(self, user_data):
@@ -44,9 +50,8 @@ class FirebaseUserModel:
             print(f"Error updating user: {e}")
             return False
 
-class FirebaseAppointmentModel:
+class FirebaseAppointmentModel(FirebaseModel):
     def __init__(self):
-        self.db = firebase_config.get_db()
         self.collection = 'appointments'
     
     def create_appointment(self, appointment_data):
@@ -94,9 +99,8 @@ class FirebaseAppointmentModel:
             print(f"Error updating appointment: {e}")
             return False
 
-class FirebaseServiceModel:
+class FirebaseServiceModel(FirebaseModel):
     def __init__(self):
-        self.db = firebase_config.get_db()
         self.collection = 'services'
     
     def create_service(self, service_data):
@@ -131,9 +135,8 @@ class FirebaseServiceModel:
             print(f"Error getting services: {e}")
             return []
 
-class FirebaseDepartmentModel:
+class FirebaseDepartmentModel(FirebaseModel):
     def __init__(self):
-        self.db = firebase_config.get_db()
         self.collection = 'departments'
     
     def create_department(self, department_data):
@@ -168,9 +171,8 @@ class FirebaseDepartmentModel:
             print(f"Error getting departments: {e}")
             return []
 
-class FirebasePaymentModel:
+class FirebasePaymentModel(FirebaseModel):
     def __init__(self):
-        self.db = firebase_config.get_db()
         self.collection = 'payments'
     
     def create_payment(self, payment_data):
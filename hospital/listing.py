@@ -0,0 +1,16 @@
+"""
+Appointment listings of this app; the filters and keyset pagination live in
+``maes_common.listing`` and are bound here to this app's models.
+"""
+# Also read from here by the views, export jobs and analytics
+from maes_common.listing import (  # noqa: F401
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, AppointmentListings, filter_appointments, page_size,
+)
+
+from .models import Appointment
+
+listings = AppointmentListings(Appointment)
+
+parse_filters = listings.parse_filters
+appointments = listings.appointments
+page = listings.page
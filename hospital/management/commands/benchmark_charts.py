@@ -0,0 +1,79 @@
+import hashlib
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from hospital.renderers import ChartRenderer
+
+SAMPLE_DATA = {
+    'patient_history': {'labels': ['2025-05', '2025-06', '2025-07', '2025-08', '2025-09', '2025-10'], 'counts': [1, 0, 2, 1, 3, 1]},
+    'monthly_appointments': {'labels': [f'M{i:02d}' for i in range(1, 13)], 'counts': [40, 52, 47, 61, 58, 70, 66, 72, 80, 77, 85, 90]},
+    'revenue': {'labels': ['May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct'], 'values': [12000.0, 19000.0, 15000.0, 25000.0, 22000.0, 30000.0]},
+    'service_popularity': {'labels': ['CBC', 'Lipid Profile', 'Urinalysis', 'Chest X-ray', 'ECG'], 'counts': [120, 95, 80, 64, 40]},
+    'patient_demographics': {'labels': ['Under 18', '18-29', '30-44', '45-59', '60+'], 'counts': [12, 40, 35, 22, 15]},
+}
+
+def current_rss_kb():
+    """Resident set size of this process in KiB"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Command(BaseCommand):
+    help = 'Render dashboard charts from many threads at once and check for corrupted output and memory growth'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=20, help='Dashboards rendered per thread')
+        parser.add_argument('--format', default='png', choices=['png', 'svg'])
+    
+    def handle(self, *args, **options):
+        renderer = ChartRenderer()
+        fmt = options['format']
+        
+        # Reference digests rendered serially
+        expected = {
+            name: hashlib.sha256(renderer.render(name, data, fmt)).hexdigest()
+            for name, data in SAMPLE_DATA.items()
+        }
+        
+        mismatches = []
+        lock = threading.Lock()
+        
+        def render_dashboards(worker, iterations):
+            for _ in range(iterations):
+                for name, data in SAMPLE_DATA.items():
+                    digest = hashlib.sha256(renderer.render(name, data, fmt)).hexdigest()
+                    if digest != expected[name]:
+                        with lock:
+                            mismatches.append((worker, name))
+        
+        threads = options['threads']
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            # One warm-up round lets font caches and per-thread allocator arenas
+            # settle, so the RSS comparison below only shows real growth
+            list(pool.map(render_dashboards, range(threads), [1] * threads))
+            rss_start = current_rss_kb()
+            
+            started = time.perf_counter()
+            list(pool.map(render_dashboards, range(threads), [options['iterations']] * threads))
+            elapsed = time.perf_counter() - started
+            rss_end = current_rss_kb()
+        
+        total = threads * options['iterations'] * len(SAMPLE_DATA)
+        self.stdout.write(f"Rendered {total} charts on {threads} threads in {elapsed:.2f}s "
+                          f"({total / elapsed:.1f} charts/s)")
+        self.stdout.write(f"RSS: {rss_start / 1024:.1f} MiB before, {rss_end / 1024:.1f} MiB after "
+                          f"({(rss_end - rss_start) / 1024:+.1f} MiB)")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{len(mismatches)} renders differed from the serial reference"))
+        else:
+            self.stdout.write(self.style.SUCCESS('All renders matched the serial reference'))
@@ -0,0 +1,109 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Libraries that must only be imported by the code paths that use them
+HEAVY_LIBRARIES = ['matplotlib', 'seaborn', 'numpy', 'pandas', 'openpyxl', 'reportlab', 'firebase_admin', 'pyrebase']
+
+# Runs in a fresh interpreter so every measurement starts from a cold import
+PROBE = '''
+import importlib, json, resource, sys, time
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+module, setup, heavy = sys.argv[1], sys.argv[2] == '1', sys.argv[3].split(',')
+if setup:
+    import django
+    django.setup()
+loaded = set(sys.modules)
+rss_before = rss_kb()
+started = time.perf_counter()
+try:
+    importlib.import_module(module)
+    error = None
+except Exception as exc:
+    error = f'{type(exc).__name__}: {exc}'
+print(json.dumps({
+    'ms': (time.perf_counter() - started) * 1000,
+    'rss_kb': rss_kb() - rss_before,
+    'heavy': [name for name in heavy if name in sys.modules and name not in loaded],
+    'error': error,
+}))
+'''
+
+class Command(BaseCommand):
+    help = 'Measure cold import time and RSS of the modules a web worker loads at startup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', help='Modules to import (default: the URLconf, hospital.views and firebase_config)')
+        parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per module; the median is reported')
+        parser.add_argument('--max-ms', type=float, help='Fail if any module takes longer than this to import')
+        parser.add_argument('--max-rss', type=float, help='Fail if any module grows RSS by more than this many MiB')
+        parser.add_argument('--skip-libraries', action='store_true', help='Do not time the heavy libraries on their own')
+
+    def probe(self, module, setup, repeat):
+        runs = []
+        for _ in range(repeat):
+            result = subprocess.run(
+                [sys.executable, '-c', PROBE, module, '1' if setup else '0', ','.join(HEAVY_LIBRARIES)],
+                capture_output=True, text=True, cwd=str(settings.BASE_DIR), env=os.environ.copy()
+            )
+            if result.returncode != 0:
+                return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'probe failed'}
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            if runs[-1]['error']:
+                return runs[-1]
+        return {
+            'ms': statistics.median(run['ms'] for run in runs),
+            'rss_kb': statistics.median(run['rss_kb'] for run in runs),
+            'heavy': runs[-1]['heavy'],
+            'error': None,
+        }
+
+    def report(self, module, result):
+        if result['error']:
+            self.stdout.write(f"  {module:<32} {self.style.WARNING(result['error'])}")
+            return
+        heavy = ', '.join(result['heavy']) or '-'
+        self.stdout.write(f"  {module:<32} {result['ms']:>9.1f} ms {result['rss_kb'] / 1024:>8.1f} MiB   {heavy}")
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or [settings.ROOT_URLCONF, 'hospital.views', 'firebase_config']
+        repeat = max(1, options['repeat'])
+        failures = []
+
+        self.stdout.write(f"Application modules (after django.setup(), median of {repeat}):")
+        self.stdout.write(f"  {'module':<32} {'import':>12} {'RSS':>12}   heavy libraries loaded")
+        for module in modules:
+            result = self.probe(module, True, repeat)
+            self.report(module, result)
+            if result['error']:
+                continue
+            if result['heavy']:
+                failures.append(f"{module} imports {', '.join(result['heavy'])} at startup")
+            if options['max_ms'] is not None and result['ms'] > options['max_ms']:
+                failures.append(f"{module} took {result['ms']:.1f} ms to import (limit {options['max_ms']} ms)")
+            if options['max_rss'] is not None and result['rss_kb'] / 1024 > options['max_rss']:
+                failures.append(f"{module} added {result['rss_kb'] / 1024:.1f} MiB (limit {options['max_rss']} MiB)")
+
+        if not options['skip_libraries']:
+            self.stdout.write('Heavy libraries on their own (for reference):')
+            for library in HEAVY_LIBRARIES:
+                self.report(library, self.probe(library, False, repeat))
+
+        if failures:
+            raise CommandError('Startup regression:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('No heavy libraries are imported at startup'))
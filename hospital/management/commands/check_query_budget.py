@@ -0,0 +1,15 @@
+from maes_common.commands.check_query_budget import CheckQueryBudgetCommand
+
+class Command(CheckQueryBudgetCommand):
+    app_label = 'hospital'
+    budgets = {
+        'admin_dashboard': 20,
+        'week_availability': 20,  # the first request of a day generates its slots
+    }
+    broken = {
+        'medical_certificate_request': 'hospital/medical_certificate_request.html is missing from templates/',
+        'password_reset_request': 'hospital/password_reset_form.html is missing from templates/',
+    }
+
+    def certificate_fields(self):
+        return {'diagnosis': 'No findings'}
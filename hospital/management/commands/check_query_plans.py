@@ -0,0 +1,4 @@
+from maes_common.commands.check_query_plans import CheckQueryPlansCommand
+
+class Command(CheckQueryPlansCommand):
+    app_label = 'hospital'
@@ -0,0 +1,4 @@
+from maes_common.commands.rebuild_daily_stats import RebuildDailyStatsCommand
+
+class Command(RebuildDailyStatsCommand):
+    app_label = 'hospital'
@@ -0,0 +1,4 @@
+from maes_common.commands.render_documents import RenderDocumentsCommand
+
+class Command(RenderDocumentsCommand):
+    app_label = 'hospital'
@@ -0,0 +1,4 @@
+from maes_common.commands.run_export_worker import RunExportWorkerCommand
+
+class Command(RunExportWorkerCommand):
+    app_label = 'hospital'
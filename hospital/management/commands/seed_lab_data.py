@@ -0,0 +1,44 @@
+from django.utils import timezone
+
+from hospital import demographics
+from hospital.models import SequenceCounter
+from maes_common.commands.seed_lab_data import SeedLabDataCommand
+
+class Command(SeedLabDataCommand):
+    app_label = 'hospital'
+    desk_role = 'receptionist'
+    paid_status = 'completed'
+    notices = {
+        'booked': ('appointment_confirmed', 'Appointment Booked', 'Your appointment for {service} is scheduled for {when}.'),
+        'cancelled': ('appointment_cancelled', 'Appointment Cancelled', 'Your appointment for {service} on {when} was cancelled.'),
+        'paid': ('payment_received', 'Payment Received', 'Your payment of ₱{amount} was received. Receipt {receipt}.'),
+        'released': ('result_ready', 'Test Result Ready', 'Your {service} result is ready to view.'),
+    }
+    notices_link_payments = True
+
+    def rebuild(self, services, horizon):
+        super().rebuild(services, horizon)
+        demographics.rebuild_age_groups()
+
+    def appointment_fields(self, discount):
+        return {'financial_assistance_type': 'senior_citizen' if discount else ''}
+
+    def number_appointments(self, appointments, dates):
+        self.number(appointments, 'APT', self.Appointment, 'appointment_id', dates)
+
+    def payment(self, appointment, verifier, verified, **fields):
+        return self.Payment(appointment_id=appointment.pk, payment_status=appointment.payment_status,
+                            verified_by_id=verifier, verified_at=verified,
+                            created_at=fields['payment_date'], updated_at=fields['payment_date'], **fields)
+
+    def number_payments(self, payments):
+        self.number(payments, 'RCP', self.Payment, 'receipt_number', [payment.payment_date for payment in payments])
+
+    def number(self, rows, prefix, model, field, dates):
+        """Give ``rows`` the IDs of the days in ``dates``, claimed from each day's sequence counter"""
+        by_day = {}
+        for row, value in zip(rows, dates):
+            by_day.setdefault(timezone.localdate(value), []).append(row)
+        for day, day_rows in sorted(by_day.items()):
+            for row, number in zip(day_rows, SequenceCounter.reserve_ids(prefix, model, field, len(day_rows), day)):
+                setattr(row, field, number)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from hospital.demographics import shift_age_groups, rebuild_age_groups
+
+class Command(BaseCommand):
+    help = 'Move patients across age-group boundaries whose birthdays have passed; run nightly'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recount every age group from the patient profiles instead')
+    
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            counts = rebuild_age_groups()
+            summary = ', '.join(f'{label}: {count}' for label, count in counts.items())
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt age groups ({summary}).'))
+            return
+        moved = shift_age_groups()
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} patients to their new age group.'))
@@ -0,0 +1,68 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from hospital.models import SequenceCounter
+from maes_common.testing import test_database
+
+class Command(BaseCommand):
+    help = ('Reserve sequence numbers from many threads at once, on a throwaway test database, '
+            'and check that none is issued twice or skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iterations', type=int, default=100, help='Reservations per thread')
+        parser.add_argument('--max-batch', type=int, default=5, help='Largest block claimed by one reservation')
+        parser.add_argument('--prefix', default='TST', help='Counter prefix used for the run')
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.run(options)
+
+    def run(self, options):
+        prefix = options['prefix']
+
+        issued = []
+        errors = []
+        lock = threading.Lock()
+        start_gate = threading.Barrier(options['threads'])
+
+        def hammer(worker):
+            numbers = []
+            rng = random.Random(worker)
+            try:
+                start_gate.wait()
+                for _ in range(options['iterations']):
+                    count = rng.randint(1, options['max_batch'])
+                    first = SequenceCounter.reserve(prefix, count)
+                    numbers.extend(range(first, first + count))
+            except Exception as e:
+                with lock:
+                    errors.append(f"thread {worker}: {e}")
+            finally:
+                connection.close()
+            with lock:
+                issued.extend(numbers)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(hammer, range(options['threads'])))
+        elapsed = time.perf_counter() - started
+
+        final_value = SequenceCounter.objects.filter(prefix=prefix).values_list('value', flat=True).first() or 0
+
+        duplicates = [number for number, seen in Counter(issued).items() if seen > 1]
+        missing = set(range(1, final_value + 1)) - set(issued)
+
+        self.stdout.write(f"Issued {len(issued)} numbers on {options['threads']} threads in {elapsed:.2f}s "
+                          f"({len(issued) / elapsed:.0f} numbers/s); counter ended at {final_value}")
+        for error in errors[:10]:
+            self.stdout.write(self.style.WARNING(error))
+        if duplicates or missing or errors:
+            raise CommandError(f"{len(duplicates)} duplicate numbers, {len(missing)} gaps, {len(errors)} failed threads")
+        self.stdout.write(self.style.SUCCESS('Every number was issued exactly once'))
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Length
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
@@ -17,6 +19,10 @@ def test_result_file_path(instance, filename):
     filename = f'{instance.appointment.appointment_id}_result.{ext}'
     return os.path.join('test_results', filename)
 
+def export_file_path(instance, filename):
+    """Generate file path for export files, under a directory name nobody can guess"""
+    return os.path.join('exports', uuid.uuid4().hex, filename)
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('patient', 'Patient'),
@@ -112,6 +118,7 @@ class Service(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     duration_minutes = models.PositiveIntegerField(default=30)
+    slot_capacity = models.PositiveIntegerField(default=1, help_text="Patients that can be booked into the same time slot")
     sample_type = models.CharField(max_length=20, choices=SAMPLE_TYPE_CHOICES, default='blood')
     requires_fasting = models.BooleanField(default=False)
     requires_appointment = models.BooleanField(default=True)
@@ -129,6 +136,71 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.name} - {self.department.name}"
 
+class SequenceCounter(models.Model):
+    """Last number issued for a document prefix on a given day.
+
+    Appointment, receipt and certificate numbers are ``<prefix><YYYYMMDD><nnnn>``.
+    Numbers are claimed with a single atomic UPDATE on this row instead of
+    counting the day's rows, so concurrent saves never receive the same number.
+    """
+    prefix = models.CharField(max_length=10)
+    date = models.DateField()
+    value = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'sequence_counters'
+        unique_together = ['prefix', 'date']
+    
+    def __str__(self):
+        return f"{self.prefix} {self.date}: {self.value}"
+    
+    @classmethod
+    def reserve(cls, prefix, count=1, day=None, existing=None):
+        """
+        Atomically claim ``count`` consecutive numbers and return the first.
+
+        ``existing(day)`` returns the highest number already in use; it is only
+        called when the day's counter is created, so numbers issued before the
+        counter existed are not handed out again.
+        """
+        day = day or timezone.localdate()
+        counter = cls.objects.filter(prefix=prefix, date=day)
+        with transaction.atomic():
+            # UPDATE first so the row (or, on SQLite, the database) is write-locked
+            # before anything is read; reading first lets two writers deadlock
+            if not counter.update(value=F('value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, date=day, value=(existing(day) if existing else 0) + count)
+                except IntegrityError:
+                    counter.update(value=F('value') + count)
+            value = counter.values_list('value', flat=True).get()
+        return value - count + 1
+    
+    @classmethod
+    def reserve_ids(cls, prefix, model, field, count=1, day=None):
+        """
+        Claim ``count`` formatted IDs for ``model.field``, e.g. for ``bulk_create``:
+        ``SequenceCounter.reserve_ids('APT', Appointment, 'appointment_id', len(rows))``
+
+        IDs are stamped with ``day`` (today by default), so back-dated rows can
+        be numbered in the sequence of the day they belong to.
+        """
+        day = day or timezone.localdate()
+        stamp = f"{prefix}{day.strftime('%Y%m%d')}"
+        
+        def existing(day):
+            # The range lets the unique index on ``field`` find the day's IDs; LIKE alone
+            # scans the table. Past 9999 the numbers grow a digit and "...10000" sorts
+            # below "...9999" as a string, so the longest suffix wins before the largest
+            last = model.objects.filter(**{
+                f'{field}__gte': stamp, f'{field}__lte': stamp + '9' * 12, f'{field}__regex': rf'^{stamp}[0-9]+$'
+            }).order_by(Length(field).desc(), f'-{field}').values_list(field, flat=True).first()
+            return int(last[len(stamp):]) if last else 0
+        
+        first = cls.reserve(prefix, count, day, existing)
+        return [f"{stamp}{number:04d}" for number in range(first, first + count)]
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -185,19 +257,57 @@ class Appointment(models.Model):
     class Meta:
         db_table = 'appointments'
         ordering = ['-appointment_date']
+        indexes = [
+            # Patient dashboard, overlap checks and charts: patient + date (+ status)
+            models.Index(fields=['patient', 'appointment_date', 'status'], name='appt_patient_date_status_idx'),
+            # Slot inventory: one service's bookings over a date range
+            models.Index(fields=['service', 'appointment_date'], name='appt_service_date_idx'),
+            # Calendar and monthly series: date ranges over all appointments; keyset
+            # pages of the listing API walk (appointment_date, id)
+            models.Index(fields=['appointment_date', 'id'], name='appt_date_idx'),
+            # Recent activity and bookings per day (query created_at ranges, not created_at__date)
+            models.Index(fields=['created_at'], name='appt_created_idx'),
+        ]
+        constraints = [
+            # A patient can hold only one active appointment at a given time
+            models.UniqueConstraint(
+                fields=['patient', 'appointment_date'],
+                condition=~models.Q(status='cancelled'),
+                name='unique_active_appointment_per_patient',
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.appointment_id:
             # Generate unique appointment ID
-            prefix = 'APT'
-            timestamp = timezone.now().strftime('%Y%m%d')
-            count = Appointment.objects.filter(created_at__date=timezone.now().date()).count() + 1
-            self.appointment_id = f"{prefix}{timestamp}{count:04d}"
+            self.appointment_id = SequenceCounter.reserve_ids('APT', Appointment, 'appointment_id')[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.appointment_id} - {self.patient.get_full_name()} - {self.service.name}"
 
+class TimeSlot(models.Model):
+    """A bookable period for one service, with the places still free in it.
+
+    Generated ahead of time from the operating hours and the service's
+    duration and slot capacity; see ``slots.py``.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='time_slots')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    capacity = models.PositiveIntegerField(default=1)
+    remaining = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'time_slots'
+        ordering = ['service', 'start']
+        unique_together = ['service', 'start']
+    
+    def __str__(self):
+        return f"{self.service.name} - {self.start} ({self.remaining}/{self.capacity})"
+
 class TestResult(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -211,6 +321,9 @@ class TestResult(models.Model):
     result_file = models.FileField(upload_to=test_result_file_path, blank=True, null=True)
     result_text = models.TextField(blank=True)
     result_data = models.JSONField(default=dict, blank=True)
+    # PDF report drawn from this result by documents.py, and the hash of what it shows
+    report_file = models.FileField(upload_to='result_reports/', blank=True, null=True, editable=False)
+    report_digest = models.CharField(max_length=64, blank=True, editable=False)
     
     # Analysis
     is_normal = models.BooleanField(default=True)
@@ -233,6 +346,12 @@ class TestResult(models.Model):
     class Meta:
         db_table = 'test_results'
         ordering = ['-created_at']
+        indexes = [
+            # Released results, newest first
+            models.Index(fields=['status', 'released_at'], name='result_status_released_idx'),
+            # Recent results
+            models.Index(fields=['created_at'], name='result_created_idx'),
+        ]
     
     def __str__(self):
         return f"Result for {self.appointment.appointment_id}"
@@ -285,14 +404,17 @@ class Payment(models.Model):
     class Meta:
         db_table = 'payments'
         ordering = ['-payment_date']
+        indexes = [
+            # Revenue series over completed payments
+            models.Index(fields=['payment_status', 'payment_date'], name='payment_status_date_idx'),
+            # Recent payments
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.receipt_number:
             # Generate unique receipt number
-            prefix = 'RCP'
-            timestamp = timezone.now().strftime('%Y%m%d')
-            count = Payment.objects.filter(created_at__date=timezone.now().date()).count() + 1
-            self.receipt_number = f"{prefix}{timestamp}{count:04d}"
+            self.receipt_number = SequenceCounter.reserve_ids('RCP', Payment, 'receipt_number')[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -333,8 +455,9 @@ class MedicalCertificate(models.Model):
     # Status
     is_active = models.BooleanField(default=True)
     
-    # File
+    # File, drawn by documents.py, and the hash of what it shows
     certificate_file = models.FileField(upload_to='medical_certificates/', blank=True, null=True)
+    certificate_digest = models.CharField(max_length=64, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -346,10 +469,7 @@ class MedicalCertificate(models.Model):
     def save(self, *args, **kwargs):
         if not self.certificate_number:
             # Generate unique certificate number
-            prefix = 'MED'
-            timestamp = timezone.now().strftime('%Y%m%d')
-            count = MedicalCertificate.objects.filter(created_at__date=timezone.now().date()).count() + 1
-            self.certificate_number = f"{prefix}{timestamp}{count:04d}"
+            self.certificate_number = SequenceCounter.reserve_ids('MED', MedicalCertificate, 'certificate_number')[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -390,6 +510,12 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
+        indexes = [
+            # Unread notifications of a user, newest first
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+            # All notifications of a user, newest first
+            models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+        ]
     
     def mark_as_read(self):
         if not self.is_read:
@@ -463,3 +589,137 @@ class ChatbotConversation(models.Model):
     
     def __str__(self):
         return f"Chat - {self.session_id} - {self.created_at}"
+
+class DailyStats(models.Model):
+    """Per-day, per-department rollup of dashboard counters.
+
+    Rows are kept current by the signal handlers in ``signals.py``; rows with
+    no department hold counters that are not tied to a service, such as new
+    patient registrations.
+    """
+    date = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    
+    # Appointments counted on their scheduled date
+    appointments = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    confirmed = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    no_show = models.IntegerField(default=0)
+    
+    # Appointments counted on the date they were booked
+    booked = models.IntegerField(default=0)
+    
+    # Completed payments counted on their payment date
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    new_patients = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'daily_stats'
+        ordering = ['-date']
+        unique_together = ['date', 'department']
+        constraints = [
+            # unique_together does not stop NULL departments from repeating; one
+            # all-departments row per day
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=models.Q(department__isnull=True),
+                name='unique_daily_stats_all_departments',
+            ),
+        ]
+        verbose_name = 'Daily Statistics'
+        verbose_name_plural = 'Daily Statistics'
+    
+    def __str__(self):
+        return f"{self.date} - {self.department or 'All departments'}"
+
+class AgeGroupStats(models.Model):
+    """Number of patients per age group, as of ``as_of``.
+
+    Kept current by the signal handlers in ``signals.py`` when profiles change
+    and shifted forward each night by ``manage.py shift_age_groups`` as
+    patients cross a group boundary on their birthday.
+    """
+    age_group = models.CharField(max_length=20, unique=True)
+    position = models.PositiveSmallIntegerField(default=0)
+    patients = models.IntegerField(default=0)
+    as_of = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'age_group_stats'
+        ordering = ['position']
+        verbose_name = 'Age Group Statistics'
+        verbose_name_plural = 'Age Group Statistics'
+    
+    def __str__(self):
+        return f"{self.age_group}: {self.patients}"
+
+class ExportJob(models.Model):
+    """An export written in the background by ``manage.py run_export_worker``.
+
+    The worker stores ``progress`` as it goes and the finished file in
+    ``file``; see ``export_jobs.py``.
+    """
+    EXPORT_CHOICES = [
+        ('appointments', 'Appointments'),
+        ('payments', 'Payments'),
+        ('test_results', 'Test Results'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+        ('jsonl', 'JSON Lines'),
+        ('pdf', 'PDF'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+    
+    export = models.CharField(max_length=30, choices=EXPORT_CHOICES, default='appointments')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    # Appointment filters, as returned by ``listing.parse_filters``
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs')
+    
+    # Progress, as a percentage of the rows counted when the job started
+    progress = models.PositiveSmallIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    
+    file = models.FileField(upload_to=export_file_path, blank=True, null=True)
+    error = models.TextField(blank=True)
+    
+    # The worker running the job, and when it last reported progress
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # When the finished file is deleted
+    expires_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'export_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            # Workers take the oldest pending job
+            models.Index(fields=['status', 'created_at'], name='export_status_created_idx'),
+            # Clean-up of expired files
+            models.Index(fields=['status', 'expires_at'], name='export_status_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_export_display()} ({self.get_format_display()}) - {self.get_status_display()}"
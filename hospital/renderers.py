@@ -0,0 +1,110 @@
+"""
+Thread-safe chart renderer.
+
+Each call builds its own ``matplotlib.figure.Figure`` attached to a private Agg
+canvas, so nothing touches pyplot's global figure registry. Figures are never
+registered anywhere and are cleared when the call returns, even if drawing
+fails, which keeps memory flat no matter how many charts a worker renders.
+"""
+from io import BytesIO
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Fixed salt for SVG element ids so identical data always yields identical bytes
+matplotlib.rcParams['svg.hashsalt'] = 'maes-charts'
+
+class ChartTheme:
+    """Colours and sizing shared by every chart"""
+
+    def __init__(self, primary='#667eea', secondary='#4facfe', accent='#f093fb',
+                 palette=None, dpi=150, title_size=14, label_size=10, grid_alpha=0.3):
+        self.primary = primary
+        self.secondary = secondary
+        self.accent = accent
+        self.palette = palette or ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe']
+        self.dpi = dpi
+        self.title_size = title_size
+        self.label_size = label_size
+        self.grid_alpha = grid_alpha
+
+DEFAULT_THEME = ChartTheme()
+
+class ChartRenderer:
+    """Render the dashboard charts to PNG or SVG bytes"""
+
+    FIGSIZES = {
+        'patient_history': (10, 6),
+        'monthly_appointments': (12, 6),
+        'revenue': (10, 6),
+        'service_popularity': (12, 8),
+        'patient_demographics': (8, 8),
+    }
+
+    def __init__(self, theme=None):
+        self.theme = theme or DEFAULT_THEME
+
+    def render(self, name, data, fmt='png'):
+        """Render chart ``name`` from its data series and return the encoded image"""
+        draw = getattr(self, f'draw_{name}', None)
+        if draw is None:
+            raise ValueError(f"Unknown chart: {name}")
+
+        figure = Figure(figsize=self.FIGSIZES.get(name, (10, 6)), dpi=self.theme.dpi)
+        FigureCanvasAgg(figure)
+        try:
+            draw(figure.add_subplot(), data)
+            buffer = BytesIO()
+            figure.savefig(buffer, format=fmt, bbox_inches='tight', metadata=self._metadata(fmt))
+            return buffer.getvalue()
+        finally:
+            figure.clear()
+
+    def _metadata(self, fmt):
+        # Leave out the timestamp for the same reason as the SVG salt above
+        return {'Date': None} if fmt == 'svg' else None
+
+    def _decorate(self, ax, title, xlabel, ylabel, rotate_labels=False):
+        ax.set_title(title, fontsize=self.theme.title_size)
+        ax.set_xlabel(xlabel, fontsize=self.theme.label_size)
+        ax.set_ylabel(ylabel, fontsize=self.theme.label_size)
+        if rotate_labels:
+            ax.tick_params(axis='x', labelrotation=45)
+
+    def draw_patient_history(self, ax, data):
+        ax.bar(data['labels'], data['counts'], color=self.theme.primary, alpha=0.8)
+        self._decorate(ax, 'Your Appointment History (Last 6 Months)', 'Month', 'Number of Appointments', True)
+
+    def draw_monthly_appointments(self, ax, data):
+        months, counts = data['labels'], data['counts']
+        ax.plot(months, counts, marker='o', linewidth=2, markersize=6, color=self.theme.primary)
+        ax.fill_between(months, counts, alpha=0.3, color=self.theme.primary)
+        ax.grid(True, alpha=self.theme.grid_alpha)
+        self._decorate(ax, 'Monthly Appointments Trend', 'Month', 'Number of Appointments', True)
+
+    def draw_revenue(self, ax, data):
+        revenues = data['values']
+        bars = ax.bar(data['labels'], revenues, color=self.theme.secondary, alpha=0.8)
+        ax.bar_label(bars, labels=[f'₱{revenue:,.0f}' for revenue in revenues])
+        self._decorate(ax, 'Monthly Revenue', 'Month', 'Revenue (₱)', True)
+
+    def draw_service_popularity(self, ax, data):
+        bars = ax.barh(data['labels'], data['counts'], color=self.theme.accent)
+        ax.bar_label(bars, fontweight='bold')
+        self._decorate(ax, 'Most Popular Services', 'Number of Bookings', 'Services')
+
+    def draw_patient_demographics(self, ax, data):
+        # Empty age groups would stack their labels at the same angle
+        groups = [(label, count) for label, count in zip(data['labels'], data['counts']) if count]
+        labels = [label for label, count in groups]
+        ax.pie([count for label, count in groups], labels=labels, colors=self.theme.palette[:len(labels)],
+               autopct='%1.1f%%', startangle=90)
+        ax.set_title('Patient Age Distribution', fontsize=self.theme.title_size)
+        ax.axis('equal')
+
+default_renderer = ChartRenderer()
+
+def render_chart(name, data, fmt='png'):
+    """Render a chart with the default theme"""
+    return default_renderer.render(name, data, fmt)
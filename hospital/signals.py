@@ -0,0 +1,171 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .models import UserProfile, Department, Service, Appointment, Payment
+from . import stats, demographics, slots
+
+# Dashboard rollup signals
+def _appointment_rollup_state(values):
+    return stats.appointment_state(
+        values['appointment_date'], values['created_at'], values['status'], values['service__department_id']
+    )
+
+def _payment_rollup_state(values):
+    return stats.payment_state(
+        values['payment_date'], values['payment_status'], values['amount'],
+        values['appointment__service__department_id']
+    )
+
+@receiver(pre_save, sender=Appointment)
+def snapshot_appointment_stats(sender, instance, raw=False, **kwargs):
+    """Remember the rollup contribution of the stored row before it changes"""
+    old = None
+    if instance.pk and not raw:
+        old = Appointment.objects.filter(pk=instance.pk).values(
+            'appointment_date', 'created_at', 'status', 'service__department_id'
+        ).first()
+    instance._stored_values = old
+    instance._rollup_state = _appointment_rollup_state(old) if old else {}
+
+@receiver(post_save, sender=Appointment)
+def update_appointment_stats(sender, instance, raw=False, **kwargs):
+    """Apply the appointment's change to the daily rollup"""
+    if raw:
+        return
+    department_id = instance.service.department_id
+    new_state = stats.appointment_state(instance.appointment_date, instance.created_at, instance.status, department_id)
+    stats.apply_delta(getattr(instance, '_rollup_state', {}), new_state)
+    
+    # Payments are counted on their own date, but under the appointment's department
+    old = getattr(instance, '_stored_values', None)
+    if old and old['service__department_id'] != department_id:
+        stats.apply_delta(*stats.moved_revenue(instance.pk, old['service__department_id'], department_id))
+
+def _cascades_from_department(origin):
+    """Whether a delete started at a department, whose rollup rows are deleted with it"""
+    return getattr(origin, 'model', type(origin)) is Department
+
+@receiver(post_delete, sender=Appointment)
+def remove_appointment_stats(sender, instance, origin=None, **kwargs):
+    """Remove a deleted appointment from the daily rollup"""
+    if _cascades_from_department(origin):
+        return
+    department_id = Service.objects.filter(pk=instance.service_id).values_list('department_id', flat=True).first()
+    stats.apply_delta(stats.appointment_state(
+        instance.appointment_date, instance.created_at, instance.status, department_id
+    ), {})
+
+@receiver(pre_save, sender=Payment)
+def snapshot_payment_stats(sender, instance, raw=False, **kwargs):
+    """Remember the rollup contribution of the stored row before it changes"""
+    old = None
+    if instance.pk and not raw:
+        old = Payment.objects.filter(pk=instance.pk).values(
+            'payment_date', 'payment_status', 'amount', 'appointment__service__department_id'
+        ).first()
+    instance._rollup_state = _payment_rollup_state(old) if old else {}
+
+@receiver(post_save, sender=Payment)
+def update_payment_stats(sender, instance, raw=False, **kwargs):
+    """Apply the payment's change to the daily rollup"""
+    if raw:
+        return
+    department_id = Appointment.objects.filter(pk=instance.appointment_id).values_list(
+        'service__department_id', flat=True
+    ).first()
+    new_state = stats.payment_state(instance.payment_date, instance.payment_status, instance.amount, department_id)
+    stats.apply_delta(getattr(instance, '_rollup_state', {}), new_state)
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_stats(sender, instance, origin=None, **kwargs):
+    """Remove a deleted payment from the daily rollup"""
+    if _cascades_from_department(origin):
+        return
+    department_id = Appointment.objects.filter(pk=instance.appointment_id).values_list(
+        'service__department_id', flat=True
+    ).first()
+    stats.apply_delta(stats.payment_state(
+        instance.payment_date, instance.payment_status, instance.amount, department_id
+    ), {})
+
+@receiver(pre_save, sender=UserProfile)
+def snapshot_patient_stats(sender, instance, raw=False, **kwargs):
+    """Remember how the stored profile was counted in the rollup and age histogram"""
+    old = None
+    if instance.pk and not raw:
+        old = UserProfile.objects.filter(pk=instance.pk).values('role', 'date_of_birth').first()
+    instance._age_groups_as_of = demographics.histogram_as_of()
+    if old:
+        instance._rollup_state = stats.patient_state(old['role'], instance.user.date_joined)
+        instance._age_group_state = demographics.patient_state(
+            old['role'], old['date_of_birth'], instance._age_groups_as_of
+        )
+    else:
+        instance._rollup_state = {}
+        instance._age_group_state = {}
+
+@receiver(post_save, sender=UserProfile)
+def update_patient_stats(sender, instance, raw=False, **kwargs):
+    """Apply registrations, role and birth date changes to the rollup and age histogram"""
+    if raw:
+        return
+    new_state = stats.patient_state(instance.role, instance.user.date_joined)
+    stats.apply_delta(getattr(instance, '_rollup_state', {}), new_state)
+    
+    as_of = getattr(instance, '_age_groups_as_of', None) or demographics.histogram_as_of()
+    demographics.apply_delta(
+        getattr(instance, '_age_group_state', {}),
+        demographics.patient_state(instance.role, instance.date_of_birth, as_of),
+    )
+
+@receiver(post_delete, sender=UserProfile)
+def remove_patient_stats(sender, instance, **kwargs):
+    """Remove a deleted patient from the daily rollup and age histogram"""
+    date_joined = User.objects.filter(pk=instance.user_id).values_list('date_joined', flat=True).first()
+    stats.apply_delta(stats.patient_state(instance.role, date_joined), {})
+    
+    as_of = demographics.histogram_as_of()
+    demographics.apply_delta(demographics.patient_state(instance.role, instance.date_of_birth, as_of), {})
+
+# Slot inventory signals
+@receiver(pre_save, sender=Appointment)
+def reserve_appointment_slot(sender, instance, raw=False, **kwargs):
+    """Take a place in the appointment's slot when it is booked, moved or restored"""
+    instance._release_slot = None
+    # slots.book takes the place itself before it saves a new appointment; only
+    # that first save is covered
+    reserved, instance._slot_reserved = getattr(instance, '_slot_reserved', False), False
+    if raw:
+        return
+    old = None
+    if instance.pk:
+        old = Appointment.objects.filter(pk=instance.pk).values('status', 'service_id', 'appointment_date').first()
+    held = old is not None and slots.holds_slot(old['status'])
+    moved = held and (old['service_id'] != instance.service_id or old['appointment_date'] != instance.appointment_date)
+    
+    # Saves that keep the appointment's place, such as status changes and edits
+    # of other fields, leave the inventory alone. So do records of appointments
+    # whose slot has already started (corrections, imports): nobody can book
+    # that place any more, and the booking views only accept future times.
+    if (slots.holds_slot(instance.status) and (not held or moved)
+            and instance.appointment_date > timezone.now() and not reserved):
+        slots.reserve_slot(instance.service_id, instance.appointment_date)
+    
+    # Only give the old place back once the save has gone through
+    if held and (moved or not slots.holds_slot(instance.status)):
+        instance._release_slot = (old['service_id'], old['appointment_date'])
+
+@receiver(post_save, sender=Appointment)
+def release_moved_slot(sender, instance, raw=False, **kwargs):
+    """Give back the place of a cancelled or rescheduled appointment"""
+    release = getattr(instance, '_release_slot', None)
+    if release and not raw:
+        slots.release_slot(*release)
+        instance._release_slot = None
+
+@receiver(post_delete, sender=Appointment)
+def release_deleted_slot(sender, instance, **kwargs):
+    """Give back the place of a deleted appointment"""
+    if slots.holds_slot(instance.status):
+        slots.release_slot(instance.service_id, instance.appointment_date)
@@ -0,0 +1,16 @@
+"""
+Daily rollup of this app's dashboard statistics; the logic lives in
+``maes_common.stats`` and is bound here to this app's models.
+"""
+# patient_state and payment_state are also read from here by the signal handlers
+from maes_common.stats import DailyRollup, patient_state, payment_state  # noqa: F401
+
+from .models import Appointment, DailyStats, Payment, UserProfile
+
+rollup = DailyRollup(Appointment, Payment, UserProfile, DailyStats)
+
+appointment_state = rollup.appointment_state
+moved_revenue = rollup.moved_revenue
+apply_delta = rollup.apply_delta
+dashboard_totals = rollup.dashboard_totals
+rebuild_daily_stats = rollup.rebuild_daily_stats
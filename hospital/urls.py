@@ -20,11 +20,25 @@ urlpatterns = [
     path('api/chatbot/', views.chatbot_api, name='chatbot_api'),
     path('api/services/<int:department_id>/', views.get_services_by_department, name='get_services_by_department'),
     path('api/check-availability/', views.check_appointment_availability, name='check_appointment_availability'),
+    path('api/availability/', views.week_availability, name='week_availability'),
+    path('metrics', views.metrics, name='metrics'),
+    
+    # Cached chart images
+    path('charts/<str:name>/<slug:digest>.<str:fmt>', views.chart_image, name='chart_image'),
     
     # Export functions
     path('export/appointments/csv/', views.export_appointments_csv, name='export_appointments_csv'),
     path('export/appointments/excel/', views.export_appointments_excel, name='export_appointments_excel'),
     
+    # Background exports
+    path('export/jobs/', views.create_export_job, name='create_export_job'),
+    path('export/jobs/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<int:job_id>/download/', views.download_export_job, name='download_export_job'),
+    
+    # Patient documents
+    path('results/<int:result_id>/pdf/', views.test_result_pdf, name='test_result_pdf'),
+    path('certificates/<int:certificate_id>/pdf/', views.medical_certificate_pdf, name='medical_certificate_pdf'),
+    
     # Password reset
     path('password-reset/', views.password_reset_request, name='password_reset_request'),
 ]
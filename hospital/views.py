@@ -3,36 +3,40 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.utils.cache import patch_cache_control, get_conditional_response
+from django.utils.dateparse import parse_datetime, parse_date
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.db.models import Count, Sum, Q, Avg
 from django.core.paginator import Paginator
 from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode
+from django.utils.http import urlsafe_base64_encode, http_date, quote_etag
 from django.utils.encoding import force_bytes
 from django.template.loader import render_to_string
 from datetime import datetime, timedelta
 import json
-import csv
-import openpyxl
-from openpyxl.styles import Font, Alignment
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
+import os
+import re
+
+from maes_common import instrumentation
+from maes_common.timeseries import time_series
 
 from .models import (
     UserProfile, Department, Service, Appointment, 
     TestResult, Payment, MedicalCertificate, Notification, 
-    AuditLog, SystemSettings, ChatbotConversation
+    AuditLog, SystemSettings, ChatbotConversation, ExportJob
 )
+from .stats import dashboard_totals
+from . import slots, documents, exports, export_jobs, listing
+from .charts import FORMATS, ADMIN_CHARTS, RENDERERS, RETRY_AFTER, ChartPending, chart_url, chart_digest, ensure_chart
+from . import chart_data
+from .demographics import age_group_counts, histogram_as_of
 from firebase_config import firebase_config
 
 def create_audit_log(request, action, model_name, object_id='', changes=None):
@@ -46,7 +50,7 @@ def create_audit_log(request, action, model_name, object_id='', changes=None):
             changes=changes or {},
             ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            session_key=request.session.session_key
+            session_key=request.session.session_key or ''
         )
     except Exception as e:
         print(f"Error creating audit log: {e}")
@@ -63,21 +67,11 @@ def get_client_ip(request):
 def home(request):
     """Enhanced homepage with comprehensive statistics and modern design"""
     try:
-        # Get comprehensive statistics
-        total_patients = User.objects.filter(userprofile__role='patient').count()
-        total_appointments = Appointment.objects.count()
+        # Get comprehensive statistics (appointment and revenue counters come from the daily rollup)
+        totals = dashboard_totals()
         total_services = Service.objects.filter(is_available=True).count()
         total_departments = Department.objects.filter(is_active=True).count()
         
-        # Today's statistics
-        today = timezone.now().date()
-        today_appointments = Appointment.objects.filter(appointment_date__date=today).count()
-        pending_appointments = Appointment.objects.filter(status='pending').count()
-        
-        # Revenue statistics
-        total_revenue = Payment.objects.filter(payment_status='completed').aggregate(
-            total=Sum('amount'))['total'] or 0
-        
         # Recent data
         departments = Department.objects.filter(is_active=True).prefetch_related('services')[:6]
         services = Service.objects.filter(is_available=True).select_related('department')[:8]
@@ -89,18 +83,10 @@ def home(request):
         satisfaction_rate = 98.5
         
         # Monthly appointment trends for chart
-        monthly_data = []
-        for i in range(6):
-            month_start = (today.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            count = Appointment.objects.filter(
-                appointment_date__date__range=[month_start, month_end]
-            ).count()
-            monthly_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'count': count
-            })
-        monthly_data.reverse()
+        monthly_data = [
+            {'month': item['period'].strftime('%b %Y'), 'count': item['count']}
+            for item in time_series(Appointment.objects.all(), 'appointment_date', 'month', periods=6)
+        ]
         
         # Service popularity
         popular_services = Service.objects.annotate(
@@ -109,13 +95,13 @@ def home(request):
         
         context = {
             'stats': {
-                'total_patients': total_patients,
-                'total_appointments': total_appointments,
+                'total_patients': totals['total_patients'],
+                'total_appointments': totals['total_appointments'],
                 'total_services': total_services,
                 'total_departments': total_departments,
-                'today_appointments': today_appointments,
-                'pending_appointments': pending_appointments,
-                'total_revenue': total_revenue,
+                'today_appointments': totals['today_appointments'],
+                'pending_appointments': totals['pending_appointments'],
+                'total_revenue': totals['total_revenue'],
                 'satisfaction_rate': satisfaction_rate,
             },
             'departments': departments,
@@ -214,7 +200,7 @@ def register_view(request):
         if password != confirm_password:
             errors.append('Passwords do not match.')
         
-        if len(password) &lt; 8:
+        if len(password) < 8:
             errors.append('Password must be at least 8 characters long.')
         
         if User.objects.filter(username=username).exists():
@@ -294,7 +280,9 @@ def patient_dashboard(request):
         return redirect('home')
     
     # Get user appointments
-    appointments = Appointment.objects.filter(patient=request.user).order_by('-appointment_date')
+    appointments = Appointment.objects.filter(patient=request.user).select_related(
+        'service__department'
+    ).order_by('-appointment_date')
     
     # Pagination
     paginator = Paginator(appointments, 10)
@@ -331,7 +319,10 @@ def patient_dashboard(request):
     ).first()
     
     # Generate appointment history chart
-    appointment_chart = generate_patient_appointment_chart(request.user)
+    chart_mode = get_chart_mode(request)
+    appointment_chart = None
+    if chart_mode == 'server':
+        appointment_chart = generate_patient_appointment_chart(request.user)
     
     # Get payment history
     payments = Payment.objects.filter(
@@ -345,6 +336,7 @@ def patient_dashboard(request):
         'stats': stats,
         'next_appointment': next_appointment,
         'appointment_chart': appointment_chart,
+        'chart_mode': chart_mode,
         'payments': payments,
     }
     
@@ -360,31 +352,10 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied. Administrator access required.')
         return redirect('home')
     
-    # Date ranges
-    today = timezone.now().date()
-    this_week = today - timedelta(days=7)
-    this_month = today.replace(day=1)
-    last_month = (this_month - timedelta(days=1)).replace(day=1)
-    
-    # Comprehensive statistics
-    stats = {
-        'total_patients': User.objects.filter(userprofile__role='patient').count(),
-        'total_appointments': Appointment.objects.count(),
-        'today_appointments': Appointment.objects.filter(appointment_date__date=today).count(),
-        'pending_appointments': Appointment.objects.filter(status='pending').count(),
-        'completed_appointments': Appointment.objects.filter(status='completed').count(),
-        'total_revenue': Payment.objects.filter(payment_status='completed').aggregate(
-            total=Sum('amount'))['total'] or 0,
-        'monthly_revenue': Payment.objects.filter(
-            payment_date__gte=this_month,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0,
-        'weekly_appointments': Appointment.objects.filter(
-            created_at__gte=this_week
-        ).count(),
-        'total_services': Service.objects.filter(is_available=True).count(),
-        'total_departments': Department.objects.filter(is_active=True).count(),
-    }
+    # Comprehensive statistics (read from the daily rollup)
+    stats = dashboard_totals()
+    stats['total_services'] = Service.objects.filter(is_available=True).count()
+    stats['total_departments'] = Department.objects.filter(is_active=True).count()
     
     # Recent activities
     recent_appointments = Appointment.objects.select_related(
@@ -401,17 +372,20 @@ def admin_dashboard(request):
     
     # Department statistics
     department_stats = Department.objects.annotate(
-        appointment_count=Count('services__appointments'),
-        revenue=Sum('services__appointments__payments__amount')
+        appointment_count=Sum('daily_stats__appointments'),
+        revenue=Sum('daily_stats__revenue')
     ).filter(is_active=True)
     
-    # Generate charts
-    charts = {
-        'monthly_appointments': generate_monthly_appointments_chart(),
-        'revenue_chart': generate_revenue_chart(),
-        'service_popularity': generate_service_popularity_chart(),
-        'patient_demographics': generate_patient_demographics_chart(),
-    }
+    # Generate charts (client mode draws them in the browser from /api/charts/)
+    chart_mode = get_chart_mode(request)
+    charts = {}
+    if chart_mode == 'server':
+        charts = {
+            'monthly_appointments': generate_monthly_appointments_chart(),
+            'revenue_chart': generate_revenue_chart(),
+            'service_popularity': generate_service_popularity_chart(),
+            'patient_demographics': generate_patient_demographics_chart(),
+        }
     
     # Service popularity
     popular_services = Service.objects.annotate(
@@ -432,6 +406,7 @@ def admin_dashboard(request):
         'popular_services': popular_services,
         'recent_patients': recent_patients,
         'charts': charts,
+        'chart_mode': chart_mode,
     }
     
     # Create audit log
@@ -463,21 +438,10 @@ def book_appointment(request):
             appointment_datetime = timezone.make_aware(appointment_datetime)
             
             # Check if appointment is in the future
-            if appointment_datetime &lt;= timezone.now():
+            if appointment_datetime <= timezone.now():
                 messages.error(request, 'Please select a future date and time.')
                 return redirect('book_appointment')
             
-            # Check for conflicts
-            existing_appointment = Appointment.objects.filter(
-                patient=request.user,
-                appointment_date=appointment_datetime,
-                status__in=['pending', 'confirmed']
-            ).exists()
-            
-            if existing_appointment:
-                messages.error(request, 'You already have an appointment at this time.')
-                return redirect('book_appointment')
-            
             # Calculate pricing
             total_amount = service.price
             discount_amount = 0
@@ -492,11 +456,11 @@ def book_appointment(request):
             elif financial_assistance == 'student':
                 discount_amount = total_amount * 0.15  # 15% student discount
             
-            # Create appointment
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                service=service,
-                appointment_date=appointment_datetime,
+            # Create appointment; raises SlotUnavailable on an overlapping appointment or a full slot
+            appointment = slots.book(
+                request.user,
+                service,
+                appointment_datetime,
                 total_amount=total_amount,
                 discount_amount=discount_amount,
                 final_amount=total_amount - discount_amount,
@@ -520,6 +484,10 @@ def book_appointment(request):
             messages.success(request, f'Appointment booked successfully! Your appointment ID is {appointment.appointment_id}.')
             return redirect('patient_dashboard')
             
+        except slots.SlotUnavailable as e:
+            messages.error(request, str(e))
+            return redirect('book_appointment')
+            
         except Exception as e:
             messages.error(request, f'Failed to book appointment: {str(e)}')
             return redirect('book_appointment')
@@ -719,44 +687,20 @@ def logout_view(request):
     return redirect('home')
 
 # Chart generation functions
+def get_chart_mode(request):
+    """'server' for cached images, 'client' for drawing charts in the browser"""
+    mode = request.GET.get('charts', settings.DASHBOARD_CHART_MODE)
+    return mode if mode in ('server', 'client') else 'server'
+
 def generate_patient_appointment_chart(user):
     """Generate appointment history chart for patient"""
     try:
-        # Get last 6 months of appointments
-        appointments = Appointment.objects.filter(
-            patient=user,
-            appointment_date__gte=timezone.now() - timedelta(days=180)
-        ).extra(
-            select={'month': "strftime('%%Y-%%m', appointment_date)"}
-        ).values('month').annotate(count=Count('id')).order_by('month')
+        data = chart_data.patient_history(user)
         
-        if not appointments:
+        if not any(data['counts']):
             return None
         
-        # Create chart
-        plt.figure(figsize=(10, 6))
-        months = [item['month'] for item in appointments]
-        counts = [item['count'] for item in appointments]
-        
-        plt.bar(months, counts, color='#667eea', alpha=0.8)
-        plt.title('Your Appointment History (Last 6 Months)')
-        plt.xlabel('Month')
-        plt.ylabel('Number of Appointments')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        graphic = base64.b64encode(image_png)
-        graphic = graphic.decode('utf-8')
-        
-        return graphic
+        return chart_url('patient_history', data)
         
     except Exception as e:
         print(f"Error generating patient chart: {e}")
@@ -765,47 +709,7 @@ def generate_patient_appointment_chart(user):
 def generate_monthly_appointments_chart():
     """Generate monthly appointments chart for admin"""
     try:
-        # Get last 12 months of data
-        today = timezone.now().date()
-        months_data = []
-        
-        for i in range(12):
-            month_start = (today.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            count = Appointment.objects.filter(
-                appointment_date__date__range=[month_start, month_end]
-            ).count()
-            months_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'count': count
-            })
-        
-        months_data.reverse()
-        
-        # Create chart
-        plt.figure(figsize=(12, 6))
-        months = [item['month'] for item in months_data]
-        counts = [item['count'] for item in months_data]
-        
-        plt.plot(months, counts, marker='o', linewidth=2, markersize=6, color='#667eea')
-        plt.fill_between(months, counts, alpha=0.3, color='#667eea')
-        plt.title('Monthly Appointments Trend')
-        plt.xlabel('Month')
-        plt.ylabel('Number of Appointments')
-        plt.xticks(rotation=45)
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        graphic = base64.b64encode(image_png)
-        return graphic.decode('utf-8')
+        return chart_url('monthly_appointments', chart_data.monthly_appointments())
         
     except Exception as e:
         print(f"Error generating monthly appointments chart: {e}")
@@ -814,53 +718,7 @@ def generate_monthly_appointments_chart():
 def generate_revenue_chart():
     """Generate revenue chart for admin"""
     try:
-        # Get last 6 months of revenue data
-        today = timezone.now().date()
-        revenue_data = []
-        
-        for i in range(6):
-            month_start = (today.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-            month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            revenue = Payment.objects.filter(
-                payment_date__date__range=[month_start, month_end],
-                payment_status='completed'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            revenue_data.append({
-                'month': month_start.strftime('%b %Y'),
-                'revenue': float(revenue)
-            })
-        
-        revenue_data.reverse()
-        
-        # Create chart
-        plt.figure(figsize=(10, 6))
-        months = [item['month'] for item in revenue_data]
-        revenues = [item['revenue'] for item in revenue_data]
-        
-        bars = plt.bar(months, revenues, color='#4facfe', alpha=0.8)
-        plt.title('Monthly Revenue')
-        plt.xlabel('Month')
-        plt.ylabel('Revenue (₱)')
-        plt.xticks(rotation=45)
-        
-        # Add value labels on bars
-        for bar, revenue in zip(bars, revenues):
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height,
-                    f'₱{revenue:,.0f}', ha='center', va='bottom')
-        
-        plt.tight_layout()
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        graphic = base64.b64encode(image_png)
-        return graphic.decode('utf-8')
+        return chart_url('revenue', chart_data.revenue())
         
     except Exception as e:
         print(f"Error generating revenue chart: {e}")
@@ -869,42 +727,12 @@ def generate_revenue_chart():
 def generate_service_popularity_chart():
     """Generate service popularity chart"""
     try:
-        # Get top 10 most booked services
-        services = Service.objects.annotate(
-            booking_count=Count('appointments')
-        ).order_by('-booking_count')[:10]
+        data = chart_data.service_popularity()
         
-        if not services:
+        if not data['labels']:
             return None
         
-        # Create chart
-        plt.figure(figsize=(12, 8))
-        service_names = [service.name[:20] + '...' if len(service.name) > 20 else service.name for service in services]
-        booking_counts = [service.booking_count for service in services]
-        
-        bars = plt.barh(service_names, booking_counts, color='#f093fb')
-        plt.title('Most Popular Services')
-        plt.xlabel('Number of Bookings')
-        plt.ylabel('Services')
-        
-        # Add value labels
-        for bar, count in zip(bars, booking_counts):
-            width = bar.get_width()
-            plt.text(width, bar.get_y() + bar.get_height()/2.,
-                    f'{count}', ha='left', va='center', fontweight='bold')
-        
-        plt.tight_layout()
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        graphic = base64.b64encode(image_png)
-        return graphic.decode('utf-8')
+        return chart_url('service_popularity', data)
         
     except Exception as e:
         print(f"Error generating service popularity chart: {e}")
@@ -913,168 +741,223 @@ def generate_service_popularity_chart():
 def generate_patient_demographics_chart():
     """Generate patient demographics chart"""
     try:
-        # Get age distribution
-        from django.db.models import Case, When, IntegerField
-        from datetime import date
-        
-        today = date.today()
-        age_groups = UserProfile.objects.filter(
-            role='patient',
-            date_of_birth__isnull=False
-        ).extra(
-            select={
-                'age': f"(julianday('now') - julianday(date_of_birth)) / 365.25"
-            }
-        ).extra(
-            select={
-                'age_group': """
-                CASE 
-                    WHEN age &lt; 18 THEN 'Under 18'
-                    WHEN age &lt; 30 THEN '18-29'
-                    WHEN age &lt; 45 THEN '30-44'
-                    WHEN age &lt; 60 THEN '45-59'
-                    ELSE '60+'
-                END
-                """
-            }
-        ).values('age_group').annotate(count=Count('id')).order_by('age_group')
+        data = chart_data.patient_demographics()
         
-        if not age_groups:
+        if not any(data['counts']):
             return None
         
-        # Create pie chart
-        plt.figure(figsize=(8, 8))
-        labels = [item['age_group'] for item in age_groups]
-        sizes = [item['count'] for item in age_groups]
-        colors = ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe']
-        
-        plt.pie(sizes, labels=labels, colors=colors[:len(labels)], autopct='%1.1f%%', startangle=90)
-        plt.title('Patient Age Distribution')
-        plt.axis('equal')
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        graphic = base64.b64encode(image_png)
-        return graphic.decode('utf-8')
+        return chart_url('patient_demographics', data)
         
     except Exception as e:
         print(f"Error generating demographics chart: {e}")
         return None
 
-# Export functions
 @login_required
-def export_appointments_csv(request):
-    """Export appointments to CSV"""
-    if request.user.userprofile.role != 'admin':
-        return JsonResponse({'error': 'Access denied'})
+@condition(etag_func=lambda request, name, digest, fmt: digest)
+def chart_image(request, name, digest, fmt):
+    """Serve a cached chart image; the digest doubles as a strong ETag"""
+    if name not in RENDERERS or fmt not in FORMATS or not re.fullmatch(r'[0-9a-f]{32}', digest):
+        raise Http404('Unknown chart')
+    if name in ADMIN_CHARTS and request.user.userprofile.role != 'admin':
+        return HttpResponse(status=403)
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+    try:
+        path = ensure_chart(name, digest, fmt)
+    except ChartPending:
+        response = HttpResponse('The chart is still being drawn', status=503, content_type='text/plain')
+        response['Retry-After'] = str(RETRY_AFTER)
+        patch_cache_control(response, no_store=True)
+        return response
+    if path is None:
+        raise Http404('Unknown chart')
     
-    writer = csv.writer(response)
-    writer.writerow([
-        'Appointment ID', 'Patient Name', 'Email', 'Phone', 'Service', 
-        'Department', 'Date', 'Status', 'Payment Status', 'Amount', 
-        'Discount', 'Final Amount', 'Created At'
-    ])
+    response = FileResponse(open(path, 'rb'), content_type=FORMATS[fmt])
+    patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+    return response
+
+@login_required
+def chart_data_api(request, name):
+    """
+    JSON data series for a dashboard chart, for drawing it in the browser.
+
+    ``?since=<ISO datetime>`` limits the response to the buckets that changed
+    after that moment; pass the previous response's ``generated_at``.
+    """
+    if name not in chart_data.SERIES:
+        return JsonResponse({'error': 'Unknown chart'}, status=404)
+    if name in ADMIN_CHARTS and request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    since = request.GET.get('since')
+    if since:
+        parsed = parse_datetime(since)
+        if parsed is None:
+            day = parse_date(since)
+            parsed = datetime.combine(day, datetime.min.time()) if day else None
+        if parsed is None:
+            return JsonResponse({'error': 'Invalid since parameter'}, status=400)
+        if settings.USE_TZ and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        since = parsed
+    else:
+        since = None
+
+    generated_at = timezone.now()
+    data = chart_data.chart_series(name, request.user, since=since)
+    etag = quote_etag(chart_digest(name, data))
+    modified = chart_data.last_modified(name, request.user)
+    modified = int(modified.timestamp()) if modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = JsonResponse({
+            'chart': name,
+            'granularity': chart_data.GRANULARITY if 'periods' in data else None,
+            'partial': since is not None,
+            'generated_at': generated_at.isoformat(),
+            **data,
+        })
+    response.headers['ETag'] = etag
+    if modified:
+        response.headers['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, private=True, max_age=settings.CHART_DATA_MAX_AGE)
+    return response
+
+@login_required
+def age_groups_api(request):
+    """Patients per age group, read from the precomputed histogram"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    appointments = Appointment.objects.select_related(
-        'patient', 'patient__userprofile', 'service', 'service__department'
-    ).all()
+    return JsonResponse({
+        'as_of': histogram_as_of().isoformat(),
+        'age_groups': age_group_counts(),
+    })
+
+# Export functions
+def _export_appointments(request, fmt):
+    """The appointments matching the ``listing`` filters as an ``exports`` download in ``fmt``"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'})
     
-    for appointment in appointments:
-        writer.writerow([
-            appointment.appointment_id,
-            appointment.patient.get_full_name(),
-            appointment.patient.email,
-            appointment.patient.userprofile.phone_number,
-            appointment.service.name,
-            appointment.service.department.name,
-            appointment.appointment_date.strftime('%Y-%m-%d %H:%M'),
-            appointment.get_status_display(),
-            appointment.get_payment_status_display(),
-            appointment.total_amount,
-            appointment.discount_amount,
-            appointment.final_amount,
-            appointment.created_at.strftime('%Y-%m-%d %H:%M')
-        ])
+    try:
+        filters = listing.parse_filters(request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
     
-    create_audit_log(request, 'export', 'Appointments')
+    response = exports.response(exports.APPOINTMENTS, fmt, exports.APPOINTMENTS.rows(listing.appointments(filters)))
+    create_audit_log(request, 'export', 'Appointments', changes=filters)
     return response
 
+@login_required
+def export_appointments_csv(request):
+    """Export the appointments matching the ``listing`` filters to CSV, streamed so memory stays flat"""
+    return _export_appointments(request, 'csv')
+
 @login_required
 def export_appointments_excel(request):
-    """Export appointments to Excel"""
+    """Export the appointments matching the ``listing`` filters to Excel, written row by row to a temporary file"""
+    return _export_appointments(request, 'xlsx')
+
+# API Views
+
+@login_required
+def appointment_listing_api(request):
+    """
+    Appointments matching the ``listing`` filters, a page at a time in date order.
+
+    Pass the previous response's ``next_cursor`` as ``?cursor=`` (or follow
+    ``next``) for the following page; ``?limit=`` sets the page size.
+    """
     if request.user.userprofile.role != 'admin':
-        return JsonResponse({'error': 'Access denied'})
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Appointments"
+    try:
+        filters = listing.parse_filters(request.GET)
+        results, next_cursor = listing.page(
+            listing.appointments(filters), request.GET.get('cursor'), listing.page_size(request.GET)
+        )
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
     
-    # Headers
-    headers = [
-        'Appointment ID', 'Patient Name', 'Email', 'Phone', 'Service', 
-        'Department', 'Date', 'Status', 'Payment Status', 'Amount', 
-        'Discount', 'Final Amount', 'Created At'
-    ]
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({'results': results, 'next_cursor': next_cursor, 'next': next_url})
+
+
+@login_required
+@require_http_methods(["POST"])
+def create_export_job(request):
+    """Queue an export of the rows matching the ``listing`` filters; answers with the job's status"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
+    export = request.POST.get('export', 'appointments')
+    fmt = request.POST.get('format', 'csv')
+    if not export_jobs.supports(export, fmt):
+        return JsonResponse({'error': 'Unknown export or format'}, status=400)
     
-    # Data
-    appointments = Appointment.objects.select_related(
-        'patient', 'patient__userprofile', 'service', 'service__department'
-    ).all()
+    try:
+        filters = listing.parse_filters(request.POST)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
     
-    for row, appointment in enumerate(appointments, 2):
-        ws.cell(row=row, column=1, value=appointment.appointment_id)
-        ws.cell(row=row, column=2, value=appointment.patient.get_full_name())
-        ws.cell(row=row, column=3, value=appointment.patient.email)
-        ws.cell(row=row, column=4, value=appointment.patient.userprofile.phone_number)
-        ws.cell(row=row, column=5, value=appointment.service.name)
-        ws.cell(row=row, column=6, value=appointment.service.department.name)
-        ws.cell(row=row, column=7, value=appointment.appointment_date.strftime('%Y-%m-%d %H:%M'))
-        ws.cell(row=row, column=8, value=appointment.get_status_display())
-        ws.cell(row=row, column=9, value=appointment.get_payment_status_display())
-        ws.cell(row=row, column=10, value=float(appointment.total_amount))
-        ws.cell(row=row, column=11, value=float(appointment.discount_amount))
-        ws.cell(row=row, column=12, value=float(appointment.final_amount))
-        ws.cell(row=row, column=13, value=appointment.created_at.strftime('%Y-%m-%d %H:%M'))
+    job = export_jobs.submit(request.user, export, fmt, filters)
+    create_audit_log(request, 'export', 'ExportJob', job.pk, {'export': export, 'format': fmt, 'filters': filters})
+    return JsonResponse(export_jobs.describe(job), status=202)
+
+@login_required
+def export_job_status(request, job_id):
+    """Status and progress of a background export, for polling"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    job = get_object_or_404(ExportJob, pk=job_id)
+    return JsonResponse(export_jobs.describe(job))
+
+@login_required
+def download_export_job(request, job_id):
+    """Download the file of a finished background export"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    # Create response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    job = get_object_or_404(ExportJob, pk=job_id)
+    if job.status != 'completed' or not job.file:
+        raise Http404('This export has no file to download')
+    # Formats the export engine writes have a known type; others are guessed from the file name
+    content_type = exports.FORMATS[job.format][0] if job.format in exports.FORMATS else None
+    return FileResponse(
+        job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name), content_type=content_type
     )
-    response['Content-Disposition'] = 'attachment; filename="appointments.xlsx"'
-    
-    wb.save(response)
-    create_audit_log(request, 'export', 'Appointments')
-    return response
 
-# API Views
+def _document_response(kind, pk, filename):
+    """The PDF of a document, shown in the browser; drawn first only if its data changed since it was last drawn"""
+    name = documents.ensure(kind, pk)
+    return FileResponse(documents.DOCUMENTS[kind].storage.open(name, 'rb'), filename=filename, content_type='application/pdf')
+
+@login_required
+def test_result_pdf(request, result_id):
+    """PDF report of a test result; patients may only open their own released results"""
+    result = get_object_or_404(TestResult.objects.select_related('appointment'), pk=result_id)
+    if request.user.userprofile.role == 'patient' and (
+        result.appointment.patient_id != request.user.pk or result.status != 'released'
+    ):
+        return HttpResponse(status=403)
+    create_audit_log(request, 'view', 'TestResult', result.pk)
+    return _document_response('results', result.pk, f'result-{result.appointment.appointment_id}.pdf')
+
+@login_required
+def medical_certificate_pdf(request, certificate_id):
+    """PDF of a medical certificate; patients may only open their own"""
+    certificate = get_object_or_404(MedicalCertificate, pk=certificate_id)
+    if request.user.userprofile.role == 'patient' and certificate.patient_id != request.user.pk:
+        return HttpResponse(status=403)
+    create_audit_log(request, 'view', 'MedicalCertificate', certificate.pk)
+    return _document_response('certificates', certificate.pk, f'{certificate.certificate_number}.pdf')
+
 @login_required
 def get_services_by_department(request, department_id):
     """Get services filtered by department"""
@@ -1099,21 +982,83 @@ def check_appointment_availability(request):
         appointment_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
         appointment_datetime = timezone.make_aware(appointment_datetime)
         
-        # Check if slot is taken
-        existing = Appointment.objects.filter(
-            appointment_date=appointment_datetime,
-            service_id=service_id,
-            status__in=['pending', 'confirmed']
-        ).exists()
+        # Look up the slot containing the requested time
+        slot = slots.find_slot(service_id, appointment_datetime)
+        if slot is None:
+            return JsonResponse({'available': False, 'message': 'Outside operating hours'})
         
         return JsonResponse({
-            'available': not existing,
-            'message': 'Slot available' if not existing else 'Slot already taken'
+            'available': slot.remaining > 0,
+            'remaining': slot.remaining,
+            'slot_start': slot.start.isoformat(),
+            'slot_end': slot.end.isoformat(),
+            'message': 'Slot available' if slot.remaining > 0 else 'Slot already taken'
         })
         
     except ValueError:
         return JsonResponse({'available': False, 'message': 'Invalid date/time format'})
 
+@login_required
+def week_availability(request):
+    """Free slots of one service, or every service of a department, over a range of days"""
+    service_id = request.GET.get('service_id')
+    department_id = request.GET.get('department_id')
+    if not service_id and not department_id:
+        return JsonResponse({'error': 'service_id or department_id is required'}, status=400)
+    for name, value in (('service_id', service_id), ('department_id', department_id)):
+        if value and not value.isdecimal():
+            return JsonResponse({'error': f'{name} must be an id'}, status=400)
+
+    today = timezone.localdate()
+    try:
+        start_day = parse_date(request.GET['start']) if request.GET.get('start') else today
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        start_day = None
+    if start_day is None or days < 1:
+        return JsonResponse({'error': 'Invalid start date or number of days'}, status=400)
+    # Nothing can be booked in the past, and slots are only generated up to the booking horizon
+    if not today <= start_day <= today + timedelta(days=settings.SLOT_BOOKING_HORIZON_DAYS):
+        return JsonResponse({'error': 'start must be between today and the end of the booking horizon'}, status=400)
+
+    days = min(days, slots.MAX_CALENDAR_DAYS)
+
+    services = Service.objects.filter(is_available=True)
+    if service_id:
+        services = services.filter(pk=service_id)
+    if department_id:
+        services = services.filter(department_id=department_id)
+    services = list(services.order_by('name'))
+
+    free = slots.free_slots(services, start_day, days)
+    return JsonResponse({
+        'start': start_day.isoformat(),
+        'days': days,
+        'services': [{
+            'id': service.pk,
+            'name': service.name,
+            'duration_minutes': service.duration_minutes,
+            'days': [{
+                'date': day.isoformat(),
+                'slots': [{
+                    'start': slot['start'].isoformat(),
+                    'end': slot['end'].isoformat(),
+                    'time': timezone.localtime(slot['start']).strftime('%H:%M'),
+                    'remaining': slot['remaining'],
+                } for slot in day_slots],
+            } for day, day_slots in sorted(free[service.pk].items())],
+        } for service in services],
+    })
+
+def metrics(request):
+    """Per-view request metrics in the Prometheus text format (administrators or METRICS_TOKEN only)"""
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    admin = request.user.is_authenticated and request.user.userprofile.role == 'admin'
+    if not (scraper or admin):
+        return HttpResponse('Access denied', status=403, content_type='text/plain')
+    return HttpResponse(instrumentation.METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Password reset views
 def password_reset_request(request):
     """Handle password reset requests"""
@@ -7,7 +7,7 @@ from django.utils.safestring import mark_safe
 from .models import (
     UserProfile, Department, Service, Appointment, 
     TestResult, Payment, MedicalCertificate, Notification, 
-    AuditLog, SystemSettings
+    AuditLog, SystemSettings, DailyStats, TimeSlot, ExportJob
 )
 
 # Unregister the default User admin
@@ -87,7 +87,7 @@ class ServiceAdmin(admin.ModelAdmin):
             'fields': ('name', 'department', 'description')
         }),
         ('Pricing & Duration', {
-            'fields': ('price', 'duration_minutes')
+            'fields': ('price', 'duration_minutes', 'slot_capacity')
         }),
         ('Requirements', {
             'fields': ('requires_fasting', 'requires_appointment', 'preparation_instructions')
@@ -255,6 +255,40 @@ class SystemSettingsAdmin(admin.ModelAdmin):
         return obj.value[:100] + '...' if len(obj.value) > 100 else obj.value
     value_preview.short_description = 'Value'
 
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'department', 'appointments', 'pending', 'completed', 'booked', 'revenue', 'new_patients']
+    list_filter = ['department', 'date']
+    date_hierarchy = 'date'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(TimeSlot)
+class TimeSlotAdmin(admin.ModelAdmin):
+    list_display = ['service', 'start', 'end', 'capacity', 'remaining']
+    list_filter = ['service__department', 'service']
+    date_hierarchy = 'start'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['export', 'format', 'status', 'progress', 'rows_written', 'requested_by', 'created_at', 'expires_at']
+    list_filter = ['status', 'export', 'format']
+    readonly_fields = ['progress', 'rows_total', 'rows_written', 'file', 'error', 'worker', 'heartbeat_at',
+                       'created_at', 'started_at', 'finished_at', 'expires_at']
+    
+    def has_add_permission(self, request):
+        return False
+
 # Customize admin site
 admin.site.site_header = "MAES Laboratory Management System"
 admin.site.site_title = "MAES Lab Admin"
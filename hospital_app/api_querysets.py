@@ -0,0 +1,171 @@
+"""
+Querysets shaped after the serializer that renders them.
+
+Serializers read related rows through dotted sources such as
+``patient.get_full_name`` or ``service.department.name``, and on a bare
+queryset each of those is a query per object. ``serializer_paths`` walks the
+declared fields of a serializer class once and works out what its queryset has
+to load:
+- forward foreign keys and one-to-one relations on the way are joined with
+  ``select_related``,
+- many-to-many and reverse foreign keys are fetched with ``prefetch_related``,
+  a query per relation however many objects there are,
+- the columns read become the ``only()`` fields. A method or property such as
+  ``get_full_name`` may read any column of its model, so all of that model's
+  columns are kept; ``get_<field>_display`` only needs ``<field>``.
+A field whose source is the whole object (``source='*'``, such as
+``SerializerMethodField``) may read anything, so querysets of its serializer
+are not narrowed with ``only()``.
+
+``SerializerQuerysetMixin`` applies this to a viewset. Only reads are narrowed:
+saving an object with deferred fields loads each of them with its own query.
+On reads, ``?fields=`` names the serializer fields to send, comma-separated;
+the others are dropped from the output, and their columns and joins from the
+query.
+"""
+import re
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+DISPLAY = re.compile(r'get_(\w+)_display$')
+# Viewset actions that only read, whose querysets may be narrowed with only()
+READ_ACTIONS = {'list', 'retrieve'}
+# Shapes kept, per serializer and choice of ?fields=
+PATHS_CACHE_SIZE = 512
+
+class Paths:
+    """What a queryset of ``model`` needs to load for a serializer"""
+
+    def __init__(self):
+        self.related = set()
+        # path -> (related model, serializer of each related object or None)
+        self.prefetch = {}
+        self.columns = set()
+        self.narrow = True
+
+    def whole(self, model, path):
+        """Keep every column of ``model``, reached through ``path``"""
+        self.columns.update(path + field.name for field in model._meta.concrete_fields)
+
+def _walk(serializer, model, path, paths, names=None):
+    for name, field in serializer.fields.items():
+        if field.write_only or (names is not None and name not in names):
+            continue
+        if field.source == '*':
+            paths.narrow = False
+            if isinstance(field, serializers.Serializer):
+                _walk(field, model, path, paths)
+            continue
+        current, prefix = model, path
+        attrs = field.source.split('.')
+        for index, attr in enumerate(attrs):
+            last = index == len(attrs) - 1
+            try:
+                target = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                display = DISPLAY.match(attr)
+                if display and last:
+                    paths.columns.add(prefix + display.group(1))
+                else:
+                    paths.whole(current, prefix)
+                break
+            lookup = prefix + attr
+            if target.many_to_many or target.one_to_many:
+                child = field.child if isinstance(field, serializers.ListSerializer) and last else None
+                paths.prefetch[lookup] = (target.related_model, type(child) if child is not None else None)
+                break
+            if not target.is_relation:
+                paths.columns.add(lookup)
+                break
+            if target.concrete:
+                paths.columns.add(lookup)
+            if last and isinstance(field, serializers.PrimaryKeyRelatedField):
+                # Only the key column, which the row already has
+                break
+            paths.related.add(lookup)
+            current, prefix = target.related_model, lookup + '__'
+            if last:
+                if isinstance(field, serializers.Serializer):
+                    _walk(field, current, prefix, paths)
+                else:
+                    # Such as StringRelatedField, which may read any column
+                    paths.whole(current, prefix)
+
+@lru_cache(maxsize=None)
+def readable_fields(serializer_class):
+    """Names of the fields ``serializer_class`` sends"""
+    return frozenset(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+@lru_cache(maxsize=PATHS_CACHE_SIZE)
+def serializer_paths(serializer_class, model, names=None):
+    """
+    (select_related paths, prefetch paths with their model and serializer,
+    only() fields or None) of querysets of ``model`` rendered by
+    ``serializer_class``, with only its fields in ``names`` if given
+    """
+    paths = Paths()
+    _walk(serializer_class(), model, '', paths, names)
+    related = tuple(sorted(paths.related))
+    prefetch = tuple(sorted(paths.prefetch.items()))
+    columns = tuple(sorted(paths.columns)) if paths.narrow else None
+    return related, prefetch, columns
+
+def for_serializer(queryset, serializer_class, narrow=True, names=None, keep=()):
+    """
+    ``queryset`` loading everything ``serializer_class`` reads (its fields in
+    ``names`` if given) in a fixed number of queries; with ``narrow``, nothing
+    else but the ``keep`` columns
+    """
+    related, prefetch, columns = serializer_paths(serializer_class, queryset.model, names)
+    if related:
+        queryset = queryset.select_related(*related)
+    for lookup, (model, child) in prefetch:
+        objects = model._default_manager.all()
+        if child is not None:
+            # Prefetched querysets must keep the columns that link them back
+            objects = for_serializer(objects, child, narrow=False)
+        queryset = queryset.prefetch_related(Prefetch(lookup, queryset=objects))
+    if narrow and columns is not None:
+        queryset = queryset.only(*columns, *keep)
+    return queryset
+
+class SerializerQuerysetMixin:
+    """
+    Viewset mixin loading the rows its serializer reads along with the objects,
+    and sending only the fields named by ``?fields=`` on reads
+    """
+
+    def requested_fields(self):
+        """The serializer fields named by ``?fields=``, or None for all of them"""
+        if self.action not in READ_ACTIONS:
+            return None
+        names = frozenset(name.strip() for name in self.request.query_params.get('fields', '').split(',') if name.strip())
+        if not names:
+            return None
+        unknown = names - readable_fields(self.get_serializer_class())
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return names
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Columns the paginator reads the cursor position from
+        keep = [field.lstrip('-') for field in getattr(self, 'ordering', None) or ()]
+        return for_serializer(
+            queryset, self.get_serializer_class(), narrow=self.action in READ_ACTIONS,
+            names=self.requested_fields(), keep=keep,
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        names = self.requested_fields()
+        if names is not None:
+            fields = (serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer).fields
+            for name in list(fields):
+                if name not in names:
+                    del fields[name]
+        return serializer
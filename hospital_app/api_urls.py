@@ -3,12 +3,14 @@ from rest_framework.routers import DefaultRouter
 from . import api_views
 
 router = DefaultRouter()
-router.register(r'appointments', api_views.AppointmentViewSet)
+router.register(r'appointments', api_views.AppointmentViewSet, basename='appointment')
 router.register(r'services', api_views.ServiceViewSet)
-router.register(r'payments', api_views.PaymentViewSet)
-router.register(r'notifications', api_views.NotificationViewSet)
+router.register(r'payments', api_views.PaymentViewSet, basename='payment')
+router.register(r'notifications', api_views.NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    # Before the router, whose appointments/<pk>/ route would take it
+    path('appointments/listing/', api_views.appointment_listing, name='appointment_listing'),
     path('', include(router.urls)),
     path('dashboard-stats/', api_views.dashboard_stats, name='dashboard_stats'),
     path('appointment-calendar/', api_views.appointment_calendar, name='appointment_calendar'),
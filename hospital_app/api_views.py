@@ -7,9 +7,13 @@ from django.utils import timezone
 from datetime import timedelta
 from .models import Appointment, Service, Payment, Notification
 from .serializers import AppointmentSerializer, ServiceSerializer, PaymentSerializer, NotificationSerializer
+from .api_querysets import SerializerQuerysetMixin
+from .stats import dashboard_totals
+from . import listing
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(SerializerQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
+    ordering = ('-appointment_date', '-id')
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -17,13 +21,15 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Appointment.objects.all()
         return Appointment.objects.filter(patient=self.request.user)
 
-class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
+class ServiceViewSet(SerializerQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Service.objects.filter(is_available=True)
     serializer_class = ServiceSerializer
+    ordering = ('name', 'id')
     permission_classes = [IsAuthenticated]
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(SerializerQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
+    ordering = ('-payment_date', '-id')
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -31,8 +37,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
             return Payment.objects.all()
         return Payment.objects.filter(appointment__patient=self.request.user)
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(SerializerQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
+    ordering = ('-created_at', '-id')
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -45,19 +52,14 @@ def dashboard_stats(request):
     if request.user.userprofile.role != 'admin':
         return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
     
-    today = timezone.now().date()
-    this_month = today.replace(day=1)
-    
+    totals = dashboard_totals()
     stats = {
-        'total_patients': Appointment.objects.values('patient').distinct().count(),
-        'total_appointments': Appointment.objects.count(),
-        'today_appointments': Appointment.objects.filter(appointment_date__date=today).count(),
-        'monthly_revenue': Payment.objects.filter(
-            payment_date__gte=this_month,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0,
-        'pending_appointments': Appointment.objects.filter(status='pending').count(),
-        'completed_appointments': Appointment.objects.filter(status='completed').count(),
+        'total_patients': totals['total_patients'],
+        'total_appointments': totals['total_appointments'],
+        'today_appointments': totals['today_appointments'],
+        'monthly_revenue': totals['monthly_revenue'],
+        'pending_appointments': totals['pending_appointments'],
+        'completed_appointments': totals['completed_appointments'],
     }
     
     return Response(stats)
@@ -86,3 +88,30 @@ def appointment_calendar(request):
         })
     
     return Response(calendar_data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def appointment_listing(request):
+    """
+    Appointments matching the ``listing`` filters, a page at a time in date order.
+
+    Pass the previous response's ``next_cursor`` as ``?cursor=`` (or follow
+    ``next``) for the following page; ``?limit=`` sets the page size.
+    """
+    if request.user.userprofile.role != 'admin':
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        filters = listing.parse_filters(request.query_params)
+        results, next_cursor = listing.page(
+            listing.appointments(filters), request.query_params.get('cursor'), listing.page_size(request.query_params)
+        )
+    except ValueError as error:
+        return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    next_url = None
+    if next_cursor:
+        params = request.query_params.copy()
+        params['cursor'] = next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    return Response({'results': results, 'next_cursor': next_cursor, 'next': next_url})
@@ -0,0 +1,98 @@
+"""
+Patient documents of this app: which fields of its test results and medical
+certificates are printed, and how. Drawing and storing them lives in
+``maes_common.documents``.
+"""
+import json
+
+from maes_common.documents import Kind, PatientDocuments, date_text, moment_text
+from maes_common.exports import choice_labels, full_name
+
+from .models import MedicalCertificate, TestResult
+
+RESULT_FIELDS = (
+    'id', 'report_file', 'report_digest', 'status', 'released_at', 'result_text', 'result_data', 'is_normal',
+    'abnormal_findings', 'recommendations', 'doctor_notes', 'reviewed_by__first_name', 'reviewed_by__last_name',
+    'appointment__appointment_id', 'appointment__appointment_date',
+    'appointment__patient__first_name', 'appointment__patient__last_name',
+    'appointment__patient__userprofile__date_of_birth',
+    'appointment__service__name', 'appointment__service__sample_type', 'appointment__service__department__name',
+)
+
+CERTIFICATE_FIELDS = (
+    'id', 'certificate_file', 'certificate_digest', 'certificate_number', 'certificate_type', 'purpose',
+    'medical_findings', 'recommendations', 'restrictions', 'valid_from', 'valid_until', 'created_at', 'is_active',
+    'patient__first_name', 'patient__last_name', 'patient__userprofile__date_of_birth',
+    'issued_by__first_name', 'issued_by__last_name',
+)
+
+def result_documents(rows):
+    """(row, document) of each ``RESULT_FIELDS`` row"""
+    statuses = choice_labels(TestResult, 'status')
+    interpretations = {True: 'Normal', False: 'Abnormal', None: 'Pending review'}
+    for row in rows:
+        reviewer = full_name(row['reviewed_by__first_name'] or '', row['reviewed_by__last_name'] or '')
+        yield row, {
+            'title': 'Laboratory Test Result',
+            'number': str(row['appointment__appointment_id']),
+            'details': [
+                ('Patient', full_name(row['appointment__patient__first_name'], row['appointment__patient__last_name'])),
+                ('Date of birth', date_text(row['appointment__patient__userprofile__date_of_birth'])),
+                ('Test', row['appointment__service__name']),
+                ('Department', row['appointment__service__department__name']),
+                ('Specimen', row['appointment__service__sample_type']),
+                ('Collected', moment_text(row['appointment__appointment_date'])),
+                ('Released', moment_text(row['released_at']) or 'Not released'),
+                ('Status', statuses.get(row['status'], row['status'])),
+                ('Interpretation', interpretations[row['is_normal']]),
+            ],
+            'table': [
+                (str(name), value if isinstance(value, str) else json.dumps(value))
+                for name, value in (row['result_data'] or {}).items()
+            ],
+            'sections': [
+                ('Result', row['result_text']),
+                ('Abnormal findings', row['abnormal_findings']),
+                ('Recommendations', row['recommendations']),
+                ("Doctor's notes", row['doctor_notes']),
+            ],
+            'signature': (reviewer, 'Reviewed by') if reviewer else None,
+        }
+
+def certificate_documents(rows):
+    """(row, document) of each ``CERTIFICATE_FIELDS`` row"""
+    types = choice_labels(MedicalCertificate, 'certificate_type')
+    for row in rows:
+        yield row, {
+            'title': types.get(row['certificate_type'], row['certificate_type']),
+            'number': row['certificate_number'],
+            'details': [
+                ('Patient', full_name(row['patient__first_name'], row['patient__last_name'])),
+                ('Date of birth', date_text(row['patient__userprofile__date_of_birth'])),
+                ('Purpose', row['purpose']),
+                ('Valid from', date_text(row['valid_from'])),
+                ('Valid until', date_text(row['valid_until']) or 'Until revoked'),
+                ('Issued', moment_text(row['created_at'])),
+                ('Status', 'Active' if row['is_active'] else 'Revoked'),
+            ],
+            'sections': [
+                ('Medical findings', row['medical_findings']),
+                ('Recommendations', row['recommendations']),
+                ('Restrictions', row['restrictions']),
+            ],
+            'signature': (full_name(row['issued_by__first_name'], row['issued_by__last_name']), 'Issuing physician'),
+        }
+
+DOCUMENTS = {
+    'results': Kind(TestResult, RESULT_FIELDS, result_documents, 'report_file', 'report_digest',
+                    'result_reports', 'appointment__appointment_id', {'status': 'released'}, 'released_at'),
+    'certificates': Kind(MedicalCertificate, CERTIFICATE_FIELDS, certificate_documents, 'certificate_file',
+                         'certificate_digest', 'medical_certificates', 'certificate_number', {'is_active': True},
+                         'created_at'),
+}
+
+library = PatientDocuments(DOCUMENTS)
+
+issued = library.issued
+ensure = library.ensure
+render_stale = library.render_stale
@@ -0,0 +1,33 @@
+"""
+Exports of this app's appointments; the export engine lives in
+``maes_common.exports`` and the exports declared here are built on it.
+"""
+from maes_common.exports import Column, Export, full_name, minute
+# Also read from here by the views and reports
+from maes_common.exports import FORMATS, response  # noqa: F401
+
+from .models import Appointment
+
+APPOINTMENTS = Export('appointments', 'Appointments', Appointment, [
+    Column('appointment_id', 'Appointment ID', format=str),
+    Column('patient_name', 'Patient Name', 'patient__first_name', 'patient__last_name', format=full_name),
+    Column('service', 'Service', 'service__name'),
+    Column('date', 'Date', 'appointment_date', format=minute),
+    Column('status', 'Status', choices=True),
+    Column('payment_status', 'Payment Status', choices=True),
+    Column('amount', 'Amount', 'final_amount'),
+    Column('created_at', 'Created At', format=minute),
+])
+
+# The appointments report of ``ReportExporter``
+REPORT = Export('appointments_report', 'Appointments Report', Appointment, [
+    Column('appointment_id', 'Appointment ID', format=str),
+    Column('patient_name', 'Patient Name', 'patient__first_name', 'patient__last_name', format=full_name),
+    Column('service', 'Service', 'service__name'),
+    Column('date', 'Date', 'appointment_date', format=lambda value: value.strftime('%Y-%m-%d')),
+    Column('time', 'Time', 'appointment_date', format=lambda value: value.strftime('%H:%M')),
+    Column('status', 'Status', choices=True),
+    Column('payment_status', 'Payment Status', choices=True),
+    Column('amount', 'Amount', 'final_amount', format=lambda value: f"₱{value}"),
+    Column('notes', 'Notes', format=lambda value: value or 'N/A'),
+])
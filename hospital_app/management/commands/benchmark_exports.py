@@ -0,0 +1,4 @@
+from maes_common.commands.benchmark_exports import BenchmarkExportsCommand
+
+class Command(BenchmarkExportsCommand):
+    app_label = 'hospital_app'
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from maes_common.commands.check_query_budget import CheckQueryBudgetCommand
+
+class Command(CheckQueryBudgetCommand):
+    app_label = 'hospital_app'
+    default_budget = 20  # SESSION_SAVE_EVERY_REQUEST adds a session write to every request
+    budgets = {
+        'week_availability': 25,  # the first request of a day generates its slots
+        # API viewsets load the rows their serializers read along with the objects (api_querysets.py)
+        'appointment-list': 7,
+        'appointment-detail': 7,
+        'payment-list': 7,
+        'payment-detail': 7,
+        'service-list': 6,
+        'service-detail': 6,
+        'notification-list': 6,
+        'notification-detail': 6,
+    }
+    broken = {
+        'patient_dashboard': 'hospital_app/patient_dashboard.html is missing from templates/',
+        'admin_dashboard': 'hospital_app/admin_dashboard.html is missing from templates/',
+        'book_appointment': 'hospital_app/book_appointment.html is missing from templates/',
+        'profile': 'hospital_app/profile.html is missing from templates/',
+        'notifications': 'hospital_app/notifications.html is missing from templates/',
+        'view_appointment': 'hospital_app/view_appointment.html is missing from templates/',
+    }
+
+    def certificate_fields(self):
+        return {'medical_findings': 'No findings', 'valid_until': timezone.localdate() + timedelta(days=30)}
@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from hospital_app.models import Appointment, Notification
+from maes_common.commands.check_query_plans import CheckQueryPlansCommand
+
+class Command(CheckQueryPlansCommand):
+    app_label = 'hospital_app'
+
+    def hot_queries(self):
+        # The appointment calendar and the notifications page are only in this app
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            **super().hot_queries(),
+            'appointment calendar': Appointment.objects.filter(appointment_date__gte=today),
+            'notifications': Notification.objects.filter(user=User(pk=1)).order_by('-created_at'),
+        }
@@ -0,0 +1,4 @@
+from maes_common.commands.export_analytics import ExportAnalyticsCommand
+
+class Command(ExportAnalyticsCommand):
+    app_label = 'hospital_app'
@@ -0,0 +1,4 @@
+from maes_common.commands.generate_slots import GenerateSlotsCommand
+
+class Command(GenerateSlotsCommand):
+    app_label = 'hospital_app'
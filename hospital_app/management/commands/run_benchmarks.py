@@ -0,0 +1,4 @@
+from maes_common.commands.run_benchmarks import RunBenchmarksCommand
+
+class Command(RunBenchmarksCommand):
+    app_label = 'hospital_app'
@@ -0,0 +1,32 @@
+import uuid
+
+from django.utils import timezone
+
+from maes_common.commands.seed_lab_data import SeedLabDataCommand
+
+class Command(SeedLabDataCommand):
+    app_label = 'hospital_app'
+    # Service.sample_type is free text here, shown as entered
+    sample_types = {'blood': 'Blood', 'urine': 'Urine', 'stool': 'Stool', 'imaging': 'Imaging', 'other': ''}
+    desk_role = 'staff'
+    paid_status = 'paid'
+    notices = {
+        'booked': ('appointment_confirmed', 'Appointment Booked Successfully',
+                   'Your appointment for {service} is scheduled for {when}.'),
+        'cancelled': ('appointment_cancelled', 'Appointment Cancelled', 'Your appointment for {service} on {when} was cancelled.'),
+        'paid': ('payment_received', 'Payment Received', 'Your payment of ₱{amount} was received. Receipt {receipt}.'),
+        'released': ('test_results_ready', 'Test Results Ready', 'Your test results for {service} are now available.'),
+    }
+
+    def number_appointments(self, appointments, dates):
+        for appointment in appointments:
+            appointment.appointment_id = uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def payment(self, appointment, verifier, verified, **fields):
+        return self.Payment(
+            appointment_id=appointment.pk,
+            payment_status='completed' if appointment.payment_status == self.paid_status else 'refunded',
+            processed_by_id=verifier, verification_date=verified,
+            receipt_number=f"RCP-{timezone.localdate(fields['payment_date']).strftime('%Y%m%d')}-{self.rng.getrandbits(32):08X}",
+            **fields
+        )
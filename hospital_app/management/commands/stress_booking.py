@@ -0,0 +1,4 @@
+from maes_common.commands.stress_booking import StressBookingCommand
+
+class Command(StressBookingCommand):
+    app_label = 'hospital_app'
@@ -17,6 +17,10 @@ def test_result_path(instance, filename):
     filename = f"result_{instance.appointment.appointment_id}_{uuid.uuid4().hex[:8]}.{ext}"
     return os.path.join('test_results', filename)
 
+def export_file_path(instance, filename):
+    """Generate file path for export files, under a directory name nobody can guess"""
+    return os.path.join('exports', uuid.uuid4().hex, filename)
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('patient', 'Patient'),
@@ -81,6 +85,7 @@ class Service(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     duration_minutes = models.IntegerField(default=30, validators=[MinValueValidator(5), MaxValueValidator(480)])
+    slot_capacity = models.PositiveIntegerField(default=1, help_text="Patients that can be booked into the same time slot")
     is_available = models.BooleanField(default=True)
     requires_fasting = models.BooleanField(default=False)
     requires_appointment = models.BooleanField(default=True)
@@ -149,6 +154,25 @@ class Appointment(models.Model):
         ordering = ['-appointment_date']
         verbose_name = "Appointment"
         verbose_name_plural = "Appointments"
+        indexes = [
+            # Patient dashboard, overlap checks and charts: patient + date (+ status)
+            models.Index(fields=['patient', 'appointment_date', 'status'], name='appt_patient_date_status_idx'),
+            # Slot inventory: one service's bookings over a date range
+            models.Index(fields=['service', 'appointment_date'], name='appt_service_date_idx'),
+            # Calendar and monthly series: date ranges over all appointments; keyset
+            # pages of the listing API walk (appointment_date, id)
+            models.Index(fields=['appointment_date', 'id'], name='appt_date_idx'),
+            # Recent activity and bookings per day (query created_at ranges, not created_at__date)
+            models.Index(fields=['created_at'], name='appt_created_idx'),
+        ]
+        constraints = [
+            # A patient can hold only one active appointment at a given time
+            models.UniqueConstraint(
+                fields=['patient', 'appointment_date'],
+                condition=~models.Q(status='cancelled'),
+                name='unique_active_appointment_per_patient',
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.final_amount:
@@ -162,6 +186,29 @@ class Appointment(models.Model):
     def is_overdue(self):
         return self.appointment_date < timezone.now() and self.status in ['pending', 'confirmed']
 
+class TimeSlot(models.Model):
+    """A bookable period for one service, with the places still free in it.
+
+    Generated ahead of time from the operating hours and the service's
+    duration and slot capacity; see ``slots.py``.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='time_slots')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    capacity = models.PositiveIntegerField(default=1)
+    remaining = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['service', 'start']
+        unique_together = ['service', 'start']
+        verbose_name = "Time Slot"
+        verbose_name_plural = "Time Slots"
+    
+    def __str__(self):
+        return f"{self.service.name} - {self.start} ({self.remaining}/{self.capacity})"
+
 class TestResult(models.Model):
     RESULT_STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -174,6 +221,9 @@ class TestResult(models.Model):
     appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='test_result')
     result_file = models.FileField(upload_to=test_result_path, blank=True, null=True)
     result_data = models.JSONField(blank=True, null=True, help_text="Structured test result data")
+    # PDF report drawn from this result by documents.py, and the hash of what it shows
+    report_file = models.FileField(upload_to='result_reports/', blank=True, null=True, editable=False)
+    report_digest = models.CharField(max_length=64, blank=True, editable=False)
     result_text = models.TextField(blank=True, help_text="Text-based results")
     doctor_notes = models.TextField(blank=True)
     technician_notes = models.TextField(blank=True)
@@ -190,6 +240,12 @@ class TestResult(models.Model):
     class Meta:
         verbose_name = "Test Result"
         verbose_name_plural = "Test Results"
+        indexes = [
+            # Released results, newest first
+            models.Index(fields=['status', 'released_at'], name='result_status_released_idx'),
+            # Recent results
+            models.Index(fields=['created_at'], name='result_created_idx'),
+        ]
     
     def __str__(self):
         return f"Results for {self.appointment}"
@@ -233,6 +289,12 @@ class Payment(models.Model):
         ordering = ['-payment_date']
         verbose_name = "Payment"
         verbose_name_plural = "Payments"
+        indexes = [
+            # Revenue series over completed payments
+            models.Index(fields=['payment_status', 'payment_date'], name='payment_status_date_idx'),
+            # Recent payments
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.receipt_number:
@@ -265,6 +327,9 @@ class MedicalCertificate(models.Model):
     issued_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='issued_certificates')
     certificate_number = models.CharField(max_length=50, unique=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # PDF drawn by documents.py, and the hash of what it shows
+    certificate_file = models.FileField(upload_to='medical_certificates/', blank=True, null=True, editable=False)
+    certificate_digest = models.CharField(max_length=64, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -310,6 +375,12 @@ class Notification(models.Model):
         ordering = ['-created_at']
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
+        indexes = [
+            # Unread notifications of a user, newest first
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+            # All notifications of a user, newest first
+            models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
@@ -365,3 +436,116 @@ class SystemSettings(models.Model):
     
     def __str__(self):
         return f"{self.key}: {self.value[:50]}"
+
+class DailyStats(models.Model):
+    """Per-day, per-department rollup of dashboard counters.
+
+    Rows are kept current by the signal handlers in ``signals.py``; rows with
+    no department hold counters that are not tied to a service, such as new
+    patient registrations.
+    """
+    date = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    
+    # Appointments counted on their scheduled date
+    appointments = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    confirmed = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    sample_collected = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    no_show = models.IntegerField(default=0)
+    rescheduled = models.IntegerField(default=0)
+    
+    # Appointments counted on the date they were booked
+    booked = models.IntegerField(default=0)
+    
+    # Completed payments counted on their payment date
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    new_patients = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['date', 'department']
+        constraints = [
+            # unique_together does not stop NULL departments from repeating; one
+            # all-departments row per day
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=models.Q(department__isnull=True),
+                name='unique_daily_stats_all_departments',
+            ),
+        ]
+        verbose_name = "Daily Statistics"
+        verbose_name_plural = "Daily Statistics"
+    
+    def __str__(self):
+        return f"{self.date} - {self.department or 'All departments'}"
+
+class ExportJob(models.Model):
+    """An export written in the background by ``manage.py run_export_worker``.
+
+    The worker stores ``progress`` as it goes and the finished file in
+    ``file``; see ``export_jobs.py``.
+    """
+    EXPORT_CHOICES = [
+        ('appointments', 'Appointments'),
+        ('payments', 'Payments'),
+        ('test_results', 'Test Results'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+        ('jsonl', 'JSON Lines'),
+        ('pdf', 'PDF'),
+        ('parquet', 'Parquet'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('expired', 'Expired'),
+    ]
+    
+    export = models.CharField(max_length=30, choices=EXPORT_CHOICES, default='appointments')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    # Appointment filters, as returned by ``listing.parse_filters``
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs')
+    
+    # Progress, as a percentage of the rows counted when the job started
+    progress = models.PositiveSmallIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    
+    file = models.FileField(upload_to=export_file_path, blank=True, null=True)
+    error = models.TextField(blank=True)
+    
+    # The worker running the job, and when it last reported progress
+    worker = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # When the finished file is deleted
+    expires_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers take the oldest pending job
+            models.Index(fields=['status', 'created_at'], name='export_status_created_idx'),
+            # Clean-up of expired files
+            models.Index(fields=['status', 'expires_at'], name='export_status_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_export_display()} ({self.get_format_display()}) - {self.get_status_display()}"
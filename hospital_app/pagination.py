@@ -0,0 +1,23 @@
+"""
+Cursor pagination of the API viewsets.
+
+Each viewset declares an ``ordering`` on an indexed column, with the primary
+key as a tie-break, so the order of its rows never changes between requests.
+A page starts right after the position of the last row sent, which keeps
+later pages as cheap as the first. Rows added in the meantime never shift a
+page or make one repeat, as they would with page numbers. ``?limit=`` sets
+the page size, as it does for the appointment listing.
+"""
+from rest_framework.pagination import CursorPagination
+
+from .listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+class ApiCursorPagination(CursorPagination):
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-id',)
+
+    def get_ordering(self, request, queryset, view):
+        """The ``ordering`` of ``view``, newest primary key first by default"""
+        return tuple(getattr(view, 'ordering', None) or self.ordering)
@@ -0,0 +1,21 @@
+"""
+Slot inventory of this app's services; the booking logic lives in
+``maes_common.slots`` and is bound here to this app's models.
+"""
+# Also read from here by the views, signals and commands
+from maes_common.slots import (  # noqa: F401
+    LONGEST_APPOINTMENT, MAX_CALENDAR_DAYS, RELEASED_STATUSES, PatientConflict, SlotInventory, SlotUnavailable,
+    _aware, holds_slot, invalidate_days, operating_hours, slot_times,
+)
+
+from .models import Appointment, Service, TimeSlot
+
+inventory = SlotInventory(Appointment, Service, TimeSlot)
+
+generate_slots = inventory.generate_slots
+find_slot = inventory.find_slot
+reserve_slot = inventory.reserve_slot
+release_slot = inventory.release_slot
+free_slots = inventory.free_slots
+patient_conflict = inventory.patient_conflict
+book = inventory.book
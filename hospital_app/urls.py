@@ -23,9 +23,20 @@ urlpatterns = [
     
     # API endpoints
     path('api/chatbot/', views.chatbot_api, name='chatbot_api'),
+    path('api/availability/', views.week_availability, name='week_availability'),
+    path('metrics', views.metrics, name='metrics'),
     # path('api/services/<int:department_id>/', views.get_services_by_department, name='get_services_by_department'),
     # path('api/check-availability/', views.check_appointment_availability, name='check_appointment_availability'),
     
     # Export functionality
     # path('export/appointments/', views.export_appointments, name='export_appointments'),
+    
+    # Patient documents
+    path('results/<int:result_id>/pdf/', views.test_result_pdf, name='test_result_pdf'),
+    path('certificates/<int:certificate_id>/pdf/', views.medical_certificate_pdf, name='medical_certificate_pdf'),
+    
+    # Background exports
+    path('export/jobs/', views.create_export_job, name='create_export_job'),
+    path('export/jobs/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<int:job_id>/download/', views.download_export_job, name='download_export_job'),
 ]
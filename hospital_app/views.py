@@ -3,22 +3,29 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.utils.dateparse import parse_date
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.db.models import Count, Sum, Q, Avg
 from django.core.paginator import Paginator
 from django.core.mail import send_mail
 from django.conf import settings
 from datetime import datetime, timedelta
 import json
-import csv
+import os
+
+from maes_common import instrumentation
+from maes_common.timeseries import time_series
 
 from .models import (
     UserProfile, Department, Service, Appointment, 
-    TestResult, Payment, MedicalCertificate, Notification, AuditLog
+    TestResult, Payment, MedicalCertificate, Notification, AuditLog, ExportJob
 )
+from .stats import dashboard_totals
+from . import slots, documents, exports, export_jobs, listing
 
 def create_audit_log(request, action, model_name, object_id='', changes=None):
     """Create audit log entry"""
@@ -30,7 +37,7 @@ def create_audit_log(request, action, model_name, object_id='', changes=None):
         changes=changes,
         ip_address=get_client_ip(request),
         user_agent=request.META.get('HTTP_USER_AGENT', ''),
-        session_key=request.session.session_key
+        session_key=request.session.session_key or ''
     )
 
 def home(request):
@@ -201,7 +208,9 @@ def patient_dashboard(request):
         return redirect('home')
     
     # Get user appointments
-    appointments = Appointment.objects.filter(patient=request.user).order_by('-appointment_date')
+    appointments = Appointment.objects.filter(patient=request.user).select_related(
+        'service__department'
+    ).order_by('-appointment_date')
     
     # Pagination
     paginator = Paginator(appointments, 10)
@@ -257,29 +266,8 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied. Administrator access required.')
         return redirect('home')
     
-    # Date ranges
-    today = timezone.now().date()
-    this_week = today - timedelta(days=7)
-    this_month = today.replace(day=1)
-    last_month = (this_month - timedelta(days=1)).replace(day=1)
-    
-    # Basic statistics
-    stats = {
-        'total_patients': User.objects.filter(userprofile__role='patient').count(),
-        'total_appointments': Appointment.objects.count(),
-        'today_appointments': Appointment.objects.filter(appointment_date__date=today).count(),
-        'pending_appointments': Appointment.objects.filter(status='pending').count(),
-        'completed_appointments': Appointment.objects.filter(status='completed').count(),
-        'total_revenue': Payment.objects.filter(payment_status='completed').aggregate(
-            total=Sum('amount'))['total'] or 0,
-        'monthly_revenue': Payment.objects.filter(
-            payment_date__gte=this_month,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0,
-        'weekly_appointments': Appointment.objects.filter(
-            created_at__gte=this_week
-        ).count(),
-    }
+    # Basic statistics (read from the daily rollup)
+    stats = dashboard_totals()
     
     # Recent activities
     recent_appointments = Appointment.objects.select_related(
@@ -296,22 +284,15 @@ def admin_dashboard(request):
     
     # Department statistics
     department_stats = Department.objects.annotate(
-        appointment_count=Count('services__appointment'),
-        revenue=Sum('services__appointment__payments__amount')
+        appointment_count=Sum('daily_stats__appointments'),
+        revenue=Sum('daily_stats__revenue')
     ).filter(is_active=True)
     
     # Monthly appointment trends (last 6 months)
-    monthly_data = []
-    for i in range(6):
-        month_start = (today.replace(day=1) - timedelta(days=30*i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        count = Appointment.objects.filter(
-            appointment_date__date__range=[month_start, month_end]
-        ).count()
-        monthly_data.append({
-            'month': month_start.strftime('%B %Y'),
-            'count': count
-        })
+    monthly_data = [
+        {'month': item['period'].strftime('%B %Y'), 'count': item['count']}
+        for item in reversed(time_series(Appointment.objects.all(), 'appointment_date', 'month', periods=6))
+    ]
     
     # Service popularity
     popular_services = Service.objects.annotate(
@@ -360,17 +341,6 @@ def book_appointment(request):
                 messages.error(request, 'Please select a future date and time.')
                 return redirect('book_appointment')
             
-            # Check for conflicts (optional - can be enhanced)
-            existing_appointment = Appointment.objects.filter(
-                patient=request.user,
-                appointment_date=appointment_datetime,
-                status__in=['pending', 'confirmed']
-            ).exists()
-            
-            if existing_appointment:
-                messages.error(request, 'You already have an appointment at this time.')
-                return redirect('book_appointment')
-            
             # Calculate pricing
             total_amount = service.price
             discount_amount = 0
@@ -383,11 +353,11 @@ def book_appointment(request):
             elif financial_assistance == 'pwd':
                 discount_amount = total_amount * 0.2  # 20% PWD discount
             
-            # Create appointment
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                service=service,
-                appointment_date=appointment_datetime,
+            # Create appointment; raises SlotUnavailable on an overlapping appointment or a full slot
+            appointment = slots.book(
+                request.user,
+                service,
+                appointment_datetime,
                 total_amount=total_amount,
                 discount_amount=discount_amount,
                 final_amount=total_amount - discount_amount,
@@ -400,6 +370,10 @@ def book_appointment(request):
             messages.success(request, f'Appointment booked successfully! Your appointment ID is {appointment.appointment_id}.')
             return redirect('patient_dashboard')
             
+        except slots.SlotUnavailable as e:
+            messages.error(request, str(e))
+            return redirect('book_appointment')
+            
         except Exception as e:
             messages.error(request, 'Failed to book appointment. Please try again.')
             return redirect('book_appointment')
@@ -478,10 +452,8 @@ def notifications_view(request):
     """View all notifications"""
     notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
     
-    # Mark notifications as read when viewed
-    unread_notifications = notifications.filter(is_read=False)
-    for notification in unread_notifications:
-        notification.mark_as_read()
+    # Mark notifications as read when viewed, in one UPDATE
+    notifications.filter(is_read=False).update(is_read=True, read_at=timezone.now())
     
     # Pagination
     paginator = Paginator(notifications, 20)
@@ -674,54 +646,179 @@ def check_appointment_availability(request):
         appointment_datetime = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
         appointment_datetime = timezone.make_aware(appointment_datetime)
         
-        # Check if slot is taken
-        existing = Appointment.objects.filter(
-            appointment_date=appointment_datetime,
-            service_id=service_id,
-            status__in=['pending', 'confirmed']
-        ).exists()
+        # Look up the slot containing the requested time
+        slot = slots.find_slot(service_id, appointment_datetime)
+        if slot is None:
+            return JsonResponse({'available': False, 'message': 'Outside operating hours'})
         
         return JsonResponse({
-            'available': not existing,
-            'message': 'Slot available' if not existing else 'Slot already taken'
+            'available': slot.remaining > 0,
+            'remaining': slot.remaining,
+            'slot_start': slot.start.isoformat(),
+            'slot_end': slot.end.isoformat(),
+            'message': 'Slot available' if slot.remaining > 0 else 'Slot already taken'
         })
         
     except ValueError:
         return JsonResponse({'available': False, 'message': 'Invalid date/time format'})
 
+@login_required
+def week_availability(request):
+    """Free slots of one service, or every service of a department, over a range of days"""
+    service_id = request.GET.get('service_id')
+    department_id = request.GET.get('department_id')
+    if not service_id and not department_id:
+        return JsonResponse({'error': 'service_id or department_id is required'}, status=400)
+    for name, value in (('service_id', service_id), ('department_id', department_id)):
+        if value and not value.isdecimal():
+            return JsonResponse({'error': f'{name} must be an id'}, status=400)
+
+    today = timezone.localdate()
+    try:
+        start_day = parse_date(request.GET['start']) if request.GET.get('start') else today
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        start_day = None
+    if start_day is None or days < 1:
+        return JsonResponse({'error': 'Invalid start date or number of days'}, status=400)
+    # Nothing can be booked in the past, and slots are only generated up to the booking horizon
+    if not today <= start_day <= today + timedelta(days=settings.SLOT_BOOKING_HORIZON_DAYS):
+        return JsonResponse({'error': 'start must be between today and the end of the booking horizon'}, status=400)
+
+    days = min(days, slots.MAX_CALENDAR_DAYS)
+
+    services = Service.objects.filter(is_available=True)
+    if service_id:
+        services = services.filter(pk=service_id)
+    if department_id:
+        services = services.filter(department_id=department_id)
+    services = list(services.order_by('name'))
+
+    free = slots.free_slots(services, start_day, days)
+    return JsonResponse({
+        'start': start_day.isoformat(),
+        'days': days,
+        'services': [{
+            'id': service.pk,
+            'name': service.name,
+            'duration_minutes': service.duration_minutes,
+            'days': [{
+                'date': day.isoformat(),
+                'slots': [{
+                    'start': slot['start'].isoformat(),
+                    'end': slot['end'].isoformat(),
+                    'time': timezone.localtime(slot['start']).strftime('%H:%M'),
+                    'remaining': slot['remaining'],
+                } for slot in day_slots],
+            } for day, day_slots in sorted(free[service.pk].items())],
+        } for service in services],
+    })
+
+def metrics(request):
+    """Per-view request metrics in the Prometheus text format (administrators or METRICS_TOKEN only)"""
+    token = settings.METRICS_TOKEN
+    scraper = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    admin = request.user.is_authenticated and request.user.userprofile.role == 'admin'
+    if not (scraper or admin):
+        return HttpResponse('Access denied', status=403, content_type='text/plain')
+    return HttpResponse(instrumentation.METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def export_appointments(request):
-    """Export appointments to CSV"""
+    """
+    Export the appointments matching the ``listing`` filters in the ``format``
+    parameter (csv by default, or any other ``exports.FORMATS``); CSV and JSON
+    Lines are streamed so memory stays flat.
+    """
     if request.user.userprofile.role != 'admin':
         return JsonResponse({'error': 'Access denied'})
     
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow([
-        'Appointment ID', 'Patient Name', 'Service', 'Date', 'Status', 
-        'Payment Status', 'Amount', 'Created At'
-    ])
-    
-    appointments = Appointment.objects.select_related('patient', 'service').all()
-    for appointment in appointments:
-        writer.writerow([
-            appointment.appointment_id,
-            appointment.patient.get_full_name(),
-            appointment.service.name,
-            appointment.appointment_date.strftime('%Y-%m-%d %H:%M'),
-            appointment.get_status_display(),
-            appointment.get_payment_status_display(),
-            appointment.final_amount,
-            appointment.created_at.strftime('%Y-%m-%d %H:%M')
-        ])
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': 'Unknown format'}, status=400)
+    
+    try:
+        filters = listing.parse_filters(request.GET)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    response = exports.response(exports.APPOINTMENTS, fmt, exports.APPOINTMENTS.rows(listing.appointments(filters)))
     
     # Create audit log
-    create_audit_log(request, 'export', 'Appointments')
+    create_audit_log(request, 'export', 'Appointments', changes=dict(filters, format=fmt))
     
     return response
 
+@login_required
+@require_http_methods(["POST"])
+def create_export_job(request):
+    """Queue an export of the rows matching the ``listing`` filters; answers with the job's status"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    export = request.POST.get('export', 'appointments')
+    fmt = request.POST.get('format', 'csv')
+    if not export_jobs.supports(export, fmt):
+        return JsonResponse({'error': 'Unknown export or format'}, status=400)
+    
+    try:
+        filters = listing.parse_filters(request.POST)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    
+    job = export_jobs.submit(request.user, export, fmt, filters)
+    create_audit_log(request, 'export', 'ExportJob', job.pk, {'export': export, 'format': fmt, 'filters': filters})
+    return JsonResponse(export_jobs.describe(job), status=202)
+
+@login_required
+def export_job_status(request, job_id):
+    """Status and progress of a background export, for polling"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    job = get_object_or_404(ExportJob, pk=job_id)
+    return JsonResponse(export_jobs.describe(job))
+
+@login_required
+def download_export_job(request, job_id):
+    """Download the file of a finished background export"""
+    if request.user.userprofile.role != 'admin':
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    job = get_object_or_404(ExportJob, pk=job_id)
+    if job.status != 'completed' or not job.file:
+        raise Http404('This export has no file to download')
+    # Formats the export engine writes have a known type; others are guessed from the file name
+    content_type = exports.FORMATS[job.format][0] if job.format in exports.FORMATS else None
+    return FileResponse(
+        job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name), content_type=content_type
+    )
+
+def _document_response(kind, pk, filename):
+    """The PDF of a document, shown in the browser; drawn first only if its data changed since it was last drawn"""
+    name = documents.ensure(kind, pk)
+    return FileResponse(documents.DOCUMENTS[kind].storage.open(name, 'rb'), filename=filename, content_type='application/pdf')
+
+@login_required
+def test_result_pdf(request, result_id):
+    """PDF report of a test result; patients may only open their own released results"""
+    result = get_object_or_404(TestResult.objects.select_related('appointment'), pk=result_id)
+    if request.user.userprofile.role == 'patient' and (
+        result.appointment.patient_id != request.user.pk or result.status != 'released'
+    ):
+        return HttpResponse(status=403)
+    create_audit_log(request, 'view', 'TestResult', result.pk)
+    return _document_response('results', result.pk, f'result-{result.appointment.appointment_id}.pdf')
+
+@login_required
+def medical_certificate_pdf(request, certificate_id):
+    """PDF of a medical certificate; patients may only open their own"""
+    certificate = get_object_or_404(MedicalCertificate, pk=certificate_id)
+    if request.user.userprofile.role == 'patient' and certificate.patient_id != request.user.pk:
+        return HttpResponse(status=403)
+    create_audit_log(request, 'view', 'MedicalCertificate', certificate.pk)
+    return _document_response('certificates', certificate.pk, f'{certificate.certificate_number}.pdf')
+
 # Error handlers
 def handler404(request, exception):
     """Custom 404 error page"""
@@ -0,0 +1,126 @@
+"""
+Columnar analytics exports.
+
+Appointments, payments and test results are written as Parquet files with
+typed columns, compressed with zstd. Analysts can load them with
+``pandas.read_parquet`` without re-parsing anything:
+- Decimals stay decimal128 and timestamps stay UTC timestamps.
+- Booleans stay booleans.
+- Choice fields are dictionary-encoded strings.
+
+Each column's Arrow type is derived from the model field it is read from.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)``.
+Every ``CHUNK_SIZE`` rows are transposed into one buffer per column,
+converted to an Arrow record batch and written as a Parquet row group, so
+memory holds at most one chunk whatever the period.
+
+The tables take the appointment filters of ``listing.py``. Payments and
+results are selected through their appointment, so one set of filters gives
+three files that join on ``appointment_id``.
+
+pyarrow is only imported when a file is written. ``manage.py
+export_analytics`` writes the files directly. Background export jobs
+(``export_jobs.py``) write them in the 'parquet' format.
+
+Each app declares its tables in its ``analytics.py`` and binds an
+``AnalyticsTables`` to them, whose methods it exposes as module functions.
+"""
+import tempfile
+from itertools import islice
+
+from django.db import models
+
+from maes_common.listing import filter_appointments
+
+# Rows per Parquet row group, and per database fetch
+CHUNK_SIZE = 50000
+COMPRESSION = 'zstd'
+
+def model_field(model, path):
+    """The field at the end of a ``values_list`` path, following relations to the column they store"""
+    field = None
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            model = field.related_model
+    if field.is_relation:
+        field = field.target_field
+    return field
+
+def arrow_type(pa, field):
+    """The Arrow type of a model field's values"""
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, (models.AutoField, models.BigAutoField, models.IntegerField)):
+        return pa.int64()
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if field.choices:
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+class AnalyticsTables:
+    """
+    The analytics tables of one app: table -> (model, path from the model to
+    its appointment, [(column, field path)])
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def queryset(self, table, filters=None):
+        """The rows of ``table`` belonging to the appointments that match ``filters``"""
+        model, prefix, columns = self.tables[table]
+        return filter_appointments(model.objects.order_by('pk'), filters or {}, prefix)
+
+    def write_parquet(self, table, destination, filters=None, chunk_size=CHUNK_SIZE, progress=None):
+        """
+        Write ``table`` to ``destination`` (a path or binary file) as Parquet,
+        calling ``progress(rows_written)`` after each row group; returns the
+        number of rows written.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        model, prefix, columns = self.tables[table]
+        fields = [model_field(model, path) for name, path in columns]
+        schema = pa.schema([pa.field(name, arrow_type(pa, field)) for (name, path), field in zip(columns, fields)])
+        # Values Arrow cannot take as they come from the database
+        converters = [str if isinstance(field, models.UUIDField) else None for field in fields]
+
+        rows = self.queryset(table, filters).values_list(*[path for name, path in columns]).iterator(chunk_size=chunk_size)
+        written = 0
+        with pq.ParquetWriter(destination, schema, compression=COMPRESSION) as writer:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                arrays = []
+                for values, convert, column in zip(zip(*chunk), converters, schema):
+                    if convert is not None:
+                        values = [None if value is None else convert(value) for value in values]
+                    if pa.types.is_dictionary(column.type):
+                        arrays.append(pa.array(values, pa.string()).dictionary_encode())
+                    else:
+                        arrays.append(pa.array(values, column.type))
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                written += len(chunk)
+                if progress:
+                    progress(written)
+        return written
+
+    def parquet_file(self, table, filters=None, progress=None):
+        """Write ``table`` to a temporary Parquet file; returns the file, rewound"""
+        spool = tempfile.TemporaryFile(suffix='.parquet')
+        try:
+            self.write_parquet(table, spool, filters, progress=progress)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
@@ -0,0 +1,267 @@
+"""
+Benchmarks of the main request paths.
+
+Each scenario is one request made with the Django test client against the
+configured database, so seed it first (``manage.py seed_lab_data``). A request
+is timed until its whole body has been produced, streamed bodies included, and
+its SQL statements are counted. Requests that write are run in a transaction
+that is rolled back, so every iteration sees the same database. Peak memory is
+the most Python memory allocated while serving the request, measured with
+``tracemalloc`` on a separate run so that tracing does not slow the timed ones.
+
+``run`` returns a JSON-serialisable report for an app; each app's
+``manage.py run_benchmarks`` writes it and compares it with the report of an
+earlier commit. Scenarios whose URL is not routed in this project are
+reported as skipped.
+"""
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+from importlib import import_module
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+class Fixture:
+    """The users and objects of the app ``app_label`` the scenarios make their requests with"""
+
+    def __init__(self, app_label, patient=None, admin=None):
+        self.slots = import_module(f'{app_label}.slots')
+        Appointment, Department, Service = (apps.get_model(app_label, name) for name in ('Appointment', 'Department', 'Service'))
+        if patient:
+            self.patient = User.objects.get(username=patient)
+        else:
+            # The patient with the most appointments has the heaviest dashboard
+            busiest = Appointment.objects.values('patient').annotate(count=Count('id')).order_by('-count', 'patient').first()
+            self.patient = User.objects.get(pk=busiest['patient']) if busiest else None
+        if admin:
+            self.admin = User.objects.get(username=admin)
+        else:
+            self.admin = User.objects.filter(userprofile__role='admin').order_by('pk').first()
+        self.service = Service.objects.filter(is_available=True).order_by('pk').first()
+        self.department = Department.objects.filter(is_active=True).order_by('pk').first()
+
+    def free_slot(self):
+        """Start of the first free slot of ``service`` in the next two weeks the patient could book"""
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        for day, free in sorted(self.slots.free_slots([self.service], tomorrow, 14)[self.service.pk].items()):
+            for slot in free:
+                end = slot['start'] + timedelta(minutes=self.service.duration_minutes)
+                if not self.slots.patient_conflict(self.patient, slot['start'], end):
+                    return timezone.localtime(slot['start'])
+        return None
+
+# Each scenario returns the request to make: the URL name, and optionally
+# 'query', 'method', 'data', 'content_type', 'writes' (roll the request back)
+# and 'redirect' (the URL name a successful POST redirects to)
+def homepage(fixture):
+    return {'url': 'home'}
+
+def patient_dashboard(fixture):
+    return {'url': 'patient_dashboard'}
+
+def admin_dashboard(fixture):
+    return {'url': 'admin_dashboard'}
+
+def booking(fixture):
+    start = fixture.free_slot()
+    if start is None:
+        return None
+    return {
+        'url': 'book_appointment', 'method': 'post', 'writes': True, 'redirect': 'patient_dashboard',
+        'data': {
+            'service': fixture.service.pk, 'appointment_date': start.strftime('%Y-%m-%d'),
+            'appointment_time': start.strftime('%H:%M'), 'notes': 'Benchmark booking',
+        },
+    }
+
+def availability_check(fixture):
+    day = timezone.localdate() + timedelta(days=1)
+    return {'url': 'check_appointment_availability', 'query': f'service_id={fixture.service.pk}&date={day}&time=09:00'}
+
+def week_availability(fixture):
+    return {'url': 'week_availability', 'query': f'department_id={fixture.department.pk}'}
+
+def chatbot(fixture):
+    return {
+        'url': 'chatbot_api', 'method': 'post', 'writes': True, 'content_type': 'application/json',
+        'data': json.dumps({'message': 'What are your operating hours?'}),
+    }
+
+def export_csv(fixture):
+    return {'url': 'export_appointments_csv'}
+
+def export_excel(fixture):
+    return {'url': 'export_appointments_excel'}
+
+def api_list(url):
+    def scenario(fixture):
+        return {'url': url}
+    return scenario
+
+# name -> (role the request is made as, scenario)
+SCENARIOS = {
+    'homepage': (None, homepage),
+    'patient_dashboard': ('patient', patient_dashboard),
+    'admin_dashboard': ('admin', admin_dashboard),
+    'booking': ('patient', booking),
+    'availability_check': ('patient', availability_check),
+    'week_availability': ('patient', week_availability),
+    'chatbot': ('patient', chatbot),
+    'export_csv': ('admin', export_csv),
+    'export_excel': ('admin', export_excel),
+    'api_appointments': ('admin', api_list('appointment-list')),
+    'api_payments': ('admin', api_list('payment-list')),
+    'api_services': ('patient', api_list('service-list')),
+    'api_notifications': ('patient', api_list('notification-list')),
+}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class QueryCounter:
+    """``connection.execute_wrapper`` hook counting statements; unlike the query log it has no size limit"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+def send(client, request):
+    """Make ``request`` and read its whole body; returns the response and the body size"""
+    method = getattr(client, request.get('method', 'get'))
+    kwargs = {'content_type': request['content_type']} if 'content_type' in request else {}
+    response = method(request['path'], request.get('data'), **kwargs)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response, size
+
+def timed_request(client, request):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        if request.get('writes'):
+            with transaction.atomic():
+                response, size = send(client, request)
+                transaction.set_rollback(True)
+        else:
+            response, size = send(client, request)
+        elapsed = time.perf_counter() - started
+    return response, size, elapsed, counter.count
+
+def failure(request, response):
+    """Why ``response`` is not a successful answer to ``request``, or None"""
+    if response.status_code >= 400:
+        return f'HTTP {response.status_code}'
+    if 'redirect' in request:
+        expected = reverse(request['redirect'])
+        if response.status_code != 302 or response.url != expected:
+            return f"expected a redirect to {expected}, got HTTP {response.status_code} {getattr(response, 'url', '')}".strip()
+    return None
+
+def benchmark(fixture, name, iterations, warmup):
+    role, scenario = SCENARIOS[name]
+    user = {'patient': fixture.patient, 'admin': fixture.admin}.get(role)
+    if role and user is None:
+        return {'skipped': f'no {role} user in the database'}
+    request = scenario(fixture)
+    if request is None:
+        return {'skipped': 'the database has nothing to make this request with'}
+    try:
+        request['path'] = reverse(request['url'])
+    except NoReverseMatch:
+        return {'skipped': f"no URL named {request['url']!r} in this project"}
+    if request.get('query'):
+        request['path'] += '?' + request['query']
+
+    client = Client(raise_request_exception=False)
+    if user is not None:
+        client.force_login(user)
+
+    timings, queries, problems, size = [], [], [], 0
+    for index in range(warmup + iterations):
+        response, size, elapsed, count = timed_request(client, request)
+        problem = failure(request, response)
+        if problem:
+            problems.append(problem)
+        if index >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(count)
+
+    tracemalloc.start()
+    try:
+        timed_request(client, request)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'method': request.get('method', 'get').upper(),
+        'path': request['path'],
+        'role': role or 'anonymous',
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'queries': statistics.median_low(queries),
+        'queries_max': max(queries),
+        'peak_memory_kib': round(peak / 1024),
+        'response_bytes': size,
+        'errors': len(problems),
+        'error': problems[0] if problems else None,
+    }
+
+def commit():
+    """Short hash of the checked-out commit, with '+' when the tree has changes"""
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=str(settings.BASE_DIR), check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True,
+                               cwd=str(settings.BASE_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ('+' if dirty else '')
+
+def run(app_label, names=None, iterations=20, warmup=3, patient=None, admin=None, progress=None):
+    """Run the scenarios in ``names`` (all by default) against the app ``app_label`` and return the report"""
+    fixture = Fixture(app_label, patient, admin)
+    results = {}
+    for name in names or SCENARIOS:
+        results[name] = benchmark(fixture, name, iterations, warmup)
+        if progress:
+            progress(name, results[name])
+    return {
+        'app': app_label,
+        'commit': commit(),
+        'created': timezone.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'rows': {
+            'patients': User.objects.filter(userprofile__role='patient').count(),
+            'appointments': apps.get_model(app_label, 'Appointment').objects.count(),
+            'payments': apps.get_model(app_label, 'Payment').objects.count(),
+        },
+        'patient': fixture.patient.username if fixture.patient else None,
+        'warmup': warmup,
+        'scenarios': results,
+    }
@@ -0,0 +1,50 @@
+import time
+import tracemalloc
+from importlib import import_module
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maes_common import exports
+
+class BenchmarkExportsCommand(BaseCommand):
+    help = ('Time the appointment exports at a given row count and report their peak memory. Rows are taken from '
+            'the database and repeated up to --rows, so the writers are measured without seeding that many')
+    # The app whose appointment export is measured, set by each app's ``benchmark_exports`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500000)
+        parser.add_argument('--format', choices=list(exports.FORMATS), action='append',
+                            help='Export format to measure (default: all); may be repeated')
+        parser.add_argument('--sample', type=int, default=1000, help='Distinct database rows to repeat')
+
+    def handle(self, *args, **options):
+        self.export = import_module(f'{self.app_label}.exports').APPOINTMENTS
+        sample = list(islice(self.export.rows(), max(1, options['sample'])))
+        if not sample:
+            raise CommandError('There are no appointments to export; run seed_lab_data first')
+        count = options['rows']
+
+        self.stdout.write(f"{'format':<8} {'rows':>9} {'seconds':>9} {'rows/s':>9} {'peak MiB':>9} {'MiB out':>8}")
+        for fmt in options['format'] or exports.FORMATS:
+            elapsed, size = self.measure(fmt, sample, count)
+            # A separate traced run, so tracing does not slow the timed one
+            tracemalloc.start()
+            try:
+                self.measure(fmt, sample, count)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.stdout.write(f"{fmt:<8} {count:>9} {elapsed:>9.2f} {count / elapsed:>9.0f} "
+                              f"{peak / 2**20:>9.1f} {size / 2**20:>8.1f}")
+
+    def measure(self, fmt, sample, count):
+        """Seconds to produce the whole response body for ``count`` rows, and its size in bytes"""
+        started = time.perf_counter()
+        response = exports.response(self.export, fmt, islice(cycle(sample), count))
+        try:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        finally:
+            response.close()
+        return time.perf_counter() - started, size
@@ -0,0 +1,219 @@
+import json
+import logging
+import time
+from datetime import datetime, time as clock, timedelta
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from maes_common import slots
+from maes_common.testing import test_database
+
+class CheckQueryBudgetCommand(BaseCommand):
+    help = ('Seed a throwaway test database, request every URL of the app as a patient and as an admin, '
+            'and check that query counts stay within budget and do not grow with the number of rows')
+    # The app whose URLs are requested, set by each app's ``check_query_budget`` command with its budgets
+    app_label = None
+
+    # Most queries any endpoint may run; endpoints that legitimately need more are listed in ``budgets``
+    default_budget = 15
+    budgets = {}
+
+    # Endpoints that fail before running their real queries, and why. Their counts
+    # mean nothing, so they are not held to a budget; any other endpoint answering
+    # with a server error fails the check, and so does one listed here that works
+    broken = {}
+
+    # Endpoints that only accept POST, with the body to send
+    posts = {
+        'chatbot_api': {'message': 'What services do you offer?'},
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5, help='Patients seeded in the first round')
+        parser.add_argument('--appointments', type=int, default=3, help='Appointments per patient in the first round')
+        parser.add_argument('--growth', type=int, default=4, help='How many times more rows the second round adds')
+
+    def handle(self, *args, **options):
+        request_logger = logging.getLogger('django.request')
+        request_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with test_database():
+                failures = self.run(options)
+        finally:
+            request_logger.setLevel(request_level)
+        if failures:
+            raise CommandError('Query budget check failed:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every endpoint is within its query budget and independent of row count'))
+
+    def certificate_fields(self):
+        """Fields of the seeded medical certificate besides its patient, type, purpose, issuer and start"""
+        raise NotImplementedError
+
+    def run(self, options):
+        for name in ('Appointment', 'AuditLog', 'Department', 'ExportJob', 'MedicalCertificate', 'Notification',
+                     'Payment', 'Service', 'TestResult'):
+            setattr(self, name, apps.get_model(self.app_label, name))
+        self.slot_index = 0
+        self.setup_base()
+        self.seed(options['patients'], options['appointments'])
+        endpoints = self.endpoints()
+        small = {key: self.measure(*key) for key in endpoints}
+        self.seed(options['patients'] * options['growth'], options['appointments'] * options['growth'])
+        large = {key: self.measure(*key) for key in endpoints}
+
+        failures = []
+        failing = set()
+        self.stdout.write(f"{'endpoint':<36} {'as':<8} {'status':>6} {'queries':>9} {'grown':>7} {'budget':>7} {'ms':>8}")
+        for key in endpoints:
+            name, role = key
+            budget = self.budgets.get(name, self.default_budget)
+            (status, queries, elapsed), (grown_status, grown, grown_elapsed) = small[key], large[key]
+            problems = []
+            if max(status, grown_status) >= 500:
+                failing.add(name)
+                if name in self.broken:
+                    line = f"{name:<36} {role:<8} {grown_status:>6} {'broken: ' + self.broken[name]}"
+                    self.stdout.write(self.style.WARNING(line))
+                    continue
+                problems.append(f'status {status} with few rows, {grown_status} with more')
+            if grown > budget:
+                problems.append(f'{grown} queries, budget {budget}')
+            if grown > queries:
+                problems.append(f'grows from {queries} to {grown} queries with more rows')
+            line = f"{name:<36} {role:<8} {grown_status:>6} {queries:>9} {grown:>7} {budget:>7} {grown_elapsed * 1000:>8.1f}"
+            if problems:
+                failures.append(f"{name} as {role}: {'; '.join(problems)}")
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        for name in sorted(set(self.broken) - failing):
+            failures.append(f'{name} is listed as broken but no longer fails; give it a budget instead')
+        return failures
+
+    def setup_base(self):
+        self.admin = User.objects.create_user('budget-admin', 'budget-admin@example.com', 'x')
+        self.admin.userprofile.role = 'admin'
+        self.admin.userprofile.save()
+        self.patient = self.make_patient('budget-patient')
+        self.departments = [self.Department.objects.create(name=f'Department {index}') for index in range(2)]
+        self.services = [
+            self.Service.objects.create(
+                name=f'Service {index}', department=self.departments[index % 2], description='Seeded service',
+                price=100 + index * 50, duration_minutes=60
+            )
+            for index in range(4)
+        ]
+        self.certificate = self.MedicalCertificate.objects.create(
+            patient=self.patient, certificate_type='fitness', purpose='Employment', valid_from=timezone.localdate(),
+            issued_by=self.admin, **self.certificate_fields()
+        )
+        self.export_job = self.ExportJob.objects.create(export='appointments', format='csv', requested_by=self.admin)
+
+    def make_patient(self, username):
+        patient = User.objects.create_user(username, f'{username}@example.com', 'x', first_name='Seeded', last_name=username)
+        patient.userprofile.role = 'patient'
+        patient.userprofile.save()
+        return patient
+
+    def next_slot(self):
+        """A distinct one-hour slot on an open day, alternating past and future"""
+        while True:
+            index = self.slot_index
+            self.slot_index += 1
+            offset = (index // 10) // 2 + 1
+            day = timezone.localdate() + timedelta(days=offset if index // 10 % 2 else -offset)
+            if slots.operating_hours(day):
+                return timezone.make_aware(datetime.combine(day, clock(8 + index % 10)))
+
+    def seed(self, patients, per_patient):
+        """Add ``patients`` patients with ``per_patient`` appointments each, and as many for the measured patient"""
+        for patient in [self.patient] + [self.make_patient(f'budget-{User.objects.count()}-{index}') for index in range(patients)]:
+            for index in range(per_patient):
+                at = self.next_slot()
+                service = self.services[index % len(self.services)]
+                past = at < timezone.now()
+                appointment = self.Appointment.objects.create(
+                    patient=patient, service=service, appointment_date=at, total_amount=service.price,
+                    final_amount=service.price, status='completed' if past else 'confirmed'
+                )
+                self.Payment.objects.create(
+                    appointment=appointment, amount=service.price, payment_method='cash',
+                    payment_status='completed' if past else 'pending'
+                )
+                if past:
+                    self.TestResult.objects.create(
+                        appointment=appointment, result_text='Within normal limits', status='released',
+                        released_at=at + timedelta(days=1)
+                    )
+                self.Notification.objects.create(
+                    user=patient, notification_type='appointment_confirmed', title='Appointment booked',
+                    message=f'Your appointment for {service.name} is booked.', related_appointment=appointment
+                )
+                self.AuditLog.objects.create(user=patient, action='create', model_name='Appointment',
+                                        object_id=appointment.appointment_id)
+
+    def endpoints(self):
+        """(url name, role) for every named URL of the app in the project"""
+        names = {}
+        def walk(patterns):
+            for pattern in patterns:
+                if isinstance(pattern, URLResolver):
+                    walk(pattern.url_patterns)
+                elif isinstance(pattern, URLPattern) and pattern.name:
+                    module = getattr(pattern.callback, '__module__', '')
+                    kwargs = set(pattern.pattern.regex.groupindex)
+                    if module.startswith(f'{self.app_label}.') and 'format' not in kwargs:
+                        names.setdefault(pattern.name, kwargs)
+        walk(get_resolver().url_patterns)
+        self.url_kwargs = names
+        return [(name, role) for name in names for role in ('patient', 'admin')]
+
+    def url(self, name):
+        appointment = self.Appointment.objects.filter(patient=self.patient).order_by('pk').first()
+        samples = {
+            'department_id': self.departments[0].pk,
+            'appointment_id': appointment.appointment_id,
+            'name': 'monthly_appointments',
+            'digest': '0' * 16,
+            'fmt': 'png',
+            'job_id': self.export_job.pk,
+            'result_id': self.TestResult.objects.filter(appointment__patient=self.patient).order_by('pk').first().pk,
+            'certificate_id': self.certificate.pk,
+        }
+        # Router detail routes are named '<basename>-detail' and take the object's pk
+        objects = {
+            'appointment': appointment,
+            'service': self.services[0],
+            'payment': self.Payment.objects.filter(appointment=appointment).first(),
+            'notification': self.Notification.objects.filter(user=self.patient).order_by('pk').first(),
+        }
+        samples['pk'] = getattr(objects.get(name.split('-')[0]), 'pk', 0)
+        path = reverse(name, kwargs={key: samples[key] for key in self.url_kwargs[name]})
+        if name in ('check_appointment_availability',):
+            path += f'?service_id={self.services[0].pk}&date={timezone.localdate() + timedelta(days=2)}&time=09:00'
+        elif name == 'week_availability':
+            path += f'?department_id={self.departments[0].pk}'
+        return path
+
+    def measure(self, name, role):
+        client = Client(raise_request_exception=False)
+        client.force_login(self.patient if role == 'patient' else self.admin)
+        path = self.url(name)
+        cache.clear()
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if name in self.posts:
+                response = client.post(path, json.dumps(self.posts[name]), content_type='application/json')
+            else:
+                response = client.get(path)
+            elapsed = time.perf_counter() - started
+        return response.status_code, len(queries), elapsed
@@ -0,0 +1,109 @@
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+# Plan lines that read a whole table, per database vendor
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+SORT = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'),
+    'postgresql': re.compile(r'\bSort\b'),
+}
+
+class CheckQueryPlansCommand(BaseCommand):
+    help = 'Run EXPLAIN on the hot appointment, payment, notification and result queries and fail on full table scans'
+    # The app whose queries are explained, set by each app's ``check_query_plans`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not just the failing ones')
+        parser.add_argument('--strict', action='store_true', help='Also fail when a query has to sort its rows')
+
+    def hot_queries(self):
+        """The filters behind the dashboards, booking and slot inventory, as the views run them"""
+        Appointment, Notification, Payment, Service, TestResult = (
+            apps.get_model(self.app_label, name)
+            for name in ('Appointment', 'Notification', 'Payment', 'Service', 'TestResult')
+        )
+        patient = User(pk=1)
+        service = Service(pk=1)
+        now = timezone.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return {
+            'patient appointments': Appointment.objects.filter(patient=patient).order_by('-appointment_date'),
+            'patient pending appointments': Appointment.objects.filter(patient=patient, status='pending'),
+            'next appointment': Appointment.objects.filter(
+                patient=patient, appointment_date__gte=now, status__in=['pending', 'confirmed']
+            )[:1],
+            'patient overlap check': Appointment.objects.filter(
+                patient=patient, appointment_date__lt=now + timedelta(hours=1), appointment_date__gt=now - timedelta(hours=24)
+            ).exclude(status__in=['cancelled']),
+            'service bookings in range': Appointment.objects.filter(
+                service=service, appointment_date__gte=today, appointment_date__lt=today + timedelta(days=30)
+            ).exclude(status__in=['cancelled']),
+            'appointments in range': Appointment.objects.filter(
+                appointment_date__gte=today - timedelta(days=365), appointment_date__lt=today
+            ),
+            'appointment listing page': Appointment.objects.filter(appointment_date__gte=today).exclude(
+                appointment_date=today, id__lte=1
+            ).order_by('appointment_date', 'id')[:101],
+            "today's confirmed appointments": Appointment.objects.filter(
+                appointment_date__gte=today, appointment_date__lt=today + timedelta(days=1), status__in=['confirmed']
+            ).order_by('appointment_date', 'id')[:101],
+            'recent appointments': Appointment.objects.order_by('-created_at')[:10],
+            'appointments booked today': Appointment.objects.filter(
+                created_at__gte=today, created_at__lt=today + timedelta(days=1)
+            ),
+            'unread notifications': Notification.objects.filter(user=patient, is_read=False).order_by('-created_at')[:5],
+            'released results': TestResult.objects.filter(
+                appointment__patient=patient, status='released'
+            ).order_by('-released_at')[:5],
+            'recent results': TestResult.objects.order_by('-created_at')[:5],
+            'patient payments': Payment.objects.filter(appointment__patient=patient).order_by('-payment_date')[:5],
+            'recent payments': Payment.objects.order_by('-payment_date')[:10],
+            'completed revenue in range': Payment.objects.filter(
+                payment_status='completed', payment_date__gte=today - timedelta(days=180)
+            ),
+        }
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # On small tables a sequential scan is always cheapest; ask whether an index could be used at all
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN:
+            raise CommandError(f'Query plans can only be checked on {", ".join(FULL_SCAN)}, not {connection.vendor}')
+
+        failures = []
+        for name, queryset in self.hot_queries().items():
+            plan = self.explain(queryset)
+            scans = FULL_SCAN[connection.vendor].findall(plan)
+            sorts = SORT[connection.vendor].search(plan)
+            if scans:
+                failures.append(f"{name}: full scan of {', '.join(scans)}")
+                self.stdout.write(f"  {name:<32} {self.style.ERROR('full scan of ' + ', '.join(scans))}")
+            elif sorts:
+                if options['strict']:
+                    failures.append(f"{name}: sorts its rows")
+                self.stdout.write(f"  {name:<32} {self.style.WARNING('index used, rows sorted')}")
+            else:
+                self.stdout.write(f"  {name:<32} index used")
+            if scans or (sorts and options['strict']) or options['verbose_plans']:
+                for line in plan.splitlines():
+                    self.stdout.write(f"      {line}")
+
+        if failures:
+            raise CommandError('Query plan regression:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every hot query uses an index'))
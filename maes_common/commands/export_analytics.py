@@ -0,0 +1,53 @@
+import os
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from maes_common.analytics import CHUNK_SIZE
+
+class ExportAnalyticsCommand(BaseCommand):
+    help = ('Write appointments, payments and test results as typed, zstd-compressed Parquet files for analysis '
+            '(load them with pandas.read_parquet). Requires pyarrow')
+    # The app whose tables are written, set by each app's ``export_analytics`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        tables = import_module(f'{self.app_label}.analytics').TABLES
+        parser.add_argument('tables', nargs='*', help=f"Tables to write (default: all of {', '.join(tables)})")
+        parser.add_argument('--output-dir', default='.', help='Directory the <table>.parquet files are written to')
+        parser.add_argument('--date-from', help='First appointment date to include (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last appointment date to include (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Appointment statuses to include, comma-separated')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per row group')
+
+    def handle(self, *args, **options):
+        analytics = import_module(f'{self.app_label}.analytics')
+        listing = import_module(f'{self.app_label}.listing')
+        unknown = [table for table in options['tables'] if table not in analytics.TABLES]
+        if unknown:
+            raise CommandError(f"Unknown tables: {', '.join(unknown)}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise CommandError('Parquet exports need pyarrow: pip install pyarrow')
+
+        params = QueryDict(mutable=True)
+        for name in ('date_from', 'date_to', 'status'):
+            if options[name]:
+                params[name] = options[name]
+        try:
+            filters = listing.parse_filters(params)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        for table in options['tables'] or analytics.TABLES:
+            path = os.path.join(options['output_dir'], f'{table}.parquet')
+            started = time.perf_counter()
+            rows = analytics.write_parquet(table, path, filters, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{path}: {rows} rows, {os.path.getsize(path) / 2**20:.1f} MiB in {elapsed:.1f}s")
@@ -0,0 +1,24 @@
+from datetime import date
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+class GenerateSlotsCommand(BaseCommand):
+    help = 'Pre-generate bookable time slots for every available service; run nightly'
+    # The app whose services get slots, set by each app's ``generate_slots`` command
+    app_label = None
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Days ahead to generate (default: SLOT_BOOKING_HORIZON_DAYS)')
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to generate, YYYY-MM-DD (default: today)')
+        parser.add_argument('--service', type=int, action='append', help='Only this service id (repeatable)')
+        parser.add_argument('--rebuild', action='store_true', help='Recreate existing slots, e.g. after changing durations, capacities or hours')
+    
+    def handle(self, *args, **options):
+        slots = import_module(f'{self.app_label}.slots')
+        services = apps.get_model(self.app_label, 'Service').objects.filter(is_available=True)
+        if options['service']:
+            services = services.filter(pk__in=options['service'])
+        created = slots.generate_slots(services, options['start'], options['days'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} time slots.'))
@@ -0,0 +1,12 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+
+class RebuildDailyStatsCommand(BaseCommand):
+    help = 'Recompute the DailyStats dashboard rollup from appointments, payments and profiles'
+    # The app whose rollup is rebuilt, set by each app's ``rebuild_daily_stats`` command
+    app_label = None
+    
+    def handle(self, *args, **options):
+        count = import_module(f'{self.app_label}.stats').rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily statistics rows.'))
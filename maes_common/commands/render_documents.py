@@ -0,0 +1,50 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+class RenderDocumentsCommand(BaseCommand):
+    help = ('Draw the PDFs of test results released, and medical certificates issued, on a day (default: today) '
+            'across a process pool. Documents whose data did not change since they were last drawn are skipped')
+    # The app whose documents are drawn, set by each app's ``render_documents`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        kinds = import_module(f'{self.app_label}.documents').DOCUMENTS
+        parser.add_argument('kinds', nargs='*', help=f"Documents to draw (default: all of {', '.join(kinds)})")
+        parser.add_argument('--date', help='Day the documents were released or issued (YYYY-MM-DD)')
+        parser.add_argument('--all', action='store_true', help='Every released result and active certificate, whatever the day')
+        parser.add_argument('--workers', type=int, default=settings.DOCUMENT_RENDER_WORKERS, help='Rendering processes')
+        parser.add_argument('--force', action='store_true', help='Draw documents again even if they are up to date')
+
+    def handle(self, *args, **options):
+        documents = import_module(f'{self.app_label}.documents')
+        unknown = [kind for kind in options['kinds'] if kind not in documents.DOCUMENTS]
+        if unknown:
+            raise CommandError(f"Unknown documents: {', '.join(unknown)}")
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['all'] and options['date']:
+            raise CommandError('--all and --date cannot be used together')
+
+        day = None
+        if not options['all']:
+            day = timezone.localdate()
+            if options['date']:
+                try:
+                    day = parse_date(options['date'])
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise CommandError('--date must be a date (YYYY-MM-DD)')
+
+        for kind in options['kinds'] or documents.DOCUMENTS:
+            started = time.perf_counter()
+            rendered, current = documents.render_stale(
+                kind, documents.issued(kind, day), workers=options['workers'], force=options['force']
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{kind}: {rendered} rendered, {current} up to date in {elapsed:.1f}s")
@@ -0,0 +1,105 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from maes_common import benchmarks
+
+class RunBenchmarksCommand(BaseCommand):
+    help = ('Time the main request paths against the current (seeded) database and report p50/p95/p99 latency, '
+            'queries per request and peak memory as JSON that can be compared across commits')
+    # The app whose request paths are timed, set by each app's ``run_benchmarks`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(benchmarks.SCENARIOS)})")
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario before the timed ones')
+        parser.add_argument('--patient', help='Username to make patient requests as (default: the patient with the most appointments)')
+        parser.add_argument('--admin', help='Username to make admin requests as (default: the first administrator)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--json', action='store_true', help='Print the JSON report instead of the table')
+        parser.add_argument('--compare', help='JSON report of an earlier run to compare with')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --compare, fail if any p95 or query count grew by more than this many percent')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        unknown = [name for name in options['scenarios'] if name not in benchmarks.SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)['scenarios']
+
+        # Per-request logging would drown the results; DEBUG stays off so timings match production
+        loggers = [logging.getLogger(name) for name in ('django.request', 'maes_common.performance')]
+        levels = [logger.level for logger in loggers]
+        for logger in loggers:
+            logger.setLevel(logging.CRITICAL)
+        setup_test_environment(debug=False)
+        try:
+            report = benchmarks.run(
+                self.app_label, options['scenarios'], options['iterations'], max(0, options['warmup']),
+                options['patient'], options['admin'],
+                progress=None if options['json'] else self.progress,
+            )
+        finally:
+            teardown_test_environment()
+            for logger, level in zip(loggers, levels):
+                logger.setLevel(level)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        rows = report['rows']
+        self.stdout.write(f"{report['app']} at {report['commit'] or 'unknown commit'} on {report['database']}: "
+                          f"{rows['patients']} patients, {rows['appointments']} appointments, {rows['payments']} payments")
+        self.table(report['scenarios'], baseline)
+        if baseline is not None and options['max_regression'] is not None:
+            regressions = self.regressions(report['scenarios'], baseline, options['max_regression'])
+            if regressions:
+                raise CommandError('Performance regression:\n' + '\n'.join(regressions))
+        errors = [f"{name}: {result['error']}" for name, result in report['scenarios'].items() if result.get('errors')]
+        if errors:
+            raise CommandError('Some requests failed:\n' + '\n'.join(errors))
+
+    def progress(self, name, result):
+        if self.verbosity > 1:
+            self.stdout.write(f"  {name} done")
+
+    def table(self, results, baseline):
+        header = f"{'scenario':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>9}"
+        if baseline is not None:
+            header += f" {'p95 before':>11} {'change':>8}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            if 'skipped' in result:
+                self.stdout.write(f"{name:<20} {self.style.WARNING('skipped: ' + result['skipped'])}")
+                continue
+            line = (f"{name:<20} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                    f"{result['queries']:>8} {result['peak_memory_kib']:>9}")
+            before = (baseline or {}).get(name, {})
+            if baseline is not None and 'p95_ms' in before:
+                change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+                line += f" {before['p95_ms']:>11.1f} {change:>+7.1f}%"
+            if result['errors']:
+                line = self.style.ERROR(f"{line}  {result['errors']} failed: {result['error']}")
+            self.stdout.write(line)
+
+    def regressions(self, results, baseline, limit):
+        found = []
+        for name, result in results.items():
+            before = baseline.get(name, {})
+            for key in ('p95_ms', 'queries'):
+                if key in result and before.get(key) and (result[key] - before[key]) / before[key] * 100 > limit:
+                    found.append(f"{name}: {key} went from {before[key]} to {result[key]}")
+        return found
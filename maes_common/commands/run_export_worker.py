@@ -0,0 +1,61 @@
+import os
+import signal
+import socket
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+# Seconds between looks for stale jobs and expired files
+MAINTENANCE_EVERY = 60
+
+class RunExportWorkerCommand(BaseCommand):
+    help = ('Write queued background exports (CSV, Excel, PDF) and delete expired export files. '
+            'Several workers may run at once; stop one with SIGTERM and it finishes its current job first')
+    # The app whose export jobs are run, set by each app's ``run_export_worker`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs already queued, then exit')
+        parser.add_argument('--poll', type=float, default=settings.EXPORT_WORKER_POLL,
+                            help='Seconds to wait for new jobs when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.export_jobs = import_module(f'{self.app_label}.export_jobs')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+
+        self.stdout.write(f'Export worker {worker} started')
+        maintained = None
+        while not self.stopping:
+            if maintained is None or time.monotonic() - maintained >= MAINTENANCE_EVERY:
+                self.maintain()
+                maintained = time.monotonic()
+            job = self.export_jobs.claim(worker)
+            if job is None:
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll'])
+                continue
+            started = time.perf_counter()
+            job = self.export_jobs.run(job, worker)
+            self.stdout.write(f'Job {job.pk} ({job.export}, {job.format}): {job.status}, '
+                              f'{job.rows_written} rows in {time.perf_counter() - started:.1f}s')
+            close_old_connections()
+        self.stdout.write(f'Export worker {worker} stopped')
+
+    def maintain(self):
+        requeued = self.export_jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} jobs whose worker stopped responding'))
+        expired = self.export_jobs.cleanup()
+        if expired:
+            self.stdout.write(f'Deleted the files of {expired} expired jobs')
+
+    def stop(self, signum, frame):
+        self.stopping = True
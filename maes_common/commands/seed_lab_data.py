@@ -0,0 +1,449 @@
+import math
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import time as clock, timedelta
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from maes_common import slots
+
+# Department -> (description, services); a service is
+# (name, price, minutes, places per slot, sample type, fasting, normal range),
+# with the sample type stored as each app's ``sample_types`` says
+CATALOG = {
+    'Laboratory': ('Complete blood tests, urine analysis, and diagnostic testing', [
+        ('Complete Blood Count (CBC)', 350, 30, 6, 'blood', False, ''),
+        ('Urinalysis', 200, 20, 6, 'urine', False, ''),
+        ('Fecalysis', 150, 20, 4, 'stool', False, ''),
+        ('Fasting Blood Sugar', 150, 15, 6, 'blood', True, '70-100 mg/dL'),
+        ('Lipid Profile', 900, 30, 4, 'blood', True, 'Total cholesterol below 200 mg/dL'),
+        ('HbA1c', 750, 15, 4, 'blood', False, '4.0-5.6%'),
+        ('Creatinine', 250, 15, 4, 'blood', False, '0.6-1.2 mg/dL'),
+    ]),
+    'Radiology': ('X-ray, ultrasound, and imaging services', [
+        ('Chest X-Ray', 500, 15, 2, 'imaging', False, ''),
+        ('Whole Abdomen Ultrasound', 1800, 45, 1, 'imaging', True, ''),
+        ('Pelvic Ultrasound', 1200, 30, 1, 'imaging', False, ''),
+    ]),
+    'Cardiology': ('Heart health monitoring and ECG services', [
+        ('ECG/EKG', 400, 20, 2, 'other', False, ''),
+        ('2D Echocardiogram', 2500, 60, 1, 'imaging', False, ''),
+        ('Treadmill Stress Test', 2200, 60, 1, 'other', False, ''),
+    ]),
+    'General Medicine': ('General health checkups and consultations', [
+        ('Medical Consultation', 500, 20, 3, 'other', False, ''),
+        ('Annual Physical Examination', 600, 30, 3, 'other', False, ''),
+        ('Pre-Employment Medical Package', 1200, 60, 4, 'blood', True, ''),
+    ]),
+}
+
+FIRST_NAMES = [
+    'Maria', 'Jose', 'Juan', 'Ana', 'Mark', 'Angelica', 'John Paul', 'Kristine', 'Miguel', 'Andrea', 'Carlo',
+    'Patricia', 'Rafael', 'Camille', 'Joshua', 'Nicole', 'Paolo', 'Bea', 'Gabriel', 'Jasmine', 'Antonio', 'Rosa',
+    'Ramon', 'Elena', 'Francisco', 'Luz', 'Daniel', 'Sofia', 'Adrian', 'Isabel', 'Christian', 'Erlinda', 'Kevin',
+    'Maricel', 'Ricardo', 'Teresa', 'Vincent', 'Cristina', 'Manuel', 'Lorna',
+]
+LAST_NAMES = [
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza', 'Torres', 'Tomas', 'Andrada', 'Castillo',
+    'Flores', 'Villanueva', 'Ramos', 'Castro', 'Rivera', 'Aquino', 'Navarro', 'Salazar', 'Mercado', 'Dela Cruz',
+    'Gonzales', 'Lopez', 'Hernandez', 'Perez', 'Aguilar', 'Soriano', 'Pascual', 'Domingo', 'Manalo',
+]
+CITIES = ['Quezon City', 'Manila', 'Makati', 'Pasig', 'Taguig', 'Caloocan', 'Marikina', 'Paranaque', 'Las Pinas', 'Antipolo']
+STREETS = ['Rizal St.', 'Mabini St.', 'Bonifacio Ave.', 'Luna St.', 'Aguinaldo Hwy.', 'Katipunan Ave.', 'Del Pilar St.']
+
+# (value, weight) tables
+PAST_STATUSES = [('completed', 86), ('cancelled', 8), ('no_show', 6)]
+UPCOMING_STATUSES = [('confirmed', 60), ('pending', 32), ('cancelled', 8)]
+PRIORITIES = [('normal', 85), ('low', 6), ('high', 7), ('urgent', 2)]
+PAYMENT_METHODS = [
+    ('cash', 40), ('gcash', 25), ('paymaya', 7), ('credit_card', 8), ('debit_card', 5), ('bank_transfer', 5), ('hmo', 10)
+]
+
+SENIOR_AGE = 60
+SENIOR_DISCOUNT = Decimal('0.20')
+
+# Share of the slot places in the seeded period that may be booked; longer history is seeded beyond it
+MAX_OCCUPANCY = 0.8
+
+MODELS = ('Appointment', 'AuditLog', 'Department', 'Notification', 'Payment', 'Service', 'TestResult', 'UserProfile')
+TIMESTAMPED = ('UserProfile', 'Appointment', 'Payment', 'TestResult', 'Notification', 'AuditLog')
+
+def pick(rng, table):
+    values, weights = zip(*table)
+    return rng.choices(values, weights)[0]
+
+@contextmanager
+def explicit_timestamps(models):
+    """Let rows keep the created_at/updated_at values they are given instead of the current time"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+class SeedLabDataCommand(BaseCommand):
+    help = ('Fill the database with a realistic, reproducible lab history for scale testing: patients, staff, '
+            'departments, services, appointments, payments, test results, notifications and audit logs')
+    # The app whose database is filled, set by each app's ``seed_lab_data`` command
+    # along with the values its models use for the same things
+    app_label = None
+
+    # Service.sample_type of each sample type in CATALOG that the app stores differently
+    sample_types = {}
+    # Role of the front-desk staff, who verify payments along with the admins
+    desk_role = None
+    # Appointment.payment_status of an appointment that has been paid for
+    paid_status = None
+    # Notification type, title and message of each event patients are told about:
+    # 'booked', 'cancelled', 'paid' and 'released'
+    notices = {}
+    # Whether payment notifications link to their payment
+    notices_link_payments = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, options, day and starting database give the same data')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Days of history; extended when the appointments do not fit the slots of that many days')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Appointments written per transaction')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the seeded usernames')
+        parser.add_argument('--password', default='seeded-password', help='Password of every seeded user')
+
+    def handle(self, *args, **options):
+        if options['patients'] < 1 or options['appointments'] < 0:
+            raise CommandError('--patients must be at least 1 and --appointments cannot be negative')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users named '{prefix}-...' already exist; use another --prefix or an empty database")
+
+        for name in MODELS:
+            setattr(self, name, apps.get_model(self.app_label, name))
+        self.rng = random.Random(options['seed'])
+        self.verbosity = options['verbosity']
+        self.today = timezone.localdate()
+        self.cutoff = slots._aware(self.today, clock.min)
+        self.batch_size = options['batch_size']
+        self.totals = dict.fromkeys(['appointments', 'payments', 'test results', 'notifications', 'audit logs'], 0)
+        started = time.perf_counter()
+
+        services = self.create_catalog()
+        horizon = settings.SLOT_BOOKING_HORIZON_DAYS
+        days = self.history_days(services, options['appointments'], options['days'], horizon)
+        first_day = self.today - timedelta(days=days)
+
+        with explicit_timestamps([getattr(self, name) for name in TIMESTAMPED]):
+            self.create_staff(prefix, options['password'])
+            self.create_patients(prefix, options['password'], options['patients'], first_day)
+            self.create_appointments(services, options['appointments'], first_day, self.today + timedelta(days=horizon - 1))
+
+        self.rebuild(services, horizon)
+
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f'{count} {name}' for name, count in self.totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['patients']} patients with {summary} over {days} days of history in {elapsed:.1f}s"
+        ))
+
+    def rebuild(self, services, horizon):
+        """Rebuild the tables kept up to date by signal handlers, which bulk_create skips"""
+        import_module(f'{self.app_label}.stats').rebuild_daily_stats()
+        import_module(f'{self.app_label}.slots').generate_slots(services, self.today, horizon, rebuild=True)
+
+    def appointment_fields(self, discount):
+        """Fields of a seeded appointment that only the app has, given its senior citizen discount"""
+        return {}
+
+    def number_appointments(self, appointments, dates):
+        """Give ``appointments``, booked at ``dates``, their appointment IDs"""
+        raise NotImplementedError
+
+    def payment(self, appointment, verifier, verified, **fields):
+        """An unsaved payment of ``fields`` for ``appointment``, verified by the user ``verifier`` at ``verified``"""
+        raise NotImplementedError
+
+    def number_payments(self, payments):
+        """Give ``payments`` the receipt numbers that ``payment`` did not"""
+
+    def create_catalog(self):
+        services = []
+        for department_name, (description, offered) in CATALOG.items():
+            department, _ = self.Department.objects.get_or_create(name=department_name, defaults={'description': description})
+            for name, price, minutes, capacity, sample_type, fasting, normal_range in offered:
+                service, _ = self.Service.objects.get_or_create(name=name, department=department, defaults={
+                    'description': f'{name} at the {department_name} department',
+                    'price': price, 'duration_minutes': minutes, 'slot_capacity': capacity,
+                    'sample_type': self.sample_types.get(sample_type, sample_type),
+                    'requires_fasting': fasting, 'normal_range': normal_range,
+                    'preparation_instructions': 'Fast for 8-10 hours before the test.' if fasting else '',
+                })
+                services.append(service)
+        return services
+
+    def history_days(self, services, appointments, days, horizon):
+        """``days``, or as many more as it takes to book ``appointments`` within MAX_OCCUPANCY"""
+        week = [self.today + timedelta(days=offset) for offset in range(7)]
+        per_week = sum(len(slots.slot_times(service, day)) * service.slot_capacity for service in services for day in week)
+        if not per_week:
+            raise CommandError('The clinic has no operating hours, so no appointment can be seeded')
+        needed = math.ceil(appointments / (MAX_OCCUPANCY * per_week / 7)) - horizon
+        if needed > days:
+            self.stdout.write(f'{appointments} appointments need {needed} days of history at most '
+                              f'{MAX_OCCUPANCY:.0%} occupancy; seeding {needed} days instead of {days}')
+        return max(days, needed)
+
+    def person(self, username, role, joined, password, index):
+        first_name, last_name = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        email = f"{first_name}.{last_name}.{index}@example.com".lower().replace(' ', '')
+        user = User(username=username, first_name=first_name, last_name=last_name, email=email, password=password,
+                    is_staff=role == 'admin', date_joined=joined, last_login=joined)
+        age = self.rng.choices([self.rng.randint(1, 17), self.rng.randint(18, 59), self.rng.randint(60, 90)], [12, 68, 20])[0]
+        born = self.today - timedelta(days=age * 365 + self.rng.randint(0, 364))
+        profile = self.UserProfile(
+            role=role, phone_number=f'+639{self.rng.randint(0, 999999999):09d}',
+            address=f'{self.rng.randint(1, 999)} {self.rng.choice(STREETS)}, {self.rng.choice(CITIES)}',
+            date_of_birth=born, emergency_contact=f'{self.rng.choice(FIRST_NAMES)} {last_name}',
+            emergency_phone=f'+639{self.rng.randint(0, 999999999):09d}',
+            notification_preference=pick(self.rng, [('email', 60), ('sms', 20), ('both', 15), ('none', 5)]),
+            created_at=joined, updated_at=joined,
+        )
+        return user, profile
+
+    def save_people(self, people):
+        users = User.objects.bulk_create([user for user, profile in people], batch_size=self.batch_size)
+        if users and users[0].pk is None:
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+            for user in users:
+                user.pk = ids[user.username]
+        for user, profile in people:
+            profile.user = user
+        self.UserProfile.objects.bulk_create([profile for user, profile in people], batch_size=self.batch_size)
+        return users
+
+    def create_staff(self, prefix, password):
+        joined = self.cutoff - timedelta(days=3 * 365)
+        password = make_password(password)
+        staff = [('admin', 'admin', 1), (self.desk_role, self.desk_role, 2), ('technician', 'technician', 6),
+                 ('doctor', 'doctor', len(CATALOG))]
+        people = [
+            self.person(f'{prefix}-{name}-{number}', role, joined, password, number)
+            for name, role, count in staff for number in range(1, count + 1)
+        ]
+        with transaction.atomic():
+            self.save_people(people)
+        by_role = {}
+        for user, profile in people:
+            by_role.setdefault(profile.role, []).append(user.pk)
+        self.admins = by_role['admin'] + by_role[self.desk_role]
+        self.technicians = by_role['technician']
+        self.doctors = by_role['doctor']
+        for department, doctor in zip(self.Department.objects.filter(name__in=CATALOG, head_doctor=None), self.doctors):
+            department.head_doctor_id = doctor
+            department.save(update_fields=['head_doctor'])
+
+    def create_patients(self, prefix, password, count, first_day):
+        """Patients in the order they registered; a third were registered before the seeded period"""
+        window_start = slots._aware(first_day, clock.min)
+        span = (self.cutoff - window_start).total_seconds()
+        joined = sorted(
+            window_start - timedelta(days=self.rng.uniform(30, 730)) if index == 0 or self.rng.random() < 0.33
+            else window_start + timedelta(seconds=self.rng.uniform(0, span))
+            for index in range(count)
+        )
+        password = make_password(password)
+        self.patient_ids, self.patient_joined, self.patient_born = [], joined, []
+        for offset in range(0, count, self.batch_size):
+            people = [
+                self.person(f'{prefix}-{index + 1:07d}', 'patient', joined[index], password, index + 1)
+                for index in range(offset, min(offset + self.batch_size, count))
+            ]
+            with transaction.atomic():
+                users = self.save_people(people)
+            self.patient_ids.extend(user.pk for user in users)
+            self.patient_born.extend(profile.date_of_birth for user, profile in people)
+
+    def create_appointments(self, services, count, first_day, last_day):
+        """Spread ``count`` appointments over the slot places of every day from ``first_day`` to ``last_day``"""
+        def day_places(day):
+            return [(service, start) for service in services for start, end in slots.slot_times(service, day)
+                    for _ in range(service.slot_capacity)]
+
+        days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+        total = sum(len(slots.slot_times(service, day)) * service.slot_capacity for day in days for service in services)
+        share = min(count / total, 1) if total else 0
+
+        batch, seen_places, planned = [], 0, 0
+        for day in days:
+            places = day_places(day)
+            seen_places += len(places)
+            wanted = min(round(share * seen_places) - planned, len(places), count - planned)
+            taken = set()
+            for service, start in sorted(self.rng.sample(places, max(wanted, 0)), key=lambda place: place[1]):
+                row = self.plan_appointment(service, start, taken)
+                if row:
+                    batch.append(row)
+                planned += 1
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def plan_appointment(self, service, start, taken):
+        """An unsaved appointment at ``start``, or None when no patient is free then"""
+        rng = self.rng
+        upcoming = start >= self.cutoff
+        created = start - timedelta(minutes=rng.randint(30, 21 * 24 * 60))
+        if created >= self.cutoff:
+            created = self.cutoff - timedelta(minutes=rng.randint(1, 7 * 24 * 60))
+        registered = bisect_left(self.patient_joined, created)
+        for _ in range(5):
+            # Long-standing patients come back more often
+            index = int(registered * rng.random() ** 1.5)
+            if (index, start) not in taken:
+                break
+        else:
+            return None
+        taken.add((index, start))
+
+        status = pick(rng, UPCOMING_STATUSES if upcoming else PAST_STATUSES)
+        price = service.price
+        age = (start.date() - self.patient_born[index]).days // 365
+        discount = (price * SENIOR_DISCOUNT).quantize(Decimal('0.01')) if age >= SENIOR_AGE else Decimal('0')
+        finished = start + timedelta(minutes=service.duration_minutes)
+        if status == 'completed':
+            payment_status = self.paid_status
+        elif status == 'cancelled':
+            payment_status = 'refunded' if rng.random() < 0.3 else 'pending'
+        else:
+            payment_status = self.paid_status if upcoming and rng.random() < 0.3 else 'pending'
+
+        appointment = self.Appointment(
+            patient_id=self.patient_ids[index], service=service, appointment_date=start, status=status,
+            payment_status=payment_status, priority=pick(rng, PRIORITIES), total_amount=price,
+            discount_amount=discount, final_amount=price - discount,
+            assigned_technician_id=rng.choice(self.technicians) if status == 'completed' else None,
+            estimated_completion=finished + timedelta(days=1),
+            actual_completion=finished if status == 'completed' else None,
+            patient_instructions=service.preparation_instructions,
+            created_at=created, updated_at=finished if not upcoming else created,
+            **self.appointment_fields(discount),
+        )
+        return appointment, created, upcoming
+
+    def write_batch(self, batch):
+        rng = self.rng
+        with transaction.atomic():
+            appointments = [appointment for appointment, created, upcoming in batch]
+            self.number_appointments(appointments, [created for _, created, _ in batch])
+            self.Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
+            if appointments and appointments[0].pk is None:
+                ids = dict(self.Appointment.objects.filter(
+                    appointment_id__in=[appointment.appointment_id for appointment in appointments]
+                ).values_list('appointment_id', 'pk'))
+                for appointment in appointments:
+                    appointment.pk = ids[appointment.appointment_id]
+
+            # Children are linked by id; assigning the instances costs a descriptor call per row
+            payments, paid_for, verifiers, results, result_for = [], [], [], [], []
+            for appointment, created, upcoming in batch:
+                if appointment.payment_status not in (self.paid_status, 'refunded'):
+                    continue
+                paid = created + timedelta(minutes=rng.randint(1, 60)) if upcoming else appointment.appointment_date
+                method = pick(rng, PAYMENT_METHODS)
+                reference = '' if method == 'cash' else f'{rng.randint(0, 10 ** 12 - 1):012d}'
+                verifier = rng.choice(self.admins)
+                payments.append(self.payment(
+                    appointment, verifier, paid + timedelta(minutes=rng.randint(1, 120)), amount=appointment.final_amount,
+                    payment_method=method, reference_number=reference, payment_date=paid, is_verified=True,
+                ))
+                paid_for.append(appointment)
+                verifiers.append(verifier)
+            self.number_payments(payments)
+            self.Payment.objects.bulk_create(payments, batch_size=self.batch_size)
+
+            for appointment, created, upcoming in batch:
+                if appointment.status != 'completed':
+                    continue
+                ready = appointment.actual_completion + timedelta(hours=rng.randint(2, 72))
+                normal = rng.random() < 0.85
+                results.append(self.TestResult(
+                    appointment_id=appointment.pk, status='released' if ready < self.cutoff else 'completed',
+                    result_text='Within normal limits.' if normal else 'Outside the reference range; see recommendations.',
+                    result_data={'reference': appointment.service.normal_range} if appointment.service.normal_range else {},
+                    is_normal=normal, abnormal_findings='' if normal else 'Value outside the reference range',
+                    recommendations='' if normal else 'Consult your physician about these results.',
+                    processed_by_id=appointment.assigned_technician_id, reviewed_by_id=rng.choice(self.doctors),
+                    released_at=ready if ready < self.cutoff else None,
+                    created_at=appointment.actual_completion, updated_at=min(ready, self.cutoff),
+                ))
+                result_for.append(appointment)
+            self.TestResult.objects.bulk_create(results, batch_size=self.batch_size)
+
+            notifications = self.notifications(batch, zip(payments, paid_for), zip(results, result_for))
+            self.Notification.objects.bulk_create(notifications, batch_size=self.batch_size)
+            logs = [
+                self.AuditLog(user_id=appointment.patient_id, action='create', model_name='Appointment',
+                              object_id=str(appointment.appointment_id), object_repr=str(appointment.appointment_id),
+                              ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                              timestamp=created)
+                for appointment, created, upcoming in batch
+            ] + [
+                self.AuditLog(user_id=verifier, action='create', model_name='Payment', object_id=payment.receipt_number,
+                              object_repr=payment.receipt_number, timestamp=payment.payment_date)
+                for payment, verifier in zip(payments, verifiers)
+            ]
+            self.AuditLog.objects.bulk_create(logs, batch_size=self.batch_size)
+
+        for name, rows in [('appointments', appointments), ('payments', payments), ('test results', results),
+                           ('notifications', notifications), ('audit logs', logs)]:
+            self.totals[name] += len(rows)
+        if self.verbosity > 1:
+            self.stdout.write(f"  {self.totals['appointments']} appointments written")
+
+    def notifications(self, batch, payments, results):
+        rng = self.rng
+        zone = timezone.get_current_timezone()
+        def notice(appointment, event, at, related=None, **details):
+            kind, title, message = self.notices[event]
+            read = at < self.cutoff - timedelta(days=7) or rng.random() < 0.4
+            return self.Notification(
+                user_id=appointment.patient_id, notification_type=kind, title=title, message=message.format(**details),
+                related_appointment_id=appointment.pk, is_read=read, is_sent=True, sent_at=at,
+                read_at=at + timedelta(hours=rng.randint(1, 48)) if read else None, created_at=at, **(related or {})
+            )
+
+        rows = []
+        for appointment, created, upcoming in batch:
+            service = appointment.service.name
+            when = appointment.appointment_date.astimezone(zone).strftime('%B %d, %Y at %I:%M %p')
+            rows.append(notice(appointment, 'booked', created, service=service, when=when))
+            if appointment.status == 'cancelled':
+                cancelled = created + (min(appointment.appointment_date, self.cutoff) - created) * rng.random()
+                rows.append(notice(appointment, 'cancelled', cancelled, service=service, when=when))
+        for payment, appointment in payments:
+            if payment.payment_status == 'completed':
+                link = {'related_payment_id': payment.pk} if self.notices_link_payments else {}
+                rows.append(notice(appointment, 'paid', payment.payment_date, link,
+                                   amount=payment.amount, receipt=payment.receipt_number))
+        for result, appointment in results:
+            if result.released_at:
+                rows.append(notice(appointment, 'released', result.released_at, service=appointment.service.name))
+        return rows
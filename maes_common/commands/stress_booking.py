@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from maes_common.testing import test_database
+
+class StressBookingCommand(BaseCommand):
+    help = ('Book the same few slots from many threads at once, on a throwaway test database, '
+            'and check that nothing is double-booked or overbooked')
+    # The app whose booking path is hammered, set by each app's ``stress_booking`` command
+    app_label = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iterations', type=int, default=25, help='Booking attempts per thread')
+        parser.add_argument('--patients', type=int, default=20, help='Patients the attempts are spread over')
+        parser.add_argument('--slots', type=int, default=4, help='Slots the attempts are spread over')
+        parser.add_argument('--capacity', type=int, default=3, help='Places per slot')
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.run(options)
+
+    def run(self, options):
+        slots = import_module(f'{self.app_label}.slots')
+        Appointment, Department, Service, TimeSlot = (
+            apps.get_model(self.app_label, name) for name in ('Appointment', 'Department', 'Service', 'TimeSlot')
+        )
+        department = Department.objects.create(name='Stress booking')
+        service = Service.objects.create(
+            name='Stress booking', department=department, description='Stress booking', price=100,
+            duration_minutes=30, slot_capacity=options['capacity']
+        )
+        patients = [User.objects.create(username=f'stress-booking-{index}') for index in range(options['patients'])]
+
+        # First open day after today with enough slots
+        day = timezone.localdate() + timedelta(days=1)
+        for _ in range(14):
+            if len(slots.slot_times(service, day)) >= options['slots']:
+                break
+            day += timedelta(days=1)
+        else:
+            raise CommandError(f"No day in the next two weeks has {options['slots']} slots")
+        starts = [start for start, end in slots.slot_times(service, day)[:options['slots']]]
+        slots.generate_slots([service], day, 1)
+
+        outcomes = Counter()
+        errors = []
+        lock = threading.Lock()
+        start_gate = threading.Barrier(options['threads'])
+
+        def hammer(worker):
+            seen = Counter()
+            rng = random.Random(worker)
+            try:
+                start_gate.wait()
+                for _ in range(options['iterations']):
+                    try:
+                        slots.book(rng.choice(patients), service, rng.choice(starts),
+                                   total_amount=service.price, final_amount=service.price)
+                        seen['booked'] += 1
+                    except slots.PatientConflict:
+                        seen['patient conflicts'] += 1
+                    except slots.SlotUnavailable:
+                        seen['full slots'] += 1
+            except Exception as e:
+                with lock:
+                    errors.append(f"thread {worker}: {type(e).__name__}: {e}")
+            finally:
+                connection.close()
+            with lock:
+                outcomes.update(seen)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(hammer, range(options['threads'])))
+        elapsed = time.perf_counter() - started
+
+        active = Appointment.objects.filter(service=service).exclude(status__in=slots.RELEASED_STATUSES)
+        held = Counter(active.values_list('appointment_date', flat=True))
+        duplicates = [key for key, seen in Counter(active.values_list('patient_id', 'appointment_date')).items() if seen > 1]
+        overbooked = [start for start, seen in held.items() if seen > options['capacity']]
+        drifted = [
+            start for start, remaining in TimeSlot.objects.filter(service=service).values_list('start', 'remaining')
+            if remaining != options['capacity'] - held[start]
+        ]
+        lost = outcomes['booked'] - sum(held.values())
+
+        attempts = sum(outcomes.values())
+        self.stdout.write(f"{attempts} booking attempts on {options['threads']} threads in {elapsed:.2f}s "
+                          f"({attempts / elapsed:.0f} attempts/s): "
+                          + ', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items())))
+        for error in errors[:10]:
+            self.stdout.write(self.style.WARNING(error))
+        if duplicates or overbooked or drifted or lost or errors:
+            raise CommandError(f"{len(duplicates)} double bookings, {len(overbooked)} overbooked slots, "
+                               f"{len(drifted)} slot counters out of step, {lost} lost bookings, {len(errors)} failed threads")
+        self.stdout.write(self.style.SUCCESS('No patient was double-booked and no slot was overbooked'))
@@ -0,0 +1,171 @@
+"""
+Test result reports and medical certificates as PDF files.
+
+The data a document shows is read with ``values()`` and turned into the plain
+dict ``pdfs.render`` draws. A hash of that dict and of the layout version is
+stored next to the file (``report_digest``, ``certificate_digest``), and a
+document is only drawn again when its hash changes: when anything printed on
+it changes, such as the result, the certificate or the patient's name, and
+not on every save of the record.
+
+``render_stale`` renders a batch, say every result released today, across a
+process pool of ``settings.DOCUMENT_RENDER_WORKERS`` processes. The parent
+reads the database and stores the files; the workers only draw, so they never
+touch the database. A single document asked for by a download is drawn in the
+request instead (``ensure``).
+
+Each file is saved under a new name holding its hash, and the row is pointed
+at it with a conditional UPDATE on the hash it had before. Of two runs
+rendering the same document only one wins, and no row is left pointing at a
+file that was deleted. The UPDATE leaves ``updated_at`` alone, since drawing a
+record does not change it.
+
+Each app declares its kinds of document in its ``documents.py``: the fields
+they are read from and how those become the dict ``pdfs.render`` draws. The
+functions that read and store documents are methods of ``PatientDocuments``,
+which each app binds to its kinds and exposes as module functions.
+"""
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from maes_common import pdfs
+
+# Documents read from the database, and handed to the pool, at a time
+BATCH_SIZE = 500
+# Documents sent to a pool worker at a time
+POOL_CHUNK = 8
+
+def _day_start(day):
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+def date_text(value):
+    return value.strftime('%B %d, %Y') if value else ''
+
+def moment_text(value):
+    if value is None:
+        return ''
+    if settings.USE_TZ:
+        value = timezone.localtime(value)
+    return value.strftime('%B %d, %Y %I:%M %p')
+
+class Kind:
+    """
+    One kind of document: the rows it is drawn from, how they become documents,
+    and where the file and its hash are kept. ``issued`` selects the records
+    patients may be given, and ``date_field`` the day they were given them.
+    """
+
+    def __init__(self, model, fields, build, file_field, digest_field, directory, stem, issued, date_field):
+        self.model = model
+        self.fields = fields
+        self.build = build
+        self.file_field = file_field
+        self.digest_field = digest_field
+        self.directory = directory
+        self.stem = stem
+        self.issued = issued
+        self.date_field = date_field
+
+    @property
+    def storage(self):
+        return self.model._meta.get_field(self.file_field).storage
+
+def document_digest(document):
+    """Hash of everything ``document`` shows, and of the layout it is drawn with"""
+    payload = json.dumps([pdfs.LAYOUT_VERSION, document], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _current(kind, row, digest):
+    """Whether the stored file of ``row`` was drawn from the data hashed as ``digest``"""
+    name = row[kind.file_field]
+    return row[kind.digest_field] == digest and bool(name) and kind.storage.exists(name)
+
+def store(kind, row, digest, pdf):
+    """
+    Save ``pdf`` as the document of ``row`` and delete the file it replaces;
+    returns the new file name, or None if another run stored the document first
+    """
+    storage = kind.storage
+    name = storage.save(f'{kind.directory}/{row[kind.stem]}-{digest[:12]}.pdf', ContentFile(pdf))
+    updated = kind.model.objects.filter(pk=row['id'], **{kind.digest_field: row[kind.digest_field]}).update(
+        **{kind.file_field: name, kind.digest_field: digest}
+    )
+    if not updated:
+        storage.delete(name)
+        return None
+    if row[kind.file_field] and row[kind.file_field] != name:
+        storage.delete(row[kind.file_field])
+    return name
+
+class PatientDocuments:
+    """The kinds of document of one app: name -> ``Kind``"""
+
+    def __init__(self, kinds):
+        self.kinds = kinds
+
+    def issued(self, kind, day=None):
+        """
+        The documents patients may be given, such as released results; only those
+        given on ``day`` if one is passed
+        """
+        kind = self.kinds[kind]
+        queryset = kind.model.objects.filter(**kind.issued)
+        if day is not None:
+            queryset = queryset.filter(**{
+                f'{kind.date_field}__gte': _day_start(day),
+                f'{kind.date_field}__lt': _day_start(day + timedelta(days=1)),
+            })
+        return queryset
+
+    def ensure(self, kind, pk):
+        """The file name of document ``pk``, drawn here first if it is missing or out of date"""
+        kind = self.kinds[kind]
+        while True:
+            row = kind.model.objects.filter(pk=pk).values(*kind.fields).first()
+            if row is None:
+                raise kind.model.DoesNotExist(f'No {kind.model.__name__} {pk}')
+            row, document = next(kind.build([row]))
+            digest = document_digest(document)
+            if _current(kind, row, digest):
+                return row[kind.file_field]
+            name = store(kind, row, digest, pdfs.render(document))
+            if name:
+                return name
+            # Another request stored it meanwhile; read which file it is
+
+    def render_stale(self, kind, queryset, workers=None, force=False, batch_size=BATCH_SIZE):
+        """
+        Draw the documents of ``queryset`` that are missing or out of date
+        (every one with ``force``) in a pool of ``workers`` processes; returns how
+        many were rendered and how many were already up to date.
+        """
+        kind = self.kinds[kind]
+        rendered = current = last = 0
+        # The pool only starts its processes once there is something to draw
+        with ProcessPoolExecutor(max_workers=workers or settings.DOCUMENT_RENDER_WORKERS) as pool:
+            while True:
+                # A query per batch rather than one open cursor, since each batch
+                # is written back before the next one is read
+                rows = list(queryset.filter(pk__gt=last).order_by('pk').values(*kind.fields)[:batch_size])
+                if not rows:
+                    break
+                last = rows[-1]['id']
+                stale = []
+                for row, document in kind.build(rows):
+                    digest = document_digest(document)
+                    if not force and _current(kind, row, digest):
+                        current += 1
+                    else:
+                        stale.append((row, digest, document))
+                drawn = pool.map(pdfs.render, [document for row, digest, document in stale], chunksize=POOL_CHUNK)
+                for (row, digest, document), pdf in zip(stale, drawn):
+                    if store(kind, row, digest, pdf):
+                        rendered += 1
+        return rendered, current
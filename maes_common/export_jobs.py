@@ -0,0 +1,191 @@
+"""
+Background export jobs.
+
+Exports too big to produce inside a request are queued as ``ExportJob`` rows
+and written by ``manage.py run_export_worker``, a plain process that polls the
+table, so no message broker is needed. Any number of workers may run: a
+worker claims a job with a conditional UPDATE from 'pending' to 'running', so
+each job is taken exactly once, and refreshes the job's ``heartbeat_at`` as it
+reports progress. A running job whose heartbeat is older than
+``settings.EXPORT_JOB_STALE_AFTER`` seconds belonged to a worker that died and
+is put back in the queue.
+
+Rows come from the same ``exports.Export`` specs and filters (``listing.py``)
+as the direct downloads and are written by the ``exports.FORMATS`` writers;
+Parquet files come from ``analytics.py``.
+``progress`` is updated every ``PROGRESS_EVERY`` rows, against the row count
+taken when the job started. The finished file is stored under
+``MEDIA_ROOT/exports/`` and deleted by ``cleanup`` ``settings.EXPORT_JOB_TTL``
+seconds after the job finished; the job itself is kept, marked 'expired', as a
+record of the export.
+
+The functions that read or write jobs are methods of ``ExportQueue``; each
+app binds one to its own ``ExportJob`` model, exports and analytics tables in
+its ``export_jobs.py`` and exposes the methods as module functions.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.urls import reverse
+from django.utils import timezone
+
+from maes_common import exports
+
+logger = logging.getLogger(__name__)
+
+# Rows written between progress updates
+PROGRESS_EVERY = 2000
+
+class JobLost(Exception):
+    """The job was handed to another worker, or deleted, while this one was running it"""
+
+def describe(job):
+    """The status of ``job`` as the status endpoint reports it"""
+    data = {
+        'id': job.pk,
+        'export': job.export,
+        'format': job.format,
+        'filters': job.filters,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_total': job.rows_total,
+        'rows_written': job.rows_written,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'status_url': reverse('export_job_status', args=[job.pk]),
+        'download_url': None,
+    }
+    if job.status == 'completed' and job.file:
+        data['download_url'] = reverse('download_export_job', args=[job.pk])
+    return data
+
+class ExportQueue:
+    """
+    The export jobs of one app: its ``ExportJob`` model, its export specs as
+    export -> (``exports.Export``, queryset of the rows matching some filters)
+    and its ``analytics.AnalyticsTables``
+    """
+
+    def __init__(self, export_job_model, specs, tables):
+        self.ExportJob = export_job_model
+        self.specs = specs
+        self.tables = tables
+
+    def supports(self, export, fmt):
+        """Whether ``export`` can be written in ``fmt``; every analytics table can be written as Parquet"""
+        if fmt == 'parquet':
+            return export in self.tables.tables
+        return export in self.specs and fmt in exports.FORMATS
+
+    def submit(self, user, export, fmt, filters=None):
+        """Queue an export for the workers; ``filters`` come from ``listing.parse_filters``"""
+        return self.ExportJob.objects.create(export=export, format=fmt, filters=filters or {}, requested_by=user)
+
+    def claim(self, worker):
+        """Take the oldest pending job for ``worker``; returns None when there is none"""
+        while True:
+            pending = self.ExportJob.objects.filter(status='pending').order_by('created_at', 'pk')
+            pk = pending.values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            now = timezone.now()
+            taken = self.ExportJob.objects.filter(pk=pk, status='pending').update(
+                status='running', worker=worker, started_at=now, heartbeat_at=now
+            )
+            if taken:
+                return self.ExportJob.objects.get(pk=pk)
+            # Another worker took it first
+
+    def report(self, job, worker, rows_written):
+        """Store progress and refresh the heartbeat; raises ``JobLost`` if the job is no longer ours"""
+        job.rows_written = rows_written
+        job.progress = min(99, rows_written * 100 // job.rows_total) if job.rows_total else 0
+        updated = self.ExportJob.objects.filter(pk=job.pk, status='running', worker=worker).update(
+            rows_written=job.rows_written, progress=job.progress, heartbeat_at=timezone.now()
+        )
+        if not updated:
+            raise JobLost(job.pk)
+
+    def counted(self, rows, job, worker):
+        """Yield ``rows``, reporting progress every ``PROGRESS_EVERY`` of them"""
+        written = 0
+        for row in rows:
+            yield row
+            written += 1
+            if written % PROGRESS_EVERY == 0:
+                self.report(job, worker, written)
+        job.rows_written = written
+
+    def write(self, job, worker):
+        """Write the export of ``job`` to a temporary file, reporting progress; returns the file, rewound"""
+        if job.format == 'parquet':
+            job.rows_total = self.tables.queryset(job.export, job.filters).count()
+            self.ExportJob.objects.filter(pk=job.pk).update(rows_total=job.rows_total)
+            return self.tables.parquet_file(
+                job.export, job.filters, progress=lambda written: self.report(job, worker, written)
+            )
+        export, select = self.specs[job.export]
+        queryset = select(job.filters)
+        job.rows_total = queryset.count()
+        self.ExportJob.objects.filter(pk=job.pk).update(rows_total=job.rows_total)
+        return exports.write(export, job.format, self.counted(export.rows(queryset), job, worker))
+
+    def run(self, job, worker):
+        """Write the export of a claimed job and store the file; failures are recorded on the job"""
+        try:
+            with self.write(job, worker) as spool:
+                name = f"{job.export}-{timezone.localtime():%Y%m%d-%H%M%S}.{job.format}"
+                job.file.save(name, File(spool), save=False)
+        except JobLost:
+            logger.warning('Export job %s was taken over by another worker', job.pk)
+            return job
+        except Exception as error:
+            logger.exception('Export job %s failed', job.pk)
+            self.ExportJob.objects.filter(pk=job.pk, worker=worker).update(
+                status='failed', error=str(error) or error.__class__.__name__, finished_at=timezone.now()
+            )
+            job.status = 'failed'
+            return job
+
+        now = timezone.now()
+        finished = self.ExportJob.objects.filter(pk=job.pk, status='running', worker=worker).update(
+            status='completed', file=job.file.name, progress=100, rows_written=job.rows_written,
+            finished_at=now, heartbeat_at=now, expires_at=now + timedelta(seconds=settings.EXPORT_JOB_TTL)
+        )
+        if not finished:
+            # Taken over while the file was being stored; the new owner writes its own
+            job.file.delete(save=False)
+            return job
+        job.status = 'completed'
+        return job
+
+    def requeue_stale(self):
+        """Put back in the queue the running jobs whose worker stopped reporting; returns how many"""
+        cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER)
+        return self.ExportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+            status='pending', worker='', progress=0, rows_written=0, started_at=None, heartbeat_at=None
+        )
+
+    def cleanup(self):
+        """Delete the files of jobs past ``expires_at`` and mark the jobs expired; returns how many"""
+        expired = 0
+        for job in self.ExportJob.objects.filter(status='completed', expires_at__lte=timezone.now()):
+            if job.file:
+                try:
+                    directory = os.path.dirname(job.file.path)
+                except NotImplementedError:
+                    # Storage without local paths has no directories to remove
+                    directory = None
+                job.file.delete(save=False)
+                if directory:
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
+            expired += self.ExportJob.objects.filter(pk=job.pk, status='completed').update(status='expired', file='')
+        return expired
@@ -0,0 +1,303 @@
+"""
+Export engine.
+
+Every export (the download views, background export jobs and
+``benchmark_exports``) is an ``Export``: a model and a list of ``Column``s.
+Each column names the fields it is read from and how they become its cell. The
+engine reads all fields of an export with a single ``values_list`` query, each
+field once however many columns use it, and ``iterator(chunk_size=...)``
+fetches it through a server-side cursor where the database has one. Neither
+model instances nor the whole file are ever held in memory, and the first
+bytes go out before the database has produced the last row. The engine is
+shared by the apps; each app's ``exports.py`` declares the exports of its own
+models.
+
+Display values (``get_status_display``, ``get_full_name``) are rebuilt from
+the raw columns, since ``values_list`` rows have no model methods. Choice
+labels are looked up in maps built once per export rather than per row.
+
+Rows are handed to a writer for the requested format, registered in
+``FORMATS``:
+- CSV and JSON Lines are streamed as they are produced.
+- Excel workbooks are written with openpyxl's write-only mode, which keeps only
+  the current row in memory. Column widths have to be set before the first row
+  is written, so they are estimated from the first ``WIDTH_SAMPLE`` rows.
+- PDF tables are drawn a line at a time with the reportlab canvas, so only the
+  compressed pages are kept until the document is saved.
+
+Every writer can write to an anonymous temporary file. Views send that file
+with ``FileResponse``, which deletes it when the response is closed; callers
+such as background export jobs (``export_jobs.py``) store it instead.
+"""
+import csv
+import json
+import tempfile
+from itertools import chain, islice
+from operator import itemgetter
+
+from django.http import FileResponse, StreamingHttpResponse
+
+# Rows fetched from the database at a time
+CHUNK_SIZE = 2000
+# Rows Excel column widths are estimated from
+WIDTH_SAMPLE = 1000
+# Bytes of text gathered before they are handed to the server, so a large
+# export is not sent as hundreds of thousands of tiny writes
+BUFFER_SIZE = 64 * 1024
+# PDF table layout, in points
+PDF_MARGIN = 28
+PDF_FONT_SIZE = 6
+PDF_LINE_HEIGHT = 9
+
+class Echo:
+    """File-like object for ``csv.writer`` that returns each line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+def choice_labels(model, field):
+    """value -> display label of a field with choices, as ``get_<field>_display`` shows them"""
+    return {value: str(label) for value, label in model._meta.get_field(field).flatchoices}
+
+def full_name(first_name, last_name):
+    """Same as ``User.get_full_name``"""
+    return f'{first_name} {last_name}'.strip()
+
+def minute(value):
+    return value.strftime('%Y-%m-%d %H:%M')
+
+class Labels(dict):
+    """Choice labels whose lookup gives back values without a label, so ``__getitem__`` can format a cell"""
+
+    def __missing__(self, value):
+        return value
+
+class Column:
+    """
+    One column of an export. ``fields`` are the ``values_list`` paths it is
+    read from (its ``name`` by default), ``format`` turns them into the cell,
+    and ``choices`` shows the display label of a field with choices.
+    """
+
+    def __init__(self, name, header, *fields, format=None, choices=False):
+        self.name = name
+        self.header = header
+        self.fields = fields or (name,)
+        self.format = format
+        self.choices = choices
+
+class Export:
+    """The columns of an export of ``model``, and their rows for any queryset of it"""
+
+    def __init__(self, name, title, model, columns):
+        self.name = name
+        self.title = title
+        self.model = model
+        self.columns = columns
+        self.headers = [column.header for column in columns]
+        self.names = [column.name for column in columns]
+        # Every field read once, however many columns use it
+        self.fields = list(dict.fromkeys(field for column in columns for field in column.fields))
+
+    def plan(self):
+        """
+        How a row of ``fields`` becomes the cells of a row: a getter of every
+        column's first field, then (column, format, field) for the formatted
+        columns of one field and (column, format, getter of its fields) for
+        the columns built from several
+        """
+        position = {field: index for index, field in enumerate(self.fields)}
+        first = [position[column.fields[0]] for column in self.columns]
+        single, multiple = [], []
+        for index, column in enumerate(self.columns):
+            format = column.format
+            if column.choices:
+                format = Labels(choice_labels(self.model, column.fields[0])).__getitem__
+            if len(column.fields) > 1:
+                multiple.append((index, format, itemgetter(*[position[field] for field in column.fields])))
+            elif format is not None:
+                single.append((index, format, first[index]))
+        if len(first) == 1:
+            return (lambda row: (row[first[0]],)), single, multiple
+        return itemgetter(*first), single, multiple
+
+    def rows(self, queryset=None, chunk_size=CHUNK_SIZE):
+        """The rows of ``queryset`` (all of ``model`` by default), one list per object, read ``chunk_size`` at a time"""
+        if queryset is None:
+            queryset = self.model.objects.all()
+        first, single, multiple = self.plan()
+        for row in queryset.values_list(*self.fields).iterator(chunk_size=chunk_size):
+            cells = list(first(row))
+            for index, format, field in single:
+                cells[index] = format(row[field])
+            for index, format, fields in multiple:
+                cells[index] = format(*fields(row))
+            yield cells
+
+def buffered(pieces):
+    """``pieces`` of text joined into pieces of about ``BUFFER_SIZE``"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def csv_lines(export, rows):
+    """CSV text of the headers of ``export`` and ``rows``"""
+    writer = csv.writer(Echo())
+    return buffered(map(writer.writerow, chain([export.headers], rows)))
+
+def jsonl_lines(export, rows):
+    """JSON Lines text of ``rows``, one object keyed by column name per row"""
+    names = export.names
+    encode = json.JSONEncoder(default=str, ensure_ascii=False).encode
+    return buffered(encode(dict(zip(names, row))) + '\n' for row in rows)
+
+def text_file(lines, suffix):
+    spool = tempfile.TemporaryFile(suffix=suffix)
+    try:
+        for piece in lines:
+            spool.write(piece.encode('utf-8'))
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+def csv_file(export, rows):
+    """Write ``rows`` of ``export`` to a temporary CSV file; returns the file, rewound"""
+    return text_file(csv_lines(export, rows), '.csv')
+
+def jsonl_file(export, rows):
+    """Write ``rows`` of ``export`` to a temporary JSON Lines file; returns the file, rewound"""
+    return text_file(jsonl_lines(export, rows), '.jsonl')
+
+def column_widths(headers, sample):
+    """Excel column widths that fit ``headers`` and the rows in ``sample``, capped at 50"""
+    widths = [len(str(header)) for header in headers]
+    for row in sample:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, 50) for width in widths]
+
+def xlsx_file(export, rows, header_font=None, header_fill=None):
+    """Write ``rows`` of ``export`` to a temporary .xlsx file in write-only mode; returns the file, rewound"""
+    # openpyxl is only needed here, so keep it out of worker startup
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(export.title)
+    rows = iter(rows)
+    sample = list(islice(rows, WIDTH_SAMPLE))
+    for index, width in enumerate(column_widths(export.headers, sample), 1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+
+    header = []
+    for value in export.headers:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = header_font or Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        if header_fill is not None:
+            cell.fill = header_fill
+        header.append(cell)
+    sheet.append(header)
+    for row in chain(sample, rows):
+        sheet.append(row)
+
+    spool = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        workbook.save(spool)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+def pdf_file(export, rows):
+    """Write ``rows`` of ``export`` as a landscape table to a temporary PDF file; returns the file, rewound"""
+    # reportlab is only needed here, so keep it out of worker startup
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+
+    title, headers = export.title, export.headers
+    page_width, page_height = landscape(A4)
+    spool = tempfile.TemporaryFile(suffix='.pdf')
+    pdf = canvas.Canvas(spool, pagesize=(page_width, page_height), pageCompression=1)
+    pdf.setTitle(title)
+
+    rows = iter(rows)
+    sample = list(islice(rows, WIDTH_SAMPLE))
+    widths = column_widths(headers, sample)
+    scale = (page_width - 2 * PDF_MARGIN) / sum(widths)
+    columns, left = [], PDF_MARGIN
+    for width in widths:
+        # Roughly how many characters of the font fit the column
+        columns.append((left, max(1, int(width * scale / (PDF_FONT_SIZE * 0.55)))))
+        left += width * scale
+
+    def draw_row(values, y):
+        for (x, fits), value in zip(columns, values):
+            pdf.drawString(x, y, str(value)[:fits])
+
+    def start_page(number):
+        pdf.setFont('Helvetica-Bold', PDF_FONT_SIZE + 4)
+        pdf.drawString(PDF_MARGIN, page_height - PDF_MARGIN, title)
+        pdf.setFont('Helvetica', PDF_FONT_SIZE)
+        pdf.drawRightString(page_width - PDF_MARGIN, page_height - PDF_MARGIN, f'Page {number}')
+        y = page_height - PDF_MARGIN - 2 * PDF_LINE_HEIGHT
+        pdf.setFont('Helvetica-Bold', PDF_FONT_SIZE)
+        draw_row(headers, y)
+        pdf.line(PDF_MARGIN, y - 3, page_width - PDF_MARGIN, y - 3)
+        pdf.setFont('Helvetica', PDF_FONT_SIZE)
+        return y - PDF_LINE_HEIGHT - 2
+
+    page = 1
+    y = start_page(page)
+    try:
+        for row in chain(sample, rows):
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                page += 1
+                y = start_page(page)
+            draw_row(row, y)
+            y -= PDF_LINE_HEIGHT
+        pdf.save()
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+# format -> (content type, writer returning an open temporary file, text stream for streamed responses or None)
+FORMATS = {
+    'csv': ('text/csv', csv_file, csv_lines),
+    'jsonl': ('application/x-ndjson', jsonl_file, jsonl_lines),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', xlsx_file, None),
+    'pdf': ('application/pdf', pdf_file, None),
+}
+
+def write(export, fmt, rows, **options):
+    """Write ``rows`` of ``export`` in ``fmt`` to a temporary file; returns the file, rewound"""
+    content_type, writer, stream = FORMATS[fmt]
+    return writer(export, rows, **options)
+
+def response(export, fmt, rows, filename=None, **options):
+    """
+    Attachment response with ``rows`` of ``export`` in ``fmt``: streamed as they
+    are produced where the format allows it, otherwise sent from a temporary
+    file. ``options`` go to the writer, such as the header style of Excel.
+    """
+    content_type, writer, stream = FORMATS[fmt]
+    filename = filename or f'{export.name}.{fmt}'
+    if stream is not None:
+        response = StreamingHttpResponse(stream(export, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    return FileResponse(writer(export, rows, **options), as_attachment=True, filename=filename, content_type=content_type)
@@ -0,0 +1,247 @@
+"""
+Per-request performance instrumentation.
+
+``RequestTimingMiddleware`` records, for every request, the number of SQL
+queries, the time spent in the database, in template rendering and in chart
+rendering, and the slowest statements. It reports them in a ``Server-Timing``
+response header and as one JSON line on the ``maes_common.performance`` logger,
+and adds the request to per-view histograms that ``METRICS.render()`` exposes
+in the Prometheus text format.
+
+Template time is measured by the ``TimedDjangoTemplates`` backend; other code
+adds to a timing with ``with timed('chart'): ...``. The histograms live in the
+memory of each worker process and are cumulative, as Prometheus expects; use
+``rate()`` over them for a rolling window.
+"""
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger('maes_common.performance')
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Timings other than the database that requests report, in header order
+SPANS = ('template', 'chart')
+
+_current = ContextVar('request_timings', default=None)
+
+class RequestTimings:
+    """What one request spent its time on"""
+
+    def __init__(self, slow_queries):
+        self.queries = 0
+        self.db = 0.0
+        self.spans = defaultdict(float)
+        self.slowest = []
+        self.slow_queries = slow_queries
+
+    def record_query(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook timing every statement"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db += duration
+            if len(self.slowest) < self.slow_queries:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+    def slowest_queries(self):
+        return sorted(self.slowest, reverse=True)
+
+    def server_timing(self, total, describe_sql=False):
+        """``Server-Timing`` header value; statements are only described when ``describe_sql``"""
+        entries = [f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{name};dur={self.spans[name] * 1000:.1f}' for name in SPANS]
+        for index, (duration, sql) in enumerate(self.slowest_queries(), 1):
+            entry = f'sql-{index};dur={duration * 1000:.1f}'
+            if describe_sql:
+                text = ' '.join(sql.split())[:100].encode('ascii', 'replace').decode()
+                entry += ';desc="{}"'.format(text.replace('\\', '').replace('"', "'"))
+            entries.append(entry)
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's ``name`` timing"""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.spans[name] += time.perf_counter() - started
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, reporting render time to the current request"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    """Per-view request histograms and time counters of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, total, timings):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = {
+                    'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'queries': 0, 'db': 0.0,
+                    **{name: 0.0 for name in SPANS},
+                }
+            for index, bound in enumerate(BUCKETS):
+                if total <= bound:
+                    entry['buckets'][index] += 1
+            entry['count'] += 1
+            entry['sum'] += total
+            entry['queries'] += timings.queries
+            entry['db'] += timings.db
+            for name in SPANS:
+                entry[name] += timings.spans[name]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            views = {view: {**entry, 'buckets': list(entry['buckets'])} for view, entry in self.views.items()}
+
+        lines = [
+            '# HELP http_request_duration_seconds Time taken to serve a request, per view.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for view, entry in sorted(views.items()):
+            label = f'view="{_label(view)}"'
+            for bound, count in zip(BUCKETS, entry['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{label},le="+Inf"}} {entry["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{label}}} {entry["sum"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{label}}} {entry["count"]}')
+
+        counters = [
+            ('http_request_db_queries_total', 'SQL queries run while serving requests, per view.', 'queries', '{}'),
+            ('http_request_db_seconds_total', 'Time spent in the database while serving requests, per view.', 'db', '{:.6f}'),
+        ] + [
+            (f'http_request_{name}_seconds_total', f'Time spent in {name} rendering while serving requests, per view.', name, '{:.6f}')
+            for name in SPANS
+        ]
+        for metric, description, key, value_format in counters:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for view, entry in sorted(views.items()):
+                lines.append(f'{metric}{{view="{_label(view)}"}} {value_format.format(entry[key])}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+# Marks the end of a streamed body
+_END = object()
+
+@contextmanager
+def _measuring(timings):
+    """Report the queries and timings of the block to ``timings``"""
+    token = _current.set(timings)
+    try:
+        with connection.execute_wrapper(timings.record_query):
+            yield
+    finally:
+        _current.reset(token)
+
+def _measured(chunks, timings, finish):
+    """
+    The chunks of a streamed body, each produced under ``_measuring``;
+    ``finish`` runs once the stream is exhausted or closed
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            with _measuring(timings):
+                chunk = next(chunks, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        finish()
+
+class RequestTimingMiddleware:
+    """
+    Measure every request; keep it first in MIDDLEWARE so the total covers the whole stack.
+
+    A streamed body is produced after the view returns, as the server sends
+    it, so a ``StreamingHttpResponse`` is recorded, with the queries run to
+    produce its body, when its stream ends. Its ``Server-Timing`` header goes
+    out before the body and only covers the work up to then.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings(settings.PERF_SLOW_QUERIES)
+        started = time.perf_counter()
+        with _measuring(timings):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = timings.server_timing(time.perf_counter() - started, describe_sql=settings.DEBUG)
+        finish = partial(self.record, request, response, view, timings, started)
+        # A FileResponse only copies a file, and wrapping it would keep the server from using sendfile
+        if response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = _measured(response.streaming_content, timings, finish)
+        else:
+            finish()
+        return response
+
+    def record(self, request, response, view, timings, started):
+        """Add the request to the metrics and log it"""
+        total = time.perf_counter() - started
+        METRICS.observe(view, total, timings)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'queries': timings.queries,
+            'db_ms': round(timings.db * 1000, 1),
+            **{f'{name}_ms': round(timings.spans[name] * 1000, 1) for name in SPANS},
+            'slowest_sql': [
+                {'ms': round(duration * 1000, 1), 'sql': ' '.join(sql.split())[:300]}
+                for duration, sql in timings.slowest_queries()
+            ],
+        }))
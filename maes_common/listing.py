@@ -0,0 +1,186 @@
+"""
+Filtered, keyset-paginated appointment listings.
+
+The export views, background export jobs and the listing API take the same
+filters, read from query parameters by ``parse_filters``:
+
+    date_from, date_to       local dates (YYYY-MM-DD) of the appointment, inclusive
+    status, payment_status   one or more values, comma-separated or repeated
+    department, service      ids
+
+Dates become a half-open ``appointment_date`` range, so the date index is
+used instead of converting every row's timestamp to a date. ``parse_filters``
+returns plain strings and lists, so a background export can store its filters
+on the ``ExportJob`` and apply them later.
+
+The listing API pages with a keyset cursor: rows are ordered by
+(appointment_date, id) and the cursor holds the pair of the last row sent, so
+each page is an index range scan that starts right after it. Page 10,000 costs
+the same as page 1, where OFFSET would read and discard every earlier row, and
+rows added in the meantime never shift a page or repeat one.
+
+The functions that read an app's appointments are methods of
+``AppointmentListings``; each app binds one to its own ``Appointment`` model
+in its ``listing.py`` and exposes the methods as module functions.
+"""
+import base64
+import binascii
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from maes_common.exports import choice_labels, full_name
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+LISTING_FIELDS = (
+    'id', 'appointment_id', 'patient_id', 'patient__first_name', 'patient__last_name',
+    'service_id', 'service__name', 'service__department__name', 'appointment_date',
+    'status', 'payment_status', 'final_amount',
+)
+
+def _day_start(day):
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+def _values(params, name):
+    """All values of a repeated or comma-separated parameter"""
+    values = []
+    for value in params.getlist(name):
+        values.extend(part.strip() for part in value.split(',') if part.strip())
+    return values
+
+def filter_appointments(queryset, filters, prefix=''):
+    """
+    ``queryset`` narrowed to the appointments matching ``filters`` from
+    ``parse_filters``; ``prefix`` is the path to the appointment when
+    ``queryset`` is of a related model, such as 'appointment__' for payments.
+    """
+    lookups = {}
+    if 'date_from' in filters:
+        lookups['appointment_date__gte'] = _day_start(parse_date(filters['date_from']))
+    if 'date_to' in filters:
+        lookups['appointment_date__lt'] = _day_start(parse_date(filters['date_to']) + timedelta(days=1))
+    if 'status' in filters:
+        lookups['status__in'] = filters['status']
+    if 'payment_status' in filters:
+        lookups['payment_status__in'] = filters['payment_status']
+    if 'department' in filters:
+        lookups['service__department_id'] = filters['department']
+    if 'service' in filters:
+        lookups['service_id'] = filters['service']
+    return queryset.filter(**{prefix + lookup: value for lookup, value in lookups.items()})
+
+def encode_cursor(appointment_date, pk):
+    return base64.urlsafe_b64encode(f'{appointment_date.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(appointment_date, id) of a cursor from ``encode_cursor``; raises ``ValueError`` if it is not one"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        stamp, pk = text.split('|')
+        appointment_date = parse_datetime(stamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        appointment_date = None
+    if appointment_date is None:
+        raise ValueError('Invalid cursor')
+    return appointment_date, pk
+
+def page_size(params):
+    """The ``limit`` parameter, between 1 and ``MAX_PAGE_SIZE``; raises ``ValueError`` if it is not a number"""
+    value = params.get('limit')
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError('limit must be a positive number')
+    return min(int(value), MAX_PAGE_SIZE)
+
+class AppointmentListings:
+    """The filtered listings of one app's ``Appointment`` rows"""
+
+    def __init__(self, appointment_model):
+        self.Appointment = appointment_model
+
+    def parse_filters(self, params):
+        """
+        The appointment filters in ``params`` (a QueryDict), checked and
+        normalised. Raises ``ValueError`` with a message for the client when a
+        value is invalid.
+        """
+        filters = {}
+        for name in ('date_from', 'date_to'):
+            value = params.get(name)
+            if value:
+                try:
+                    day = parse_date(value)
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+                filters[name] = day.isoformat()
+        if 'date_from' in filters and 'date_to' in filters and filters['date_from'] > filters['date_to']:
+            raise ValueError('date_from is after date_to')
+
+        for name in ('status', 'payment_status'):
+            values = _values(params, name)
+            if values:
+                unknown = sorted(set(values) - set(choice_labels(self.Appointment, name)))
+                if unknown:
+                    raise ValueError(f"Unknown {name}: {', '.join(unknown)}")
+                filters[name] = sorted(set(values))
+
+        for name in ('department', 'service'):
+            value = params.get(name)
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f'{name} must be an id')
+                filters[name] = int(value)
+        return filters
+
+    def appointments(self, filters):
+        """All appointments matching ``filters``"""
+        return filter_appointments(self.Appointment.objects.all(), filters)
+
+    def page(self, queryset, cursor=None, size=DEFAULT_PAGE_SIZE):
+        """
+        One page of ``queryset`` in (appointment_date, id) order, starting after
+        ``cursor``. Returns the rows as dicts and the cursor of the next page, or
+        None after the last page.
+        """
+        queryset = queryset.order_by('appointment_date', 'id')
+        if cursor:
+            after, pk = decode_cursor(cursor)
+            # A range on the index rather than an OR of two conditions, which most
+            # databases cannot turn into a single index scan
+            queryset = queryset.filter(appointment_date__gte=after).exclude(appointment_date=after, id__lte=pk)
+        statuses = choice_labels(self.Appointment, 'status')
+        payment_statuses = choice_labels(self.Appointment, 'payment_status')
+
+        results = []
+        rows = list(queryset.values_list(*LISTING_FIELDS)[:size + 1])
+        for (pk, appointment_id, patient, first_name, last_name, service, service_name, department,
+             appointment_date, status, payment_status, final_amount) in rows[:size]:
+            results.append({
+                'id': pk,
+                'appointment_id': str(appointment_id),
+                'patient': patient,
+                'patient_name': full_name(first_name, last_name),
+                'service': service,
+                'service_name': service_name,
+                'department_name': department,
+                'appointment_date': appointment_date.isoformat(),
+                'status': status,
+                'status_display': statuses.get(status, status),
+                'payment_status': payment_status,
+                'payment_status_display': payment_statuses.get(payment_status, payment_status),
+                'final_amount': str(final_amount),
+            })
+        next_cursor = None
+        if len(rows) > size:
+            last = rows[size - 1]
+            next_cursor = encode_cursor(last[8], last[0])
+        return results, next_cursor
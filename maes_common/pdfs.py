@@ -0,0 +1,85 @@
+"""
+PDF layout of patient documents.
+
+A document is a plain dict of formatted text: a title and number, (label,
+value) details, an optional table of result values, text sections and who
+signs it. Nothing here needs Django, so documents are drawn in process pool
+workers that never set Django up; ``documents.py`` gathers the data and
+stores the files.
+"""
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+CLINIC_NAME = 'MAES Laboratory'
+# Part of every document's hash; bump it when the layout changes so cached
+# files are drawn again
+LAYOUT_VERSION = 1
+
+def _text(value):
+    """``value`` as paragraph markup, keeping its line breaks"""
+    return escape(str(value)).replace('\n', '<br/>')
+
+def render(document):
+    """The PDF bytes of ``document``"""
+    # reportlab is only needed here, so keep it out of worker startup
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    normal, label = styles['Normal'], styles['Heading6']
+    buffer = BytesIO()
+    pdf = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=20 * mm, rightMargin=20 * mm, topMargin=18 * mm, bottomMargin=18 * mm,
+        title=f"{document['title']} {document['number']}", author=CLINIC_NAME,
+    )
+    width = A4[0] - 40 * mm
+
+    story = [
+        Paragraph(CLINIC_NAME, styles['Title']),
+        Paragraph(_text(document['title']), styles['Heading2']),
+        Paragraph(f"No. {_text(document['number'])}", normal),
+        Spacer(1, 6 * mm),
+    ]
+    details = Table(
+        [[Paragraph(_text(name), label), Paragraph(_text(value), normal)] for name, value in document['details']],
+        colWidths=[45 * mm, width - 45 * mm],
+    )
+    details.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+    ]))
+    story += [details, Spacer(1, 6 * mm)]
+
+    if document.get('table'):
+        values = Table(
+            [['Test', 'Result']] + [[Paragraph(_text(name), normal), Paragraph(_text(value), normal)]
+                                    for name, value in document['table']],
+            colWidths=[60 * mm, width - 60 * mm], repeatRows=1,
+        )
+        values.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story += [values, Spacer(1, 6 * mm)]
+
+    for heading, text in document['sections']:
+        if text:
+            story += [Paragraph(_text(heading), styles['Heading4']), Paragraph(_text(text), normal)]
+
+    if document.get('signature'):
+        name, role = document['signature']
+        story += [
+            Spacer(1, 18 * mm),
+            Paragraph('_' * 40, normal),
+            Paragraph(_text(name), styles['Heading5']),
+            Paragraph(_text(role), normal),
+        ]
+
+    pdf.build(story)
+    return buffer.getvalue()
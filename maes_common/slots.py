@@ -0,0 +1,303 @@
+"""
+Slot inventory for appointment booking.
+
+Each service is bookable in back-to-back slots of ``duration_minutes`` within
+the clinic's operating hours (``settings.CLINIC_OPERATING_HOURS``), and each
+slot takes up to ``slot_capacity`` patients. Slots are stored as ``TimeSlot``
+rows with a ``remaining`` counter, so checking a slot is one lookup on the
+(service, start) index and taking a place is one conditional UPDATE that can
+never push the counter below zero.
+
+``manage.py generate_slots`` creates the rows for the booking horizon ahead of
+time; a day outside it is generated the first time someone asks about it. The
+signal handlers in ``signals.py`` take and give back places as appointments
+are created, moved, cancelled or deleted. ``book`` is the booking path used by
+the views: it checks the patient's other appointments and takes the place in
+one transaction.
+
+``free_slots`` serves calendar views: each (service, day) list of free slots is
+cached for ``settings.SLOT_CACHE_TIMEOUT`` seconds and dropped whenever a place
+in that day is taken or given back.
+
+The functions that read or write rows are methods of ``SlotInventory``; each
+app binds one to its own ``Appointment``, ``Service`` and ``TimeSlot`` models
+in its ``slots.py`` and exposes the methods as module functions.
+"""
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Appointments in these states no longer hold a place in their slot
+RELEASED_STATUSES = {'cancelled'}
+
+# Upper bound on a service's duration, used to bound overlap queries
+LONGEST_APPOINTMENT = timedelta(hours=24)
+
+# Longest range a calendar view may ask ``free_slots`` for
+MAX_CALENDAR_DAYS = 31
+
+class SlotUnavailable(Exception):
+    """Raised when an appointment cannot be given a place in a slot"""
+
+class PatientConflict(SlotUnavailable):
+    """Raised when the patient already has an appointment overlapping the requested time"""
+
+def holds_slot(status):
+    return status not in RELEASED_STATUSES
+
+def _aware(day, at):
+    value = datetime.combine(day, at)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+def _local_date(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+def _cache_key(service_id, day):
+    return f'slots:{service_id}:{day.isoformat()}'
+
+def invalidate_days(service_id, days):
+    """Drop the cached free slots of ``service_id`` on ``days`` once the transaction commits"""
+    keys = [_cache_key(service_id, day) for day in days]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+def operating_hours(day):
+    """Opening and closing datetimes on ``day``, or None when the clinic is closed"""
+    hours = settings.CLINIC_OPERATING_HOURS.get(day.weekday())
+    if not hours:
+        return None
+    opens, closes = (time.fromisoformat(value) for value in hours)
+    return _aware(day, opens), _aware(day, closes)
+
+def slot_times(service, day):
+    """``(start, end)`` of every slot ``service`` offers on ``day``"""
+    hours = operating_hours(day)
+    if hours is None:
+        return []
+    start, closes = hours
+    length = timedelta(minutes=service.duration_minutes)
+    times = []
+    while start + length <= closes:
+        times.append((start, start + length))
+        start += length
+    return times
+
+def _claim(queryset):
+    """Take a place in the slot of ``queryset`` if it has one left; whether one was taken"""
+    return queryset.filter(remaining__gt=0).update(remaining=F('remaining') - 1, updated_at=timezone.now()) > 0
+
+class SlotInventory:
+    """The slot inventory of one app, kept in its ``TimeSlot`` rows"""
+
+    def __init__(self, appointment_model, service_model, timeslot_model):
+        self.Appointment = appointment_model
+        self.Service = service_model
+        self.TimeSlot = timeslot_model
+
+    def generate_slots(self, services=None, start_day=None, days=None, rebuild=False):
+        """
+        Create the missing slots of ``services`` for ``days`` days from ``start_day``.
+
+        Places already taken by existing appointments are subtracted, so this also
+        brings the inventory up to date for appointments booked before it existed.
+        ``rebuild`` first deletes the slots in the range, which applies changed
+        durations, capacities or operating hours. Returns the number of slots created.
+        """
+        start_day = start_day or timezone.localdate()
+        days = settings.SLOT_BOOKING_HORIZON_DAYS if days is None else days
+        if services is None:
+            services = self.Service.objects.filter(is_available=True)
+        range_start = _aware(start_day, time.min)
+        range_end = _aware(start_day + timedelta(days=days), time.min)
+
+        created = 0
+        for service in services:
+            times = []
+            for offset in range(days):
+                times.extend(slot_times(service, start_day + timedelta(days=offset)))
+
+            with transaction.atomic():
+                existing = self.TimeSlot.objects.filter(service=service, start__gte=range_start, start__lt=range_end)
+                if rebuild:
+                    existing.delete()
+                    taken = set()
+                else:
+                    taken = set(existing.values_list('start', flat=True))
+
+                # Count the places held by existing appointments in the slot containing them
+                starts = [start for start, end in times]
+                booked = Counter()
+                held = self.Appointment.objects.filter(
+                    service=service, appointment_date__gte=range_start, appointment_date__lt=range_end
+                ).exclude(status__in=RELEASED_STATUSES).values_list('appointment_date', flat=True)
+                for appointment_date in held:
+                    index = bisect_right(starts, appointment_date) - 1
+                    if index >= 0 and appointment_date < times[index][1]:
+                        booked[starts[index]] += 1
+
+                new_slots = [
+                    self.TimeSlot(service=service, start=start, end=end, capacity=service.slot_capacity,
+                             remaining=max(service.slot_capacity - booked[start], 0))
+                    for start, end in times if start not in taken
+                ]
+                self.TimeSlot.objects.bulk_create(new_slots, batch_size=500, ignore_conflicts=True)
+                created += len(new_slots)
+                if rebuild or new_slots:
+                    invalidate_days(service.pk, [start_day + timedelta(days=offset) for offset in range(days)])
+        return created
+
+    def find_slot(self, service_id, at):
+        """
+        The slot of ``service_id`` containing ``at``, or None outside operating hours.
+
+        Uses the (service, start) index; generates the day's slots on first use.
+        """
+        lookup = self.TimeSlot.objects.filter(service_id=service_id, start__lte=at, end__gt=at).order_by('-start')
+        slot = lookup.first()
+        if slot is None:
+            day = _local_date(at)
+            day_has_slots = self.TimeSlot.objects.filter(
+                service_id=service_id, start__gte=_aware(day, time.min), start__lt=_aware(day + timedelta(days=1), time.min)
+            ).exists()
+            service = self.Service.objects.filter(pk=service_id).first()
+            if not day_has_slots and service is not None and self.generate_slots([service], day, 1):
+                slot = lookup.first()
+        return slot
+
+    def reserve_slot(self, service_id, at):
+        """
+        Take one place in the slot containing ``at``; raises SlotUnavailable if none is left.
+
+        The conditional UPDATE is tried before anything is read, so in a
+        transaction that starts with it the write lock is taken first (see ``book``).
+        The slot is only looked up, and its day generated, when that finds nothing.
+        """
+        if not _claim(self.TimeSlot.objects.filter(service_id=service_id, start__lte=at, end__gt=at)):
+            slot = self.find_slot(service_id, at)
+            if slot is None:
+                raise SlotUnavailable('The selected time is outside our operating hours.')
+            if not _claim(self.TimeSlot.objects.filter(pk=slot.pk)):
+                raise SlotUnavailable('The selected time slot is fully booked. Please choose another time.')
+        invalidate_days(service_id, [_local_date(at)])
+
+    def release_slot(self, service_id, at):
+        """Give back the place an appointment at ``at`` held"""
+        released = self.TimeSlot.objects.filter(
+            service_id=service_id, start__lte=at, end__gt=at, remaining__lt=F('capacity')
+        ).update(remaining=F('remaining') + 1, updated_at=timezone.now())
+        if released:
+            invalidate_days(service_id, [_local_date(at)])
+
+    def _read_free_slots(self, service_ids, first_day, last_day):
+        """Free slots per (service_id, day), read with one range query"""
+        found = defaultdict(list)
+        rows = self.TimeSlot.objects.filter(
+            service_id__in=service_ids,
+            start__gte=_aware(first_day, time.min),
+            start__lt=_aware(last_day + timedelta(days=1), time.min),
+        ).order_by('service_id', 'start').values_list('service_id', 'start', 'end', 'remaining')
+        for service_id, start, end, remaining in rows:
+            entries = found[(service_id, _local_date(start))]
+            if remaining > 0:
+                entries.append({'start': start, 'end': end, 'remaining': remaining})
+        return found
+
+    def free_slots(self, services, start_day, days):
+        """
+        Free slots of ``services`` for ``days`` days from ``start_day``.
+
+        Returns ``{service_id: {day: [{'start', 'end', 'remaining'}, ...]}}``. Cached
+        days are served from the cache; the rest are read with one range query over
+        the slot inventory (generating open days that have no slots yet) and cached.
+        Slots that have already started are left out.
+        """
+        services = list(services)
+        dates = [start_day + timedelta(days=offset) for offset in range(days)]
+        keys = {_cache_key(service.pk, day): (service, day) for service in services for day in dates}
+        cached = cache.get_many(list(keys))
+        missing = [keys[key] for key in keys if key not in cached]
+
+        if missing:
+            first_day = min(day for service, day in missing)
+            last_day = max(day for service, day in missing)
+            service_ids = {service.pk for service, day in missing}
+            found = self._read_free_slots(service_ids, first_day, last_day)
+
+            # Days nobody has asked about before have no slots yet
+            ungenerated = [(service, day) for service, day in missing
+                           if (service.pk, day) not in found and slot_times(service, day)]
+            if ungenerated:
+                spans = defaultdict(list)
+                for service, day in ungenerated:
+                    spans[service].append(day)
+                for service, service_days in spans.items():
+                    self.generate_slots([service], min(service_days), (max(service_days) - min(service_days)).days + 1)
+                found.update(self._read_free_slots(
+                    {service.pk for service, day in ungenerated},
+                    min(day for service, day in ungenerated),
+                    max(day for service, day in ungenerated),
+                ))
+
+            fresh = {_cache_key(service.pk, day): found.get((service.pk, day), []) for service, day in missing}
+            cache.set_many(fresh, settings.SLOT_CACHE_TIMEOUT)
+            cached.update(fresh)
+
+        now = timezone.now()
+        result = {service.pk: {} for service in services}
+        for key, (service, day) in keys.items():
+            result[service.pk][day] = [slot for slot in cached[key] if slot['start'] > now]
+        return result
+
+    def patient_conflict(self, patient, start, end, exclude=None):
+        """Whether ``patient`` already has an appointment overlapping ``[start, end)``"""
+        candidates = self.Appointment.objects.filter(
+            patient=patient, appointment_date__lt=end, appointment_date__gt=start - LONGEST_APPOINTMENT
+        ).exclude(status__in=RELEASED_STATUSES)
+        if exclude is not None:
+            candidates = candidates.exclude(pk=exclude)
+        return any(
+            appointment_date + timedelta(minutes=duration) > start
+            for appointment_date, duration in candidates.values_list('appointment_date', 'service__duration_minutes')
+        )
+
+    def book(self, patient, service, start, **fields):
+        """
+        Create an appointment of ``patient`` for ``service`` at ``start``.
+
+        Raises PatientConflict if the patient already has an overlapping appointment
+        and SlotUnavailable if the slot is closed or full. The place is taken
+        first, with the conditional UPDATE in ``reserve_slot`` that keeps the slot
+        from being overbooked; the patient's row is then locked until the
+        transaction ends, so two bookings of the same patient are checked one after
+        the other. The unique constraint on (patient, appointment_date) reports any
+        duplicate that gets past both as a conflict instead of a second row.
+        """
+        end = start + timedelta(minutes=service.duration_minutes)
+        try:
+            with transaction.atomic():
+                # The first statement is a write: SQLite has no row locks and ignores
+                # select_for_update, but a transaction that writes before it reads
+                # holds the database write lock from the start, which serializes
+                # bookings there. A failed booking rolls the place back.
+                self.reserve_slot(service.pk, start)
+                # Serializes the bookings of one patient where rows can be locked: a
+                # second booking waits here until this one commits, so it sees this
+                # appointment when it checks for overlaps
+                User.objects.select_for_update().filter(pk=patient.pk).values_list('pk', flat=True).first()
+                if self.patient_conflict(patient, start, end):
+                    raise PatientConflict('You already have an appointment at this time.')
+                appointment = self.Appointment(patient=patient, service=service, appointment_date=start, **fields)
+                # Tells the pre_save handler in signals.py this save's place is taken
+                appointment._slot_reserved = True
+                appointment.save(force_insert=True)
+                return appointment
+        except IntegrityError:
+            if self.patient_conflict(patient, start, end):
+                raise PatientConflict('You already have an appointment at this time.')
+            raise
@@ -0,0 +1,161 @@
+"""
+Daily rollup maintenance for dashboard statistics.
+
+Dashboards read their counters from ``DailyStats`` instead of running COUNT/SUM
+queries over appointments and payments on every page view. The signal handlers
+in ``signals.py`` call into this module with the state of a row before and after
+each write so that only the difference is applied to the rollup.
+
+Writes that bypass model signals (``QuerySet.update``, ``bulk_create``, raw SQL)
+are not tracked; run ``manage.py rebuild_daily_stats`` after such changes.
+
+The functions that read or write rows are methods of ``DailyRollup``; each app
+binds one to its own models in its ``stats.py`` and exposes the methods as
+module functions.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+def _local_date(value):
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        return timezone.localdate(value)
+    return value.date()
+
+def payment_state(payment_date, payment_status, amount, department_id):
+    """Rollup contribution of one payment"""
+    day = _local_date(payment_date)
+    if day is None or payment_status != 'completed' or not amount:
+        return {}
+    return {(day, department_id): {'revenue': Decimal(amount)}}
+
+def patient_state(role, date_joined):
+    """Rollup contribution of one user profile"""
+    day = _local_date(date_joined)
+    if day is None or role != 'patient':
+        return {}
+    return {(day, None): {'new_patients': 1}}
+
+class DailyRollup:
+    """The ``DailyStats`` rollup of one app"""
+
+    def __init__(self, appointment_model, payment_model, profile_model, daily_stats_model):
+        self.Appointment = appointment_model
+        self.Payment = payment_model
+        self.UserProfile = profile_model
+        self.DailyStats = daily_stats_model
+        self.status_fields = {status for status, label in appointment_model.STATUS_CHOICES}
+
+    def appointment_state(self, appointment_date, created_at, status, department_id):
+        """Rollup contribution of one appointment as {(date, department): {field: delta}}"""
+        state = defaultdict(dict)
+        day = _local_date(appointment_date)
+        if day is not None:
+            state[(day, department_id)]['appointments'] = 1
+            if status in self.status_fields:
+                state[(day, department_id)][status] = 1
+        booked_day = _local_date(created_at)
+        if booked_day is not None:
+            state[(booked_day, department_id)]['booked'] = 1
+        return state
+
+    def moved_revenue(self, appointment_id, old_department_id, new_department_id):
+        """
+        (old state, new state) of the completed payments of an appointment that
+        moved from one department to another, since revenue is filed under the
+        appointment's department
+        """
+        old_state, new_state = defaultdict(dict), defaultdict(dict)
+        payments = self.Payment.objects.filter(appointment_id=appointment_id, payment_status='completed').values_list(
+            'payment_date', 'amount'
+        )
+        for payment_date, amount in payments:
+            for state, department_id in ((old_state, old_department_id), (new_state, new_department_id)):
+                for key, fields in payment_state(payment_date, 'completed', amount, department_id).items():
+                    state[key]['revenue'] = state[key].get('revenue', 0) + fields['revenue']
+        return old_state, new_state
+
+    def apply_delta(self, old_state, new_state):
+        """Apply ``new_state - old_state`` to the rollup rows"""
+        deltas = defaultdict(lambda: defaultdict(int))
+        for key, fields in (old_state or {}).items():
+            for field, value in fields.items():
+                deltas[key][field] -= value
+        for key, fields in (new_state or {}).items():
+            for field, value in fields.items():
+                deltas[key][field] += value
+
+        with transaction.atomic():
+            for (day, department_id), fields in deltas.items():
+                changes = {field: F(field) + value for field, value in fields.items() if value}
+                if not changes:
+                    continue
+                # Two first writes of a row can race; the unique constraints make the
+                # loser's INSERT fail, and get_or_create then reads the winner's row
+                stats, created = self.DailyStats.objects.get_or_create(date=day, department_id=department_id)
+                self.DailyStats.objects.filter(pk=stats.pk).update(**changes)
+
+    def dashboard_totals(self):
+        """All dashboard counters in a single aggregate query over the rollup"""
+        today = timezone.localdate()
+        this_week = today - timedelta(days=7)
+        this_month = today.replace(day=1)
+
+        totals = self.DailyStats.objects.aggregate(
+            total_patients=Sum('new_patients'),
+            total_appointments=Sum('appointments'),
+            today_appointments=Sum('appointments', filter=Q(date=today)),
+            pending_appointments=Sum('pending'),
+            completed_appointments=Sum('completed'),
+            weekly_appointments=Sum('booked', filter=Q(date__gte=this_week)),
+            total_revenue=Sum('revenue'),
+            monthly_revenue=Sum('revenue', filter=Q(date__gte=this_month)),
+        )
+        return {key: value or 0 for key, value in totals.items()}
+
+    def rebuild_daily_stats(self):
+        """Recompute every rollup row from the source tables"""
+        rows = defaultdict(lambda: defaultdict(int))
+
+        scheduled = self.Appointment.objects.annotate(day=TruncDate('appointment_date')).values(
+            'day', 'service__department_id', 'status'
+        ).annotate(count=Count('id')).order_by()
+        for item in scheduled:
+            key = (item['day'], item['service__department_id'])
+            rows[key]['appointments'] += item['count']
+            if item['status'] in self.status_fields:
+                rows[key][item['status']] += item['count']
+
+        booked = self.Appointment.objects.annotate(day=TruncDate('created_at')).values(
+            'day', 'service__department_id'
+        ).annotate(count=Count('id')).order_by()
+        for item in booked:
+            rows[(item['day'], item['service__department_id'])]['booked'] += item['count']
+
+        revenue = self.Payment.objects.filter(payment_status='completed').annotate(
+            day=TruncDate('payment_date')
+        ).values('day', 'appointment__service__department_id').annotate(total=Sum('amount')).order_by()
+        for item in revenue:
+            rows[(item['day'], item['appointment__service__department_id'])]['revenue'] += item['total'] or 0
+
+        patients = self.UserProfile.objects.filter(role='patient').annotate(
+            day=TruncDate('user__date_joined')
+        ).values('day').annotate(count=Count('id')).order_by()
+        for item in patients:
+            rows[(item['day'], None)]['new_patients'] += item['count']
+
+        with transaction.atomic():
+            self.DailyStats.objects.all().delete()
+            self.DailyStats.objects.bulk_create(
+                [self.DailyStats(date=day, department_id=department_id, **fields)
+                 for (day, department_id), fields in rows.items()],
+                batch_size=500
+            )
+        return len(rows)
@@ -0,0 +1,41 @@
+"""
+Throwaway databases for the management commands that check the apps under load.
+
+``test_database`` creates a test database the way Django's test runner does,
+from the project's models, points the default connection at it for the
+duration of a ``with`` block and drops it afterwards, so a check can create,
+book and cancel as much as it likes without touching live data. Files written
+meanwhile go to a temporary ``MEDIA_ROOT``.
+
+On SQLite the test database is a temporary file rather than Django's shared
+in-memory database: threads opening their own connections then wait for each
+other's write locks, as they would on the real database, instead of failing
+with "database table is locked".
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+@contextmanager
+def test_database():
+    """Run the block against a fresh test database, dropped when it ends"""
+    setup_test_environment(debug=False)
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    test_name = test_settings.get('NAME')
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            if connection.vendor == 'sqlite' and not test_name:
+                test_settings['NAME'] = os.path.join(scratch, 'test.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                with override_settings(MEDIA_ROOT=os.path.join(scratch, 'media')):
+                    yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        test_settings['NAME'] = test_name
+        teardown_test_environment()
@@ -0,0 +1,115 @@
+"""
+Bucketed time series over any model and date field.
+
+``time_series`` groups a queryset into day, week or month buckets with a single
+GROUP BY query and fills buckets that have no rows with zeros, so callers get
+one entry per period without looping over the calendar themselves.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+def add_months(day, months):
+    """Return the first day of the month ``months`` away from ``day``'s month"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def bucket_start(day, granularity):
+    """Return the first day of the bucket containing ``day``"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unsupported granularity: {granularity}")
+
+def next_bucket(day, granularity):
+    """Return the first day of the bucket after the one starting at ``day``"""
+    if granularity == 'day':
+        return day + timedelta(days=1)
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    return add_months(day, 1)
+
+def bucket_range(start, end, granularity):
+    """List the bucket start dates covering ``start`` through ``end`` inclusive"""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, granularity)
+    return buckets
+
+def last_buckets(periods, granularity, end=None):
+    """Return ``(start, end)`` spanning the last ``periods`` buckets up to ``end``"""
+    end = end or timezone.localdate()
+    start = bucket_start(end, granularity)
+    for _ in range(periods - 1):
+        if granularity == 'month':
+            start = add_months(start, -1)
+        elif granularity == 'week':
+            start -= timedelta(days=7)
+        else:
+            start -= timedelta(days=1)
+    return start, end
+
+def _resolve_field(model, path):
+    field = None
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+def _boundary(field, day):
+    if isinstance(field, models.DateTimeField):
+        value = datetime.combine(day, time.min)
+        return timezone.make_aware(value) if settings.USE_TZ else value
+    return day
+
+def time_series(queryset, date_field, granularity='month', start=None, end=None, periods=None, **aggregates):
+    """
+    Aggregate ``queryset`` per bucket of ``date_field``.
+
+    Pass either ``start``/``end`` dates or a number of ``periods`` ending today.
+    Keyword aggregates (e.g. ``revenue=Sum('amount')``) default to
+    ``count=Count('pk')``. Returns a list of ``{'period': date, <name>: value}``
+    dicts in chronological order, with empty buckets filled with zero.
+    """
+    if granularity not in TRUNC_FUNCTIONS:
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    if periods is not None:
+        start, end = last_buckets(periods, granularity, end)
+    end = end or timezone.localdate()
+    start = bucket_start(start or end, granularity)
+    aggregates = aggregates or {'count': Count('pk')}
+
+    field = _resolve_field(queryset.model, date_field)
+    after_end = next_bucket(bucket_start(end, granularity), granularity)
+    rows = queryset.filter(**{
+        f'{date_field}__gte': _boundary(field, start),
+        f'{date_field}__lt': _boundary(field, after_end),
+    }).annotate(
+        period=TRUNC_FUNCTIONS[granularity](date_field, output_field=models.DateField())
+    ).values('period').annotate(**aggregates).order_by('period')
+
+    found = {row['period']: row for row in rows}
+    series = []
+    for period in bucket_range(start, end, granularity):
+        row = found.get(period, {})
+        entry = {'period': period}
+        for name in aggregates:
+            entry[name] = row.get(name) or 0
+        series.append(entry)
+    return series
@@ -1,8 +1,6 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials
 
 # Try to load dotenv
 try:
@@ -46,6 +44,7 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'maes_common.instrumentation.RequestTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -62,7 +61,7 @@ ROOT_URLCONF = 'maes_lab.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'maes_common.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -119,6 +118,54 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Chart rendering (see hospital/charts.py)
+CHART_CACHE_DIR = os.getenv('CHART_CACHE_DIR', str(MEDIA_ROOT / 'charts'))
+CHART_RENDER_WORKERS = int(os.getenv('CHART_RENDER_WORKERS', '2'))
+CHART_RENDER_TIMEOUT = 30  # seconds
+CHART_CACHE_MAX_AGE = 24 * 60 * 60  # seconds a chart no page has shown is kept
+CHART_DATA_MAX_AGE = 60  # seconds browsers may reuse /api/charts/ responses
+DASHBOARD_CHART_MODE = os.getenv('DASHBOARD_CHART_MODE', 'server')  # 'server' or 'client'
+
+# Slot inventory (see maes_common/slots.py)
+# Weekday (Monday is 0) -> (opens, closes); days not listed are closed
+CLINIC_OPERATING_HOURS = {
+    0: ('08:00', '18:00'),
+    1: ('08:00', '18:00'),
+    2: ('08:00', '18:00'),
+    3: ('08:00', '18:00'),
+    4: ('08:00', '18:00'),
+    5: ('08:00', '18:00'),
+}
+SLOT_BOOKING_HORIZON_DAYS = 30  # days ahead that generate_slots pre-creates
+SLOT_CACHE_TIMEOUT = 60  # seconds a day's free slots stay cached for calendar views
+
+# Background exports (see maes_common/export_jobs.py)
+EXPORT_JOB_TTL = 24 * 60 * 60  # seconds a finished export stays downloadable
+EXPORT_JOB_STALE_AFTER = 5 * 60  # seconds without progress before a running job is given to another worker
+EXPORT_WORKER_POLL = 2  # seconds an idle run_export_worker waits before looking for new jobs
+
+# Patient documents (see maes_common/documents.py)
+DOCUMENT_RENDER_WORKERS = int(os.getenv('DOCUMENT_RENDER_WORKERS', '4'))  # processes render_documents draws PDFs with
+
+# Request instrumentation (see maes_common/instrumentation.py)
+PERF_SLOW_QUERIES = 3  # slowest SQL statements reported per request
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # lets a Prometheus scraper read /metrics with "Authorization: Bearer <token>"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'maes_common.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -212,21 +259,5 @@ FIREBASE_CONFIG = {
     'appId': os.getenv('FIREBASE_APP_ID'),
 }
 
-# Initialize Firebase Admin SDK
-if not firebase_admin._apps:
-    try:
-        cred = credentials.Certificate({
-            "type": os.getenv('FIREBASE_TYPE'),
-            "project_id": os.getenv('FIREBASE_PROJECT_ID'),
-            "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-            "private_key": os.getenv('FIREBASE_PRIVATE_KEY', '').replace('\\n', '\n'),
-            "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-            "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-            "auth_uri": os.getenv('FIREBASE_AUTH_URI'),
-            "token_uri": os.getenv('FIREBASE_TOKEN_URI'),
-            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-            "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_CERT_URL')
-        })
-        firebase_admin.initialize_app(cred)
-    except Exception as e:
-        print(f"Firebase initialization error: {e}")
+# The Firebase Admin SDK is initialised on first use by firebase_config.FirebaseConfig,
+# not here, so that workers which never talk to Firebase skip importing it.
@@ -44,6 +44,7 @@ except ImportError:
     CORS_MIDDLEWARE = None
 
 MIDDLEWARE = [
+    'maes_common.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,15 +55,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-# Add CORS middleware if available
+# Add CORS middleware if available, right after the request timing
 if CORS_MIDDLEWARE:
-    MIDDLEWARE.insert(0, CORS_MIDDLEWARE)
+    MIDDLEWARE.insert(1, CORS_MIDDLEWARE)
 
 ROOT_URLCONF = 'modern_maes.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'maes_common.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -119,6 +120,46 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Slot inventory (see maes_common/slots.py)
+# Weekday (Monday is 0) -> (opens, closes); days not listed are closed
+CLINIC_OPERATING_HOURS = {
+    0: ('08:00', '18:00'),
+    1: ('08:00', '18:00'),
+    2: ('08:00', '18:00'),
+    3: ('08:00', '18:00'),
+    4: ('08:00', '18:00'),
+    5: ('08:00', '18:00'),
+}
+SLOT_BOOKING_HORIZON_DAYS = 30  # days ahead that generate_slots pre-creates
+SLOT_CACHE_TIMEOUT = 60  # seconds a day's free slots stay cached for calendar views
+
+# Background exports (see maes_common/export_jobs.py)
+EXPORT_JOB_TTL = 24 * 60 * 60  # seconds a finished export stays downloadable
+EXPORT_JOB_STALE_AFTER = 5 * 60  # seconds without progress before a running job is given to another worker
+EXPORT_WORKER_POLL = 2  # seconds an idle run_export_worker waits before looking for new jobs
+
+# Patient documents (see maes_common/documents.py)
+DOCUMENT_RENDER_WORKERS = int(os.getenv('DOCUMENT_RENDER_WORKERS', '4'))  # processes render_documents draws PDFs with
+
+# Request instrumentation (see maes_common/instrumentation.py)
+PERF_SLOW_QUERIES = 3  # slowest SQL statements reported per request
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # lets a Prometheus scraper read /metrics with "Authorization: Bearer <token>"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'maes_common.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -146,6 +187,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Cursor pages in each viewset's ``ordering``; ?limit= sets the page size
+    'DEFAULT_PAGINATION_CLASS': 'hospital_app.pagination.ApiCursorPagination',
 }
 
 # Login/Logout URLs
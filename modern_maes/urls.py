@@ -12,8 +12,10 @@ admin.site.site_title = "MAES Lab Admin"
 admin.site.index_title = "Welcome to MAES Laboratory Management"
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # Before the admin site, which would otherwise answer admin/dashboard/ with a 404
     path('', include('hospital_app.urls')),
+    path('admin/', admin.site.urls),
+    path('api/', include('hospital_app.api_urls')),
 ]
 
 # Serve media files in development